@@ -122,6 +122,28 @@ DATABASES = {
     }
 }
 
+# ---------------------------------------------------------------------
+# Cache configuration
+# ---------------------------------------------------------------------
+# With several gunicorn workers set REDIS_URL, so cache invalidation
+# (e.g. of the order-log feed) is shared between processes.
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'itflow-default',
+        }
+    }
+
 # ---------------------------------------------------------------------
 # Password validation
 # ---------------------------------------------------------------------
@@ -240,6 +262,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'files': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'django.request': {
             'handlers': ['errors'],
             'level': 'ERROR',
@@ -0,0 +1,87 @@
+"""
+benchmarks/r2_client_bench.py
+
+Micro-benchmark: repeated small uploads with a new boto3 session/client
+per call (the old get_r2_client()) versus the shared, pooled client from
+files/storage.py.
+
+By default it runs against moto in-process. Pass --endpoint-url to use a
+local S3 stand-in over real HTTP (e.g. `moto_server -p 5000` or MinIO),
+which also measures connection reuse.
+
+Usage (from Backend/):
+    python benchmarks/r2_client_bench.py --uploads 200 --size 4096
+    python benchmarks/r2_client_bench.py --endpoint-url http://127.0.0.1:5000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import boto3  # noqa: E402
+
+from files import storage  # noqa: E402
+
+BUCKET = 'bench-bucket'
+
+
+def per_call_client():
+    """Old behaviour: new session and client on every call."""
+    session = boto3.session.Session()
+    return session.client('s3', endpoint_url=storage.CLOUDFLARE_R2_ENDPOINT)
+
+
+def run(label, get_client, uploads, payload):
+    timings = []
+    for i in range(uploads):
+        started = time.perf_counter()
+        get_client().put_object(Bucket=BUCKET, Key=f"bench/{label}/{i}", Body=payload)
+        timings.append(time.perf_counter() - started)
+
+    total = sum(timings)
+    print(
+        f"{label:<16} total {total * 1000:8.1f} ms | "
+        f"mean {statistics.mean(timings) * 1000:6.2f} ms | "
+        f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1] * 1000:6.2f} ms | "
+        f"{uploads / total:7.1f} uploads/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uploads', type=int, default=200)
+    parser.add_argument('--size', type=int, default=4096, help="payload size in bytes")
+    parser.add_argument('--endpoint-url', help="S3-compatible endpoint (moto_server, MinIO)")
+    args = parser.parse_args()
+
+    storage.CLOUDFLARE_R2_ENDPOINT = args.endpoint_url
+    storage.CLOUDFLARE_R2_BUCKET = BUCKET
+    storage.reset_r2_client()
+
+    mock = None
+    if not args.endpoint_url:
+        from moto import mock_aws
+        mock = mock_aws()
+        mock.start()
+
+    try:
+        storage.get_r2_client().create_bucket(Bucket=BUCKET)
+        payload = os.urandom(args.size)
+        print(f"{args.uploads} uploads of {args.size} B against {args.endpoint_url or 'moto (in-process)'}")
+        run('per-call client', per_call_client, args.uploads, payload)
+        run('shared client', storage.get_r2_client, args.uploads, payload)
+    finally:
+        if mock:
+            mock.stop()
+
+
+if __name__ == '__main__':
+    main()
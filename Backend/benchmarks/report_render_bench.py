@@ -0,0 +1,93 @@
+"""
+benchmarks/report_render_bench.py
+
+Benchmark: rendering the final order report (files/report_pdf.py) for
+synthetic orders with 10, 1 000 and 50 000 history rows.
+
+The renderer works on plain snapshots, so no database is needed.
+Prints render time, PDF size and peak Python memory (tracemalloc) for
+each history size.
+
+Usage (from Backend/):
+    python benchmarks/report_render_bench.py
+    python benchmarks/report_render_bench.py --rows 10 1000 50000 --repeat 3
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from files.report_pdf import render_report  # noqa: E402
+
+EVENTS = [
+    ('Komentarz/Notatka', "Klient poprosił o zmianę koloru przycisków na stronie głównej", None, None),
+    ('Zmiana Statusu', 'Status zmieniony z "W realizacji" na "Proszę sprawdzić"',
+     ('W realizacji', 'Proszę sprawdzić'), None),
+    ('Dodanie Pliku', "Dodano plik: makieta_v3", None, 'makieta_v3.pdf'),
+]
+
+
+def snapshot(rows):
+    started = datetime(2025, 1, 1, 9, 0)
+    history = []
+    for i in range(rows):
+        event_display, description, status_change, file_label = EVENTS[i % len(EVENTS)]
+        history.append({
+            'timestamp': (started + timedelta(minutes=7 * i)).strftime('%Y-%m-%d %H:%M'),
+            'actor_name': f"Użytkownik {i % 12}",
+            'event_display': event_display,
+            'description': description,
+            'status_change': status_change,
+            'file_label': file_label,
+        })
+
+    return {
+        'order_id': 1000 + rows,
+        'title': 'Sklep internetowy z integracją płatności',
+        'description': "Projekt sklepu.\nIntegracja z bramką płatności i systemem magazynowym.",
+        'client_name': 'Jan Kowalski',
+        'manager_name': 'Anna Nowak',
+        'status_display': 'Zakończone',
+        'created_at': '2025-01-01 09:00',
+        'finished_at': '2025-06-30 17:00',
+        'history': history,
+    }
+
+
+def run(rows, repeat):
+    report = snapshot(rows)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        pdf_content = render_report(report)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    render_report(report)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(
+        f"{rows:>7} rows | render {statistics.mean(timings) * 1000:9.1f} ms | "
+        f"{len(pdf_content) / 1024:8.0f} KB | peak {peak / 1024 / 1024:7.1f} MiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 1000, 50000])
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        run(rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+benchmarks/zip_prefetch_bench.py
+
+Benchmark: building an order ZIP from R2 objects fetched sequentially
+(r2_entries) versus with bounded parallel prefetching
+(prefetched_r2_entries) from files/archives.py.
+
+Runs against moto in-process; every GetObject call is delayed by
+--latency-ms (botocore before-send hook) to simulate the round trip to R2.
+The archive is discarded, only throughput and time to first byte are measured.
+
+Usage (from Backend/):
+    python benchmarks/zip_prefetch_bench.py --files 40 --size 262144 --latency-ms 50
+    python benchmarks/zip_prefetch_bench.py --workers 16 --buffer-mb 32
+"""
+
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from moto import mock_aws  # noqa: E402
+
+from files import storage  # noqa: E402
+from files.archives import prefetched_r2_entries, r2_entries, stream_zip  # noqa: E402
+
+BUCKET = 'bench-bucket'
+PUBLIC_URL = 'https://cdn.example.com'
+
+
+def run(label, entries):
+    started = time.perf_counter()
+    first_byte = None
+    total = 0
+    for data in stream_zip(entries):
+        if data and first_byte is None:
+            first_byte = time.perf_counter() - started
+        total += len(data)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{label:<12} total {elapsed * 1000:8.1f} ms | "
+        f"first byte {first_byte * 1000:7.1f} ms | "
+        f"{total / elapsed / 1024 / 1024:7.1f} MiB/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=40)
+    parser.add_argument('--size', type=int, default=256 * 1024, help="object size in bytes")
+    parser.add_argument('--latency-ms', type=float, default=50, help="delay added to every GetObject")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--buffer-mb', type=int, default=64)
+    args = parser.parse_args()
+
+    storage.CLOUDFLARE_R2_ENDPOINT = None
+    storage.CLOUDFLARE_R2_BUCKET = BUCKET
+    storage.CLOUDFLARE_PUBLIC_URL = PUBLIC_URL
+    storage.reset_r2_client()
+
+    with mock_aws():
+        s3 = storage.get_r2_client()
+        s3.create_bucket(Bucket=BUCKET)
+
+        files = []
+        for i in range(args.files):
+            key = f"uploads/bench{i}.bin"
+            s3.put_object(Bucket=BUCKET, Key=key, Body=os.urandom(args.size))
+            # Bez ETag - obiekty zawsze z R2, z pominięciem lokalnego cache
+            files.append(SimpleNamespace(name=f"bench{i}", file_type='bin', uploaded_file_url=f"{PUBLIC_URL}/{key}",
+                                         size=args.size, etag=''))
+
+        def delay(**kwargs):
+            time.sleep(args.latency_ms / 1000)
+
+        # Przed handlerem moto - symulowany czas odpowiedzi R2
+        s3.meta.events.register_first('before-send.s3.GetObject', delay)
+
+        print(
+            f"{args.files} objects of {args.size} B, {args.latency_ms:g} ms latency, "
+            f"{args.workers} workers, {args.buffer_mb} MiB buffer"
+        )
+        run('sequential', r2_entries(files, s3=s3))
+        run('prefetch', prefetched_r2_entries(
+            files, s3=s3, max_workers=args.workers, max_buffer_bytes=args.buffer_mb * 1024 * 1024,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from files.models import File
+from files.models import File, ZipExportJob
 
 @admin.register(File)
 class FileAdmin(admin.ModelAdmin):
@@ -37,3 +37,12 @@ class FileAdmin(admin.ModelAdmin):
             return format_html('<a href="{}" target="_blank">Otwórz plik</a>', obj.uploaded_file_url)
         return "-"
     file_link.short_description = "Plik (URL)"
+
+
+@admin.register(ZipExportJob)
+class ZipExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'order', 'requested_by', 'status', 'files_done', 'files_total', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('order__id', 'archive_key')
+    readonly_fields = ('file_ids', 'archive_key', 'files_total', 'files_done', 'bytes_written', 'error',
+                       'created_at', 'updated_at', 'finished_at')
@@ -0,0 +1,248 @@
+"""
+files/archives.py
+
+Streaming ZIP archives for order file downloads.
+Entries are written chunk by chunk into a write-only buffer and the
+produced bytes are yielded immediately, so memory use does not depend on
+the total size of the archive. ZIP64 is used for large entries and
+archives; already-compressed formats are stored without recompression.
+
+R2 objects are prefetched by a small thread pool while the current entry
+is being written. Buffered data is limited by a byte budget and entries
+are always emitted in the requested order. Objects in the local disk
+cache (files/object_cache.py) are read from disk and take no budget.
+"""
+
+import logging
+import os
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .storage import CHUNK_SIZE, get_r2_client, key_from_url
+from . import object_cache, storage
+
+
+logger = logging.getLogger(__name__)
+
+# Równoległe pobieranie z R2: liczba wątków i limit buforowanych bajtów
+PREFETCH_WORKERS = int(os.getenv("R2_ZIP_PREFETCH_WORKERS", 8))
+PREFETCH_BUFFER_BYTES = int(os.getenv("R2_ZIP_PREFETCH_BUFFER_MB", 64)) * 1024 * 1024
+
+# Formaty już skompresowane - ponowna kompresja tylko zużywa CPU
+STORED_EXTENSIONS = {
+    'zip', 'pdf', 'docx', 'xlsx', 'pptx', 'odt', 'ods',
+    'gz', 'tgz', 'bz2', 'xz', '7z', 'rar',
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'mp3', 'mp4', 'mov',
+}
+
+
+class _StreamBuffer:
+    """Write-only, non-seekable sink for ZipFile; written bytes are taken with pop()."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def archive_filename(file_obj):
+    return f"{file_obj.name}.{file_obj.file_type}" if file_obj.file_type else file_obj.name
+
+
+def compression_for(filename):
+    extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    return zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def stream_zip(entries):
+    """
+    Yields a ZIP archive built from `entries`.
+
+    Args:
+        entries: iterable of (filename, size or None, iterable of bytes chunks)
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for filename, size, chunks in entries:
+            info = zipfile.ZipInfo(filename, date_time=time.localtime()[:6])
+            info.compress_type = compression_for(filename)
+            # Znany rozmiar pozwala ZipFile zdecydować o ZIP64 dla danego wpisu
+            if size is not None:
+                info.file_size = size
+
+            with archive.open(info, 'w', force_zip64=size is None) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def r2_entries(files, s3=None):
+    """
+    ZIP entries for File objects, fetched from R2 one after another.
+    Files that cannot be fetched are skipped (logged), as before.
+    """
+    s3 = s3 or get_r2_client()
+    for file_obj in files:
+        try:
+            r2_object = s3.get_object(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=key_from_url(file_obj.uploaded_file_url))
+        except Exception as e:
+            logger.warning("Błąd pobierania pliku %s z R2: %s", file_obj.name, e)
+            continue
+
+        yield archive_filename(file_obj), r2_object.get('ContentLength'), r2_object['Body'].iter_chunks(CHUNK_SIZE)
+
+
+class PrefetchCancelled(Exception):
+    pass
+
+
+class _ByteBudget:
+    """
+    Limits the bytes held by prefetched objects.
+
+    Reservations are granted strictly in ticket (= archive) order, so a
+    later object can never take the budget an earlier one is waiting for;
+    the consumer releases entries in the same order, which rules out deadlocks.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._next_ticket = 0
+        self._cancelled = False
+        self._condition = threading.Condition()
+
+    def _wait(self, predicate):
+        self._condition.wait_for(lambda: self._cancelled or predicate())
+        if self._cancelled:
+            raise PrefetchCancelled()
+
+    def acquire(self, ticket, size):
+        with self._condition:
+            self._wait(lambda: self._next_ticket == ticket and self.used + size <= self.limit)
+            self.used += size
+            self.peak = max(self.peak, self.used)
+            self._next_ticket += 1
+            self._condition.notify_all()
+
+    def skip(self, ticket):
+        with self._condition:
+            self._wait(lambda: self._next_ticket == ticket)
+            self._next_ticket += 1
+            self._condition.notify_all()
+
+    def release(self, size):
+        if not size:
+            return
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+    def cancel(self):
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+
+def _fetch(s3, file_obj, ticket, budget):
+    """
+    Fetches one object. Objects that fit in the budget are read into memory;
+    larger ones are returned as a stream for the consumer to read.
+
+    Returns:
+        tuple: (size, chunks, reserved_bytes)
+    """
+    if object_cache.cacheable(file_obj):
+        # Kopia na lokalnym dysku - nie zajmuje budżetu pamięci
+        try:
+            local_file, _ = object_cache.open_object(file_obj, s3)
+        finally:
+            budget.skip(ticket)
+        return file_obj.size, object_cache.iter_file(local_file), 0
+
+    try:
+        r2_object = s3.get_object(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=key_from_url(file_obj.uploaded_file_url))
+    except Exception:
+        budget.skip(ticket)
+        raise
+
+    size = r2_object.get('ContentLength')
+    if size is None or size > budget.limit:
+        budget.skip(ticket)
+        return size, r2_object['Body'].iter_chunks(CHUNK_SIZE), 0
+
+    budget.acquire(ticket, size)
+    try:
+        data = r2_object['Body'].read()
+    except Exception:
+        budget.release(size)
+        raise
+    return size, [data], size
+
+
+def prefetched_r2_entries(files, s3=None, max_workers=PREFETCH_WORKERS, max_buffer_bytes=PREFETCH_BUFFER_BYTES):
+    """
+    Same entries as r2_entries(), but the next objects are downloaded in
+    parallel while the current one is written to the archive.
+
+    Args:
+        files: File objects in archive order
+        max_workers (int): concurrent R2 requests
+        max_buffer_bytes (int): maximum bytes of prefetched, not yet written data
+    """
+    s3 = s3 or get_r2_client()
+    budget = _ByteBudget(max_buffer_bytes)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='zip-prefetch')
+    pending = enumerate(files)
+    in_flight = deque()
+
+    def submit_next():
+        for ticket, file_obj in pending:
+            in_flight.append((file_obj, executor.submit(_fetch, s3, file_obj, ticket, budget)))
+            return
+
+    try:
+        # Okno zleceń: wątki robocze + zapas, żeby pula nie czekała na konsumenta
+        for _ in range(max_workers * 2):
+            submit_next()
+
+        while in_flight:
+            file_obj, future = in_flight.popleft()
+            submit_next()
+            try:
+                size, chunks, reserved = future.result()
+            except Exception as e:
+                logger.warning("Błąd pobierania pliku %s z R2: %s", file_obj.name, e)
+                continue
+
+            try:
+                yield archive_filename(file_obj), size, chunks
+            finally:
+                budget.release(reserved)
+    finally:
+        # Klient mógł przerwać pobieranie - zwalniamy czekające wątki
+        budget.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,62 @@
+"""
+files/background.py
+
+Fire-and-forget work that should not block the request (cache uploads,
+report pre-rendering). Runs in a daemon thread of the current process,
+or on a bounded thread pool (WorkerPool) when the work must be throttled.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+
+def _run(target, args):
+    try:
+        target(*args)
+    finally:
+        # Wątek otwiera własne połączenia z bazą - nie mogą zostać otwarte
+        connections.close_all()
+
+
+def run_in_background(target, *args):
+    threading.Thread(target=_run, args=(target, args), daemon=True).start()
+
+
+def submit(executor, target, *args):
+    """Like run_in_background, but queued on `executor` (bounded concurrency)."""
+    return executor.submit(_run, target, args)
+
+
+class WorkerPool:
+    """
+    Per-process bounded thread pool for background work (async uploads,
+    ZIP exports). Created on first use; after a fork the child process
+    builds its own pool instead of reusing the parent's threads.
+    """
+
+    def __init__(self, max_workers, name):
+        self.max_workers = max_workers
+        self.name = name
+        self.reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get_executor(self):
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+                    self._pid = pid
+        return self._executor
+
+    def submit(self, target, *args):
+        return submit(self.get_executor(), target, *args)
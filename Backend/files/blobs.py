@@ -0,0 +1,190 @@
+"""
+files/blobs.py
+
+Content-addressed deduplication of uploaded files.
+
+Uploads through Django are hashed (SHA-256) while the request body is
+being received, by the upload handlers below, so no second pass over the
+file is needed; the first bytes are kept for content type sniffing. If
+a File with the same digest already points to an object in R2, the new
+File reuses that object and the PUT is skipped.
+
+Objects are reference-counted by the File rows pointing to them: when a
+File is deleted, its object is removed from R2 after commit, only if no
+other File still references it. Bulk deletes collect the URLs
+(batched_release) and remove the unreferenced objects with batched
+delete_objects calls. A reused object cannot be released in between:
+find_blob_url locks the referencing row (SELECT ... FOR UPDATE) until the
+new File is committed, so a concurrent delete of that row waits and the
+release that follows sees the new reference.
+"""
+
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+
+from .metadata import SNIFF_BYTES, sniff_content_type
+from .models import File
+from .storage import get_r2_client, key_from_url
+from . import storage
+
+
+logger = logging.getLogger(__name__)
+
+# Limit kluczy w jednym wywołaniu DeleteObjects (S3/R2)
+DELETE_BATCH_SIZE = 1000
+
+_deferred = threading.local()
+
+
+class _HashingMixin:
+    """Computes the SHA-256 and sniffs the content type while chunks are received."""
+
+    def new_file(self, *args, **kwargs):
+        # Przed super(): aktywny handler pamięciowy kończy new_file wyjątkiem StopFutureHandlers
+        self.digest = hashlib.sha256()
+        self.head = b''
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # Handler pamięciowy nieaktywny (duży plik) - liczy następny w łańcuchu
+        if getattr(self, 'activated', True):
+            self.digest.update(raw_data)
+            if len(self.head) < SNIFF_BYTES:
+                self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.sha256 = self.digest.hexdigest()
+            uploaded_file.sniffed_content_type = sniff_content_type(self.head, self.file_name)
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(_HashingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(_HashingMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def hashing_upload_handlers(request):
+    """Replacement for the default FILE_UPLOAD_HANDLERS (same order)."""
+    return [HashingMemoryFileUploadHandler(request), HashingTemporaryFileUploadHandler(request)]
+
+
+def find_blob_url(sha256):
+    """
+    URL of an R2 object with this content, if any File already has one.
+
+    Must be called in the transaction that creates the File reusing the
+    URL: the referencing row stays locked until that File is committed.
+    """
+    if not sha256:
+        return None
+    return (
+        File.objects
+        .select_for_update()
+        # Obiekt uploadu w toku może jeszcze nie istnieć w R2
+        .filter(sha256=sha256, status=File.STATUS_READY)
+        .exclude(uploaded_file_url__isnull=True)
+        .exclude(uploaded_file_url='')
+        .values_list('uploaded_file_url', flat=True)
+        .first()
+    )
+
+
+def is_managed_url(url):
+    """True for objects uploaded by this app (uploads/ prefix in our bucket)."""
+    public_url = f"{storage.CLOUDFLARE_PUBLIC_URL.rstrip('/')}/" if storage.CLOUDFLARE_PUBLIC_URL else None
+    return bool(url and public_url and url.startswith(public_url + storage.UPLOAD_PREFIX))
+
+
+def release_blob(url, s3=None):
+    """
+    Deletes the R2 object behind `url` unless another File still references it.
+
+    Returns:
+        bool: True if the object was deleted
+    """
+    if not is_managed_url(url) or File.objects.filter(uploaded_file_url=url).exists():
+        return False
+
+    s3 = s3 or get_r2_client()
+    try:
+        s3.delete_object(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=key_from_url(url))
+    except Exception as e:
+        logger.warning("Nie udało się usunąć obiektu %s z R2: %s", url, e)
+        return False
+    return True
+
+
+def delete_keys(keys, s3=None):
+    """
+    Deletes R2 objects with DeleteObjects, DELETE_BATCH_SIZE keys per call.
+
+    Returns:
+        list: the keys that were deleted (errors are logged)
+    """
+    s3 = s3 or get_r2_client()
+    keys = list(keys)
+    deleted = []
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        try:
+            result = s3.delete_objects(
+                Bucket=storage.CLOUDFLARE_R2_BUCKET,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+            )
+        except Exception as e:
+            logger.warning("Nie udało się usunąć %s obiektów z R2: %s", len(batch), e)
+            continue
+        failed = set()
+        for error in result.get('Errors', []):
+            logger.warning("Nie udało się usunąć obiektu %s z R2: %s", error.get('Key'), error.get('Message'))
+            failed.add(error.get('Key'))
+        deleted.extend(key for key in batch if key not in failed)
+    return deleted
+
+
+def release_blobs(urls, s3=None):
+    """
+    Batched release_blob(): deletes the objects behind `urls` that no File references.
+
+    Returns:
+        int: number of objects deleted
+    """
+    urls = {url for url in urls if is_managed_url(url)}
+    if not urls:
+        return 0
+    referenced = set(File.objects.filter(uploaded_file_url__in=urls).values_list('uploaded_file_url', flat=True))
+    return len(delete_keys(sorted(key_from_url(url) for url in urls - referenced), s3=s3))
+
+
+@contextmanager
+def batched_release():
+    """
+    Collects the URLs of Files deleted inside the block instead of
+    releasing each one separately; pass them to release_blobs() after commit.
+    """
+    urls = set()
+    _deferred.urls = urls
+    try:
+        yield urls
+    finally:
+        _deferred.urls = None
+
+
+def schedule_release(url):
+    """Releases the object of a deleted File after commit (or defers it to batched_release)."""
+    urls = getattr(_deferred, 'urls', None)
+    if urls is not None:
+        urls.add(url)
+    else:
+        transaction.on_commit(lambda: release_blob(url))
@@ -0,0 +1,177 @@
+"""
+files/downloads.py
+
+Single-file downloads streamed from R2.
+
+The client's Range header (one byte range) is forwarded to get_object,
+so resumed and seeking downloads fetch only the requested part of the
+object and are answered with 206 Partial Content. If-Range is honoured
+against the object's ETag: a stale validator downloads the whole file.
+Full downloads of small objects go through the local disk cache
+(files/object_cache.py) and are sent from the file.
+
+Alternatively (R2_DOWNLOAD_REDIRECT or ?redirect=true) the client is
+redirected to a short-lived presigned GET URL and downloads straight
+from R2, so no worker is held for the transfer. Signed URLs are memoized
+per TTL window: repeated clicks get the same URL without signing again.
+"""
+
+import os
+import re
+import time
+from functools import lru_cache
+
+from botocore.exceptions import ClientError
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .archives import archive_filename
+from .storage import CHUNK_SIZE, get_r2_client, key_from_url
+from . import object_cache, storage
+
+
+# Jeden zakres bajtów: "bytes=0-499", "bytes=500-", "bytes=-500"
+SINGLE_RANGE = re.compile(r'^bytes=(\d+-\d*|-\d+)$')
+
+# Przekierowanie na podpisany URL R2 zamiast przesyłania bajtów przez Django
+DOWNLOAD_REDIRECT = os.getenv("R2_DOWNLOAD_REDIRECT", "false").lower() in ('1', 'true', 'yes')
+# Okno ważności podpisanych URL-i do pobierania (sekundy)
+PRESIGNED_DOWNLOAD_TTL = int(os.getenv("R2_PRESIGNED_DOWNLOAD_TTL", 5 * 60))
+
+
+class ObjectNotFound(Exception):
+    pass
+
+
+def requested_range(request, etag=''):
+    """
+    The Range header to forward to R2, or None for a full download.
+
+    Multiple ranges and malformed headers are ignored (full response), as
+    RFC 9110 allows; so is a Range with an If-Range that no longer matches.
+    """
+    range_header = request.headers.get('Range', '').replace(' ', '')
+    if not SINGLE_RANGE.match(range_header):
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range is not None and (not etag or if_range.strip() != f'"{etag}"'):
+        return None
+    return range_header
+
+
+def _stream_body(body):
+    # Zamknięcie generatora (koniec lub przerwanie pobierania) zwalnia połączenie z R2
+    try:
+        yield from body.iter_chunks(CHUNK_SIZE)
+    finally:
+        body.close()
+
+
+def _raise_if_missing(error, file_obj):
+    if error.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+        raise ObjectNotFound(file_obj.uploaded_file_url) from error
+
+
+def _file_headers(response, file_obj):
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(True, archive_filename(file_obj))
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _cached_file_response(file_obj, s3):
+    try:
+        local_file, hit = object_cache.open_object(file_obj, s3)
+    except ClientError as e:
+        _raise_if_missing(e, file_obj)
+        raise
+
+    response = FileResponse(local_file, content_type=file_obj.content_type or 'application/octet-stream')
+    response['ETag'] = f'"{file_obj.etag}"'
+    response['X-Object-Cache'] = 'hit' if hit else 'miss'
+    return _file_headers(response, file_obj)
+
+
+def stream_file(request, file_obj, s3=None):
+    """
+    200 / 206 / 416 response streaming the R2 object of `file_obj`.
+
+    Raises:
+        ObjectNotFound: the object is missing in R2
+        ClientError: any other R2 error
+    """
+    s3 = s3 or get_r2_client()
+    range_header = requested_range(request, file_obj.etag)
+    if range_header is None and object_cache.cacheable(file_obj):
+        return _cached_file_response(file_obj, s3)
+
+    params = {'Bucket': storage.CLOUDFLARE_R2_BUCKET, 'Key': key_from_url(file_obj.uploaded_file_url)}
+    if range_header:
+        params['Range'] = range_header
+
+    try:
+        r2_object = s3.get_object(**params)
+    except ClientError as e:
+        _raise_if_missing(e, file_obj)
+        if e.response.get('Error', {}).get('Code') != 'InvalidRange':
+            raise
+        response = HttpResponse(status=416)
+        if file_obj.size is not None:
+            response['Content-Range'] = f'bytes */{file_obj.size}'
+        return response
+
+    content_range = r2_object.get('ContentRange')
+    response = StreamingHttpResponse(
+        _stream_body(r2_object['Body']),
+        status=206 if content_range else 200,
+        content_type=file_obj.content_type or r2_object.get('ContentType') or 'application/octet-stream',
+    )
+    if content_range:
+        response['Content-Range'] = content_range
+    if r2_object.get('ContentLength') is not None:
+        response['Content-Length'] = r2_object['ContentLength']
+    if r2_object.get('ETag'):
+        response['ETag'] = r2_object['ETag']
+    return _file_headers(response, file_obj)
+
+
+def wants_redirect(request):
+    """?redirect=true/false overrides the R2_DOWNLOAD_REDIRECT default."""
+    value = request.query_params.get('redirect')
+    if value is None:
+        return DOWNLOAD_REDIRECT
+    return value.lower() in ('1', 'true', 'yes')
+
+
+@lru_cache(maxsize=4096)
+def _signed_url(bucket, key, disposition, content_type, window):
+    # Podpis ważny przez dwa okna - URL wydany pod koniec okna działa jeszcze pełne TTL
+    params = {'Bucket': bucket, 'Key': key, 'ResponseContentDisposition': disposition}
+    if content_type:
+        params['ResponseContentType'] = content_type
+    return get_r2_client().generate_presigned_url('get_object', Params=params, ExpiresIn=2 * PRESIGNED_DOWNLOAD_TTL)
+
+
+def presigned_download_url(key, filename, content_type=''):
+    """
+    Presigned GET URL of an R2 object, downloaded as `filename`.
+
+    The same object, name and type within one TTL window map to the same
+    (memoized) URL; the URL stays valid for at least PRESIGNED_DOWNLOAD_TTL.
+    """
+    window = int(time.time() // PRESIGNED_DOWNLOAD_TTL)
+    return _signed_url(storage.CLOUDFLARE_R2_BUCKET, key, content_disposition_header(True, filename),
+                       content_type, window)
+
+
+def redirect_to_object(key, filename, content_type=''):
+    """302 to a presigned URL of the object."""
+    response = HttpResponseRedirect(presigned_download_url(key, filename, content_type))
+    # URL wygasa - przeglądarka nie może zapamiętać przekierowania
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+def redirect_to_file(file_obj):
+    return redirect_to_object(key_from_url(file_obj.uploaded_file_url), archive_filename(file_obj),
+                              file_obj.content_type)
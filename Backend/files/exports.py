@@ -0,0 +1,218 @@
+"""
+files/exports.py
+
+Background ZIP exports for orders too large to download within a proxy
+timeout.
+
+A job is built by a bounded worker pool: the archive is produced by the
+same streaming writer as the download endpoint (stream_zip over
+prefetched R2 entries) and uploaded part by part with S3 multipart
+upload, so neither memory nor local disk depend on the archive size.
+The archive is stored under its ZIP cache key (files/zip_cache.py): the
+regular download endpoint serves it too, and it is invalidated with the
+order's other cached archives. Progress (files, bytes) is written to the
+job row at most once per EXPORT_PROGRESS_INTERVAL; a finished job hands
+out a presigned URL. As with the cache of the download endpoint, only
+complete archives are stored: if a file could not be fetched from R2,
+the multipart upload is aborted and the job fails. A request for the same file selection while a job
+is pending or running returns that job instead of starting another one,
+unless the job made no progress for EXPORT_STALE_MINUTES.
+"""
+
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .archives import prefetched_r2_entries, stream_zip
+from .background import WorkerPool
+from .downloads import presigned_download_url
+from .models import File, ZipExportJob
+from .storage import MULTIPART_MIN_PART_SIZE, get_r2_client
+from .zip_cache import archive_cache_key, is_cached_archive, remember_archive
+from . import storage
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_WORKERS = int(os.getenv("ZIP_EXPORT_WORKERS", 2))
+EXPORT_PART_SIZE = max(MULTIPART_MIN_PART_SIZE, int(os.getenv("ZIP_EXPORT_PART_MB", 16)) * 1024 * 1024)
+# Co ile sekund (najczęściej) zapisywać postęp w bazie
+EXPORT_PROGRESS_INTERVAL = 1.0
+# Zadanie bez postępu dłużej niż tyle minut uznajemy za porzucone (np. restart workera)
+EXPORT_STALE_MINUTES = int(os.getenv("ZIP_EXPORT_STALE_MINUTES", 30))
+
+_pool = WorkerPool(EXPORT_WORKERS, 'zip-export')
+
+
+def export_filename(order_id):
+    return f"order_{order_id}_files.zip"
+
+
+def is_expired(job):
+    """True if a finished export's archive was dropped from the ZIP cache (e.g. a file changed)."""
+    return job.status == ZipExportJob.STATUS_DONE and not is_cached_archive(job.archive_key)
+
+
+def download_url(job):
+    """Presigned URL of a finished export whose archive is still cached, None otherwise."""
+    if job.status != ZipExportJob.STATUS_DONE or is_expired(job):
+        return None
+    return presigned_download_url(job.archive_key, export_filename(job.order_id), 'application/zip')
+
+
+def create_export_job(user, order_id, files):
+    """
+    Starts an export of `files`, or returns the job already covering them.
+
+    Returns:
+        tuple: (ZipExportJob, True if a new job was created)
+    """
+    archive_key = archive_cache_key(order_id, files)
+
+    # Porzucone zadania nie blokują nowego eksportu tych samych plików
+    ZipExportJob.objects.filter(
+        archive_key=archive_key,
+        status__in=ZipExportJob.ACTIVE_STATUSES,
+        updated_at__lt=timezone.now() - timedelta(minutes=EXPORT_STALE_MINUTES),
+    ).update(status=ZipExportJob.STATUS_FAILED, error='Przerwane (brak postępu).', finished_at=timezone.now(),
+             updated_at=timezone.now())
+
+    existing = ZipExportJob.objects.filter(archive_key=archive_key, status__in=ZipExportJob.ACTIVE_STATUSES).first()
+    if existing is not None:
+        return existing, False
+    # Gotowe archiwum tego samego zestawu wciąż jest w cache
+    finished = ZipExportJob.objects.filter(archive_key=archive_key, status=ZipExportJob.STATUS_DONE).first()
+    if finished is not None and is_cached_archive(archive_key):
+        return finished, False
+
+    try:
+        with transaction.atomic():
+            job = ZipExportJob.objects.create(
+                order_id=order_id,
+                requested_by=user,
+                file_ids=sorted(f.pk for f in files),
+                archive_key=archive_key,
+                files_total=len(files),
+            )
+    except IntegrityError:
+        # Równoległe żądanie utworzyło ten sam eksport
+        return ZipExportJob.objects.get(archive_key=archive_key, status__in=ZipExportJob.ACTIVE_STATUSES), False
+
+    transaction.on_commit(lambda: enqueue_export(job.pk))
+    return job, True
+
+
+def enqueue_export(job_id):
+    return _pool.submit(build_export, job_id)
+
+
+class _Progress:
+    """Throttled progress updates of the job row."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.files_done = 0
+        self.bytes_written = 0
+        self._saved_at = 0.0
+
+    def save(self, force=False):
+        now = time.monotonic()
+        if force or now - self._saved_at >= EXPORT_PROGRESS_INTERVAL:
+            ZipExportJob.objects.filter(pk=self.job_id).update(
+                files_done=self.files_done, bytes_written=self.bytes_written, updated_at=timezone.now()
+            )
+            self._saved_at = now
+
+
+class IncompleteExport(Exception):
+    """Some of the job's files could not be added to the archive."""
+
+
+def _upload_parts(s3, key, upload_id, chunks, progress):
+    """Uploads `chunks` as parts of at least EXPORT_PART_SIZE bytes; returns the part list."""
+    parts = []
+    buffer = bytearray()
+
+    def upload(data):
+        number = len(parts) + 1
+        result = s3.upload_part(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=key, UploadId=upload_id,
+                                PartNumber=number, Body=bytes(data))
+        parts.append({'PartNumber': number, 'ETag': result['ETag']})
+
+    for data in chunks:
+        buffer += data
+        progress.bytes_written += len(data)
+        if len(buffer) >= EXPORT_PART_SIZE:
+            upload(buffer)
+            buffer.clear()
+            progress.save()
+    # Ostatnia część może być mniejsza (lub jedyna)
+    if buffer or not parts:
+        upload(buffer)
+    return parts
+
+
+def build_export(job_id, s3=None):
+    """
+    Builds the archive of a pending job into R2.
+
+    Returns:
+        bool: True if the job finished; False if it failed or was not pending
+    """
+    claimed = ZipExportJob.objects.filter(pk=job_id, status=ZipExportJob.STATUS_PENDING).update(
+        status=ZipExportJob.STATUS_RUNNING, updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    job = ZipExportJob.objects.get(pk=job_id)
+    files = list(File.objects.filter(pk__in=job.file_ids, status=File.STATUS_READY).order_by('pk'))
+    progress = _Progress(job_id)
+    s3 = s3 or get_r2_client()
+
+    def entries():
+        for entry in prefetched_r2_entries(files, s3=s3):
+            yield entry
+            # Wpis zapisany w archiwum
+            progress.files_done += 1
+            progress.save()
+
+    upload_id = None
+    try:
+        upload_id = s3.create_multipart_upload(
+            Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=job.archive_key, ContentType='application/zip'
+        )['UploadId']
+        parts = _upload_parts(s3, job.archive_key, upload_id, stream_zip(entries()), progress)
+        # Niepełne archiwum nie może trafić pod klucz cache (ten sam warunek co tee_to_cache)
+        if progress.files_done != job.files_total:
+            raise IncompleteExport(
+                f"Nie udało się pobrać z R2 {job.files_total - progress.files_done} z {job.files_total} plików."
+            )
+        s3.complete_multipart_upload(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=job.archive_key, UploadId=upload_id,
+                                     MultipartUpload={'Parts': parts})
+    except Exception as e:
+        logger.warning("Eksport ZIP #%s nie powiódł się: %s", job_id, e)
+        if upload_id is not None:
+            try:
+                s3.abort_multipart_upload(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=job.archive_key,
+                                          UploadId=upload_id)
+            except Exception:
+                logger.warning("Nie udało się przerwać uploadu eksportu ZIP #%s", job_id)
+        progress.save(force=True)
+        ZipExportJob.objects.filter(pk=job_id).update(
+            status=ZipExportJob.STATUS_FAILED, error=str(e)[:1000], finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        return False
+
+    # Archiwum pod kluczem cache - dostępne też dla zwykłego pobierania ZIP i usuwane razem z nim
+    remember_archive(job.archive_key)
+    progress.save(force=True)
+    ZipExportJob.objects.filter(pk=job_id).update(
+        status=ZipExportJob.STATUS_DONE, finished_at=timezone.now(), updated_at=timezone.now()
+    )
+    return True
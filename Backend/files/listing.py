@@ -0,0 +1,47 @@
+"""
+files/listing.py
+
+File listing: client visibility, filters and cursor pagination.
+
+Visibility is applied inside the listing query (EXISTS subquery on the
+user's groups) instead of a separate lookup, filters map onto indexed
+columns, and pages are fetched by keyset on (created_at, id), so the cost
+of a page does not depend on the total number of files.
+"""
+
+import django_filters
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, Q
+from rest_framework.pagination import CursorPagination
+
+from .models import File
+
+
+class FileFilter(django_filters.FilterSet):
+    # Filtrowanie po ID (bez dodatkowego zapytania walidującego obiekt)
+    order = django_filters.NumberFilter(field_name='order_id')
+    uploaded_by = django_filters.NumberFilter(field_name='uploaded_by_id')
+    created_after = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = File
+        fields = ['order', 'file_type', 'uploaded_by', 'created_after', 'created_before']
+
+
+class FileCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
+
+
+def is_client(user):
+    return user.groups.filter(name__iexact='client').exists()
+
+
+def visible_files(user, queryset=None):
+    """Files the user may list; clients only see files marked visible_to_clients."""
+    queryset = File.objects.all() if queryset is None else queryset
+    memberships = get_user_model().groups.through.objects.filter(user_id=user.pk, group__name__iexact='client')
+    return queryset.filter(Q(visible_to_clients=True) | ~Exists(memberships))
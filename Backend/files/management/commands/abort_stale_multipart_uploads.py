@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from files import storage
+
+
+class Command(BaseCommand):
+    help = "Aborts multipart uploads under uploads/ in R2 that were started more than N hours ago"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=int, default=7 * 24,
+                            help="Abort uploads initiated more than N hours ago (default: 168)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the uploads that would be aborted")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['older_than_hours'])
+        s3 = storage.get_r2_client()
+
+        aborted = 0
+        paginator = s3.get_paginator('list_multipart_uploads')
+        for page in paginator.paginate(Bucket=storage.CLOUDFLARE_R2_BUCKET, Prefix=storage.UPLOAD_PREFIX):
+            for upload in page.get('Uploads', []):
+                if upload['Initiated'] >= cutoff:
+                    continue
+
+                self.stdout.write(f"{upload['Key']} (initiated {upload['Initiated']:%Y-%m-%d %H:%M})")
+                if not options['dry_run']:
+                    s3.abort_multipart_upload(
+                        Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=upload['Key'], UploadId=upload['UploadId']
+                    )
+                aborted += 1
+
+        verb = "would be aborted" if options['dry_run'] else "aborted"
+        self.stdout.write(self.style.SUCCESS(f"✅ {aborted} stale multipart upload(s) {verb}"))
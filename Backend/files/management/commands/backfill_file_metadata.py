@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from files import storage
+from files.archives import archive_filename
+from files.blobs import is_managed_url
+from files.metadata import fetch_object_metadata
+from files.models import File
+
+METADATA_FIELDS = ['size', 'content_type', 'etag']
+
+
+class Command(BaseCommand):
+    help = "Fills size, content type and ETag of File rows uploaded before they were recorded"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Rows read and updated per batch (default: 500)")
+        parser.add_argument('--workers', type=int, default=16,
+                            help="Concurrent R2 requests (default: 16)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only fetch and print the metadata, do not save it")
+
+    def handle(self, *args, **options):
+        s3 = storage.get_r2_client()
+        pending = (
+            File.objects.filter(Q(size__isnull=True) | Q(content_type='') | Q(etag=''))
+            .exclude(uploaded_file_url__isnull=True).exclude(uploaded_file_url='')
+            .only('pk', 'name', 'file_type', 'uploaded_file_url', *METADATA_FIELDS)
+            .order_by('pk')
+        )
+
+        def fetch(file_obj):
+            try:
+                return file_obj, fetch_object_metadata(
+                    s3, storage.key_from_url(file_obj.uploaded_file_url), archive_filename(file_obj)
+                )
+            except Exception as e:
+                return file_obj, e
+
+        updated = failed = skipped = 0
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='metadata-backfill') as executor:
+            while True:
+                # Stronicowanie po kluczu - wiersze z błędem nie wracają w kolejnych partiach
+                batch = list(pending.filter(pk__gt=last_pk)[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                managed = [f for f in batch if is_managed_url(f.uploaded_file_url)]
+                skipped += len(batch) - len(managed)
+
+                changed = []
+                for file_obj, metadata in executor.map(fetch, managed):
+                    if isinstance(metadata, Exception):
+                        self.stderr.write(f"File #{file_obj.pk}: {metadata}")
+                        failed += 1
+                        continue
+                    for field, value in metadata.items():
+                        # Wartości zapisane przy uploadzie mają pierwszeństwo
+                        if value not in (None, '') and getattr(file_obj, field) in (None, ''):
+                            setattr(file_obj, field, value)
+                    changed.append(file_obj)
+
+                if options['dry_run']:
+                    for file_obj in changed:
+                        self.stdout.write(
+                            f"File #{file_obj.pk}: {file_obj.size} B, {file_obj.content_type}, {file_obj.etag}"
+                        )
+                else:
+                    # bulk_update nie zmienia updated_at - klucze cache archiwów ZIP pozostają ważne
+                    File.objects.bulk_update(changed, METADATA_FIELDS)
+                updated += len(changed)
+
+        verb = "would be updated" if options['dry_run'] else "updated"
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {updated} file(s) {verb}, {failed} failed, {skipped} outside the bucket skipped"
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from files import object_cache
+
+
+class Command(BaseCommand):
+    help = "Shows hit/miss counters and disk usage of the local R2 object cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help="Reset the hit/miss/eviction counters after printing them")
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete all cached objects")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            object_cache.evict(max_bytes=0)
+
+        stats = object_cache.stats()
+        self.stdout.write(f"Directory: {object_cache.OBJECT_CACHE_DIR}")
+        self.stdout.write(
+            f"Entries: {stats['entries']} ({stats['bytes'] / 1024 / 1024:.1f} MiB of "
+            f"{object_cache.OBJECT_CACHE_MAX_BYTES / 1024 / 1024:.0f} MiB)"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {stats['hits']} hit(s), {stats['misses']} miss(es), hit ratio {stats['hit_ratio']:.1%}, "
+            f"{stats['evictions']} eviction(s)"
+        ))
+        if options['reset']:
+            object_cache.reset_stats()
@@ -0,0 +1,53 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from files import upload_queue
+from files.background import submit
+from files.models import File
+from files.storage import key_from_url
+
+
+class Command(BaseCommand):
+    help = "Pushes spooled asynchronous uploads left in the 'uploading' state (e.g. after a restart) to R2"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-minutes', type=int, default=10,
+                            help="Only rows created more than N minutes ago (default: 10)")
+        parser.add_argument('--retry-failed', action='store_true',
+                            help="Also retry 'failed' uploads whose spooled file still exists")
+        parser.add_argument('--workers', type=int, default=upload_queue.ASYNC_UPLOAD_WORKERS,
+                            help="Concurrent uploads (default: R2_ASYNC_UPLOAD_WORKERS)")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options['older_than_minutes'])
+        statuses = [File.STATUS_UPLOADING]
+        if options['retry_failed']:
+            statuses.append(File.STATUS_FAILED)
+
+        pending, lost = [], 0
+        for file_obj in File.objects.filter(status__in=statuses, created_at__lt=cutoff).only(
+            'pk', 'status', 'uploaded_file_url'
+        ):
+            if os.path.exists(upload_queue.spool_path(key_from_url(file_obj.uploaded_file_url))):
+                pending.append(file_obj.pk)
+            elif file_obj.status == File.STATUS_UPLOADING:
+                # Plik spool zniknął (np. inny host) - nie da się już go przesłać
+                File.objects.filter(pk=file_obj.pk, status=File.STATUS_UPLOADING).update(
+                    status=File.STATUS_FAILED, updated_at=timezone.now()
+                )
+                self.stderr.write(f"File #{file_obj.pk}: spooled file is missing")
+                lost += 1
+
+        File.objects.filter(pk__in=pending, status=File.STATUS_FAILED).update(status=File.STATUS_UPLOADING)
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = [submit(executor, upload_queue.push_upload, pk) for pk in pending]
+            results = [future.result() for future in futures]
+
+        pushed = sum(results)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {pushed} upload(s) pushed, {len(results) - pushed} failed, {lost} lost"
+        ))
@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from files import storage
+from files.blobs import DELETE_BATCH_SIZE, delete_keys
+from files.models import File
+
+
+class Command(BaseCommand):
+    help = "Deletes R2 objects under uploads/ that no File row references (orphans)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=24,
+                            help="Keep orphans modified within the last N hours, e.g. uploads not confirmed yet "
+                                 "(default: 24)")
+        parser.add_argument('--prefix', default=storage.UPLOAD_PREFIX,
+                            help=f"Key prefix to reconcile (default: {storage.UPLOAD_PREFIX})")
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE,
+                            help=f"Keys per DeleteObjects call (max {DELETE_BATCH_SIZE})")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report the orphans, do not delete them")
+
+    def _referenced_keys(self, prefix):
+        # Zbiór kluczy budujemy PRZED listowaniem - obiekty dodane w trakcie są młodsze niż okres karencji
+        url_prefix = storage.public_url_for_key(prefix)
+        urls = (
+            File.objects.filter(uploaded_file_url__startswith=url_prefix)
+            .values_list('uploaded_file_url', flat=True)
+            .iterator(chunk_size=5000)
+        )
+        return {storage.key_from_url(url) for url in urls}
+
+    def _delete(self, batch):
+        """Deletes a batch of orphans {key: size}; returns the bytes reclaimed."""
+        # Ponowne sprawdzenie tuż przed usunięciem (wiersz mógł powstać po zbudowaniu zbioru)
+        urls = [storage.public_url_for_key(key) for key in batch]
+        for url in File.objects.filter(uploaded_file_url__in=urls).values_list('uploaded_file_url', flat=True):
+            batch.pop(storage.key_from_url(url), None)
+        deleted = delete_keys(sorted(batch))
+        return len(deleted), sum(batch[key] for key in deleted)
+
+    def handle(self, *args, **options):
+        if not 1 <= options['batch_size'] <= DELETE_BATCH_SIZE:
+            raise CommandError(f"--batch-size musi być w zakresie 1-{DELETE_BATCH_SIZE}")
+        if not options['prefix']:
+            raise CommandError("--prefix nie może być pusty")
+
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        referenced = self._referenced_keys(options['prefix'])
+
+        scanned = recent = orphans = orphan_bytes = deleted = reclaimed = 0
+        batch = {}
+
+        def flush():
+            nonlocal deleted, reclaimed
+            count, size = self._delete(batch)
+            deleted += count
+            reclaimed += size
+            batch.clear()
+
+        paginator = storage.get_r2_client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=storage.CLOUDFLARE_R2_BUCKET, Prefix=options['prefix']):
+            for item in page.get('Contents', []):
+                scanned += 1
+                if item['Key'] in referenced:
+                    continue
+                if item['LastModified'] >= cutoff:
+                    recent += 1
+                    continue
+
+                orphans += 1
+                orphan_bytes += item['Size']
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f"{item['Key']} ({item['Size']} B, {item['LastModified']:%Y-%m-%d %H:%M})")
+                if not options['dry_run']:
+                    batch[item['Key']] = item['Size']
+                    if len(batch) >= options['batch_size']:
+                        flush()
+        if batch:
+            flush()
+
+        self.stdout.write(f"Scanned {scanned} object(s), {len(referenced)} referenced key(s), "
+                          f"{recent} unreferenced within the grace period")
+        if options['dry_run']:
+            summary = f"{orphans} orphan(s) would be deleted, {orphan_bytes / 1024 / 1024:.2f} MiB reclaimable"
+        else:
+            summary = f"{deleted} of {orphans} orphan(s) deleted, {reclaimed / 1024 / 1024:.2f} MiB reclaimed"
+        self.stdout.write(self.style.SUCCESS(f"✅ {summary}"))
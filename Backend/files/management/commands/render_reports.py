@@ -0,0 +1,108 @@
+import os
+import statistics
+import time
+from datetime import datetime, time as day_start
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from files import render_service, storage
+from files.reports import report_filename, report_snapshot
+from orderLog.models import OrderLog
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Renders final PDF reports of all orders in a period into a directory or R2"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='done',
+                            help="Order status (default: done)")
+        parser.add_argument('--since', help="Orders updated on or after this date (YYYY-MM-DD)")
+        parser.add_argument('--until', help="Orders updated before this date (YYYY-MM-DD)")
+        parser.add_argument('--out', required=True,
+                            help="Output directory, or 'r2' to upload the reports to the bucket")
+        parser.add_argument('--prefix', default='reports/',
+                            help="Key prefix used with --out r2 (default: reports/)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Render processes (default: number of CPUs)")
+
+    def _parse_day(self, value, option):
+        day = parse_date(value) if value else None
+        if value and day is None:
+            raise CommandError(f"Nieprawidłowa data {option}: {value} (oczekiwano YYYY-MM-DD)")
+        return timezone.make_aware(datetime.combine(day, day_start.min)) if day else None
+
+    def handle(self, *args, **options):
+        since = self._parse_day(options['since'], '--since')
+        until = self._parse_day(options['until'], '--until')
+
+        orders = Order.objects.filter(status=options['status'])
+        if since:
+            orders = orders.filter(updated_at__gte=since)
+        if until:
+            orders = orders.filter(updated_at__lt=until)
+
+        # Zlecenia (z klientem i managerem) oraz cała historia w dwóch zapytaniach
+        history = OrderLog.objects.select_related('file').order_by('timestamp')
+        orders = orders.select_related('client', 'manager').prefetch_related(Prefetch('history', queryset=history))
+
+        started = time.perf_counter()
+        snapshots = [report_snapshot(order, order.history.all()) for order in orders.order_by('pk')]
+        query_seconds = time.perf_counter() - started
+        if not snapshots:
+            self.stdout.write("No orders to render")
+            return
+
+        write = self._writer(options)
+        timings = []
+        total_bytes = 0
+        if render_service.RENDER_MODE == 'inline':
+            results = map(render_service.render_timed, snapshots)
+            executor = None
+        else:
+            executor = render_service.create_executor(max_workers=options['workers'])
+            results = executor.map(render_service.render_timed, snapshots)
+
+        try:
+            for snapshot, (seconds, pdf_content) in zip(snapshots, results):
+                target = write(snapshot['order_id'], pdf_content)
+                timings.append(seconds)
+                total_bytes += len(pdf_content)
+                self.stdout.write(
+                    f"#{snapshot['order_id']}: {seconds * 1000:.0f} ms, "
+                    f"{len(pdf_content) / 1024:.0f} KB, {len(snapshot['history'])} events -> {target}"
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Data: {query_seconds * 1000:.0f} ms | render mean {statistics.mean(timings) * 1000:.0f} ms, "
+            f"max {max(timings) * 1000:.0f} ms | {len(timings) / elapsed:.1f} reports/s, "
+            f"{total_bytes / 1024 / 1024:.1f} MB"
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(timings)} report(s) rendered in {elapsed:.1f} s"))
+
+    def _writer(self, options):
+        if options['out'] == 'r2':
+            s3 = storage.get_r2_client()
+
+            def write(order_id, pdf_content):
+                key = f"{options['prefix']}{report_filename(order_id)}"
+                s3.put_object(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=key, Body=pdf_content,
+                              ContentType='application/pdf')
+                return key
+            return write
+
+        os.makedirs(options['out'], exist_ok=True)
+
+        def write(order_id, pdf_content):
+            path = os.path.join(options['out'], report_filename(order_id))
+            with open(path, 'wb') as report_file:
+                report_file.write(pdf_content)
+            return path
+        return write
@@ -0,0 +1,104 @@
+"""
+files/metadata.py
+
+Stored object metadata (size, content type, ETag) for File rows.
+
+The content type is sniffed from the first bytes of the file (magic
+numbers), falling back to the file name; the client-declared type is
+not trusted. Uploads through Django capture the first bytes while the
+body is received (see files/blobs.py), direct uploads take the values
+from the HEAD request made when the upload is confirmed.
+"""
+
+import mimetypes
+import re
+
+from botocore.exceptions import ClientError
+
+from . import storage
+
+SNIFF_BYTES = 512
+GENERIC_TYPES = {'', 'application/octet-stream', 'binary/octet-stream'}
+
+SIGNATURES = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'\x1f\x8b', 'application/gzip'),
+    (b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed'),
+    (b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'PK\x05\x06', 'application/zip'),
+]
+
+CONTENT_RANGE_TOTAL = re.compile(r'/(\d+)$')
+
+
+def guess_from_name(filename):
+    return mimetypes.guess_type(filename or '')[0] or ''
+
+
+def sniff_content_type(head, filename=''):
+    """
+    MIME type of a file from its first bytes (and name for container formats).
+
+    Args:
+        head (bytes): first bytes of the file (SNIFF_BYTES is enough)
+        filename (str): original file name
+    """
+    by_name = guess_from_name(filename)
+
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            # DOCX/XLSX/ODT itp. to archiwa ZIP - typ rozpoznajemy po nazwie
+            if content_type == 'application/zip' and by_name and by_name != 'application/zip':
+                return by_name
+            return content_type
+
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+
+    if head and b'\x00' not in head:
+        try:
+            head.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # Ucięty wielobajtowy znak na końcu próbki nie przesądza o typie
+            if e.start < len(head) - 3:
+                return by_name or 'application/octet-stream'
+        return by_name if by_name.startswith('text/') else 'text/plain'
+
+    return by_name or 'application/octet-stream'
+
+
+def total_size_from_range(content_range):
+    """Object size from a Content-Range header ("bytes 0-511/12345")."""
+    match = CONTENT_RANGE_TOTAL.search(content_range or '')
+    return int(match.group(1)) if match else None
+
+
+def fetch_object_metadata(s3, key, filename=''):
+    """
+    size / content_type / etag of an R2 object, from one ranged GET.
+
+    Raises:
+        ClientError: the object does not exist or R2 refused the request
+    """
+    try:
+        r2_object = s3.get_object(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=key, Range=f"bytes=0-{SNIFF_BYTES - 1}")
+    except ClientError as e:
+        # Pusty obiekt - zakres 0-511 jest niespełnialny (416)
+        if e.response.get('Error', {}).get('Code') != 'InvalidRange':
+            raise
+        head = s3.head_object(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=key)
+        return {'size': head.get('ContentLength', 0), 'content_type': sniff_content_type(b'', filename),
+                'etag': head.get('ETag', '').strip('"')}
+
+    head = r2_object['Body'].read()
+    size = total_size_from_range(r2_object.get('ContentRange'))
+    return {
+        'size': size if size is not None else r2_object.get('ContentLength'),
+        'content_type': sniff_content_type(head, filename),
+        'etag': r2_object.get('ETag', '').strip('"'),
+    }
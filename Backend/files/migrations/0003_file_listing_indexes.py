@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_remove_file_uploaded_file_file_order_and_more'),
+        ('orders', '0004_alter_order_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['-created_at', '-id'], name='files_file_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['order', '-created_at'], name='files_file_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['file_type', '-created_at'], name='files_file_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['uploaded_by', '-created_at'], name='files_file_uploader_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('visible_to_clients', True)), fields=['-created_at', '-id'], name='files_file_visible_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_file_sha256_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_type',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='etag',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_file_content_type_etag'),
+        ('orders', '0004_alter_order_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='status',
+            field=models.CharField(choices=[('ready', 'Gotowy'), ('uploading', 'Przesyłanie do R2'), ('failed', 'Błąd przesyłania')], default='ready', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('status', 'ready'), _negated=True), fields=['status', 'created_at'], name='files_file_pending_idx'),
+        ),
+    ]
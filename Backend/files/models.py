@@ -11,6 +11,15 @@ class File(models.Model):
         ('other', 'Other'),
     ]
 
+    STATUS_READY = 'ready'
+    STATUS_UPLOADING = 'uploading'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_READY, 'Gotowy'),
+        (STATUS_UPLOADING, 'Przesyłanie do R2'),
+        (STATUS_FAILED, 'Błąd przesyłania'),
+    ]
+
     name = models.CharField(max_length=255)
     file_type = models.CharField(max_length=10, choices=FILE_TYPES, default='other')
     description = models.TextField(blank=True, null=True)
@@ -29,11 +38,82 @@ class File(models.Model):
     )
     visible_to_clients = models.BooleanField(default=False)
     uploaded_file_url = models.URLField(max_length=1024, blank=True, null=True)
+    # Skrót SHA-256 i rozmiar treści (deduplikacja obiektów w R2)
+    sha256 = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    # Typ MIME rozpoznany z pierwszych bajtów i ETag obiektu w R2
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    etag = models.CharField(max_length=255, blank=True, default='')
+    # Upload asynchroniczny: wiersz istnieje, zanim obiekt trafi do R2
+    status = models.CharField(max_length=16, choices=STATUSES, default=STATUS_READY)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Lista plików: stronicowanie po (created_at, id) i filtry
+            models.Index(fields=['-created_at', '-id'], name='files_file_created_idx'),
+            models.Index(fields=['order', '-created_at'], name='files_file_order_idx'),
+            models.Index(fields=['file_type', '-created_at'], name='files_file_type_idx'),
+            models.Index(fields=['uploaded_by', '-created_at'], name='files_file_uploader_idx'),
+            # Klienci widzą tylko pliki visible_to_clients
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(visible_to_clients=True),
+                         name='files_file_visible_idx'),
+            # Liczenie referencji do obiektu w R2 przy usuwaniu pliku
+            models.Index(fields=['uploaded_file_url'], name='files_file_url_idx'),
+            # Uploady w toku / nieudane (push_spooled_uploads)
+            models.Index(fields=['status', 'created_at'], condition=~models.Q(status='ready'),
+                         name='files_file_pending_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+
+class ZipExportJob(models.Model):
+    """ZIP archive of order files built in the background straight into R2 (files/exports.py)."""
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_PENDING, 'Oczekuje'),
+        (STATUS_RUNNING, 'W trakcie'),
+        (STATUS_DONE, 'Gotowe'),
+        (STATUS_FAILED, 'Błąd'),
+    ]
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    order = models.ForeignKey('orders.Order', on_delete=models.CASCADE, related_name='zip_exports')
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='zip_exports'
+    )
+    file_ids = models.JSONField(default=list)
+    # Klucz archiwum w cache R2 (files/zip_cache.py) - ten sam zestaw plików, ten sam klucz
+    archive_key = models.CharField(max_length=512, db_index=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=STATUS_PENDING)
+    # Postęp
+    files_total = models.PositiveIntegerField(default=0)
+    files_done = models.PositiveIntegerField(default=0)
+    bytes_written = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            # Identyczne eksporty w toku są łączone w jeden
+            models.UniqueConstraint(fields=['archive_key'], condition=models.Q(status__in=['pending', 'running']),
+                                    name='files_zipexport_active_uniq'),
+        ]
+
+    def __str__(self):
+        return f"ZIP #{self.pk} ({self.order_id}, {self.status})"
@@ -0,0 +1,217 @@
+"""
+files/object_cache.py
+
+Local disk read-through cache for R2 objects.
+
+Hot objects (order specs and the like, fetched again by every ZIP and
+single-file download) are kept on local disk, keyed by object key plus
+ETag, so a changed object can never be served from a stale entry. The
+cache is shared by all worker processes on the host: entries are written
+to a temporary file and renamed into place, a hit bumps the entry's
+mtime, and when the total size exceeds the cap the least recently used
+entries (oldest mtime) are deleted. Hits are served from the file
+(FileResponse -> wsgi.file_wrapper / sendfile).
+
+Hit, miss and eviction counters and an estimate of the total size live
+in a small JSON file in the cache directory, updated under flock, so
+every process on the host (and the object_cache_stats command) sees the
+same numbers. A miss adds the new entry's size to the estimate; the
+directory is only walked when the estimate exceeds the cap, and the walk
+resets the estimate to the real total.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+from .storage import CHUNK_SIZE, get_r2_client, key_from_url
+from . import storage
+
+
+logger = logging.getLogger(__name__)
+
+OBJECT_CACHE_DIR = os.getenv("R2_OBJECT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "itflow-r2-objects"))
+# Limit miejsca na dysku (0 wyłącza cache) i maks. rozmiar pojedynczego obiektu
+OBJECT_CACHE_MAX_BYTES = int(os.getenv("R2_OBJECT_CACHE_MAX_MB", 512)) * 1024 * 1024
+OBJECT_CACHE_MAX_OBJECT_BYTES = int(os.getenv("R2_OBJECT_CACHE_MAX_OBJECT_MB", 64)) * 1024 * 1024
+
+STATS_FILE = '.stats'
+STATS_FIELDS = ('hits', 'misses', 'evictions', 'bytes')
+TEMP_SUFFIX = '.part'
+
+
+def cacheable(file_obj):
+    """Only objects with a known ETag and size below the per-object limit are cached."""
+    return (
+        OBJECT_CACHE_MAX_BYTES > 0
+        and bool(file_obj.etag)
+        and file_obj.size is not None
+        and file_obj.size <= min(OBJECT_CACHE_MAX_OBJECT_BYTES, OBJECT_CACHE_MAX_BYTES)
+    )
+
+
+def entry_path(key, etag):
+    digest = hashlib.sha256(f"{key}\n{etag}".encode()).hexdigest()
+    return os.path.join(OBJECT_CACHE_DIR, digest[:2], digest)
+
+
+@contextmanager
+def _locked_stats():
+    """Counters from the stats file, held under an exclusive lock and written back on exit."""
+    os.makedirs(OBJECT_CACHE_DIR, exist_ok=True)
+    fd = os.open(os.path.join(OBJECT_CACHE_DIR, STATS_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, 'r+') as stats_file:
+        fcntl.flock(stats_file, fcntl.LOCK_EX)
+        try:
+            values = json.loads(stats_file.read() or '{}')
+        except ValueError:
+            values = {}
+        counters = {name: int(values.get(name, 0)) for name in STATS_FIELDS}
+        yield counters
+        stats_file.seek(0)
+        stats_file.truncate()
+        stats_file.write(json.dumps(counters))
+
+
+def _update_stats(**deltas):
+    """Adds `deltas` to the shared counters; returns them (None if the stats file is unavailable)."""
+    try:
+        with _locked_stats() as counters:
+            for name, delta in deltas.items():
+                counters[name] += delta
+            return dict(counters)
+    except OSError as e:
+        logger.warning("Nie udało się zapisać statystyk cache obiektów R2: %s", e)
+        return None
+
+
+def _entries():
+    for root, _, names in os.walk(OBJECT_CACHE_DIR):
+        for name in names:
+            if name.endswith(TEMP_SUFFIX) or name == STATS_FILE:
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_size, stat.st_mtime
+
+
+def evict(max_bytes=None):
+    """Deletes the least recently used entries until the cache fits in max_bytes."""
+    max_bytes = OBJECT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = sorted(_entries(), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        try:
+            # Otwarte deskryptory (pobierania w toku) pozostają ważne po unlink
+            os.remove(path)
+            evicted += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+
+    # Szacunek rozmiaru wraca do rzeczywistej sumy (wpisy dodane w trakcie
+    # listowania zostaną doliczone przy następnym przeglądzie)
+    try:
+        with _locked_stats() as counters:
+            counters['bytes'] = total
+            counters['evictions'] += evicted
+    except OSError as e:
+        logger.warning("Nie udało się zapisać statystyk cache obiektów R2: %s", e)
+
+
+def _open_hit(path):
+    try:
+        local_file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return local_file
+
+
+def _fill(path, s3, key):
+    """Downloads the object into `path` (temporary file + rename) and returns it opened."""
+    r2_object = s3.get_object(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=TEMP_SUFFIX)
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            for chunk in r2_object['Body'].iter_chunks(CHUNK_SIZE):
+                temp_file.write(chunk)
+        local_file = open(temp_path, 'rb')
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return local_file
+
+
+def open_object(file_obj, s3=None):
+    """
+    Opened local copy of the File's R2 object (read-through).
+
+    Returns:
+        tuple: (local file opened 'rb', True on a cache hit)
+
+    Raises:
+        ClientError: the object could not be fetched from R2
+    """
+    key = key_from_url(file_obj.uploaded_file_url)
+    path = entry_path(key, file_obj.etag)
+
+    local_file = _open_hit(path)
+    if local_file is not None:
+        _update_stats(hits=1)
+        return local_file, True
+
+    local_file = _fill(path, s3 or get_r2_client(), key)
+    counters = _update_stats(misses=1, bytes=os.fstat(local_file.fileno()).st_size)
+    # Pełny przegląd katalogu tylko po przekroczeniu limitu (lub bez statystyk)
+    if counters is None or counters['bytes'] > OBJECT_CACHE_MAX_BYTES:
+        try:
+            evict()
+        except OSError as e:
+            logger.warning("Nie udało się zwolnić miejsca w cache obiektów R2: %s", e)
+    return local_file, False
+
+
+def iter_file(local_file, chunk_size=CHUNK_SIZE):
+    """Yields the file in chunks and closes it."""
+    with local_file:
+        while chunk := local_file.read(chunk_size):
+            yield chunk
+
+
+def stats():
+    entries = list(_entries())
+    with _locked_stats() as counters:
+        hits, misses, evictions = counters['hits'], counters['misses'], counters['evictions']
+    return {
+        'hits': hits,
+        'misses': misses,
+        'evictions': evictions,
+        'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+        'entries': len(entries),
+        'bytes': sum(size for _, size, _ in entries),
+    }
+
+
+def reset_stats():
+    """Zeroes the hit, miss and eviction counters (the size estimate is kept)."""
+    with _locked_stats() as counters:
+        counters.update(hits=0, misses=0, evictions=0)
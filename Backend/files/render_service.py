@@ -0,0 +1,116 @@
+"""
+files/render_service.py
+
+PDF report rendering in a pool of worker processes.
+
+ReportLab is pure Python and holds the GIL for the whole render, so in a
+threaded gunicorn worker one large report would stall every other request
+of that process. Renders are submitted to a bounded ProcessPoolExecutor
+instead. When too many renders are already queued, or a render does not
+finish in time, callers get RenderUnavailable (the API answers 503 with
+Retry-After).
+
+REPORT_RENDER_MODE=inline renders in the calling thread (tests, scripts).
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from .report_pdf import render_report
+
+
+RENDER_MODE = os.getenv("REPORT_RENDER_MODE", "process")
+RENDER_WORKERS = int(os.getenv("REPORT_RENDER_WORKERS", 2))
+# Ile renderów może czekać w kolejce ponad liczbę procesów
+RENDER_QUEUE_LIMIT = int(os.getenv("REPORT_RENDER_QUEUE_LIMIT", 8))
+RENDER_TIMEOUT = float(os.getenv("REPORT_RENDER_TIMEOUT", 30))
+RENDER_RETRY_AFTER = int(os.getenv("REPORT_RENDER_RETRY_AFTER", 5))
+
+
+class RenderUnavailable(Exception):
+    """The render pool is saturated or the render timed out - retry later."""
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(RENDER_WORKERS + RENDER_QUEUE_LIMIT)
+
+
+def create_executor(max_workers=RENDER_WORKERS):
+    # spawn: procesy robocze nie dziedziczą wątków ani połączeń procesu Django
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def get_executor():
+    """Returns the process-wide render pool, creating it on first use in this process."""
+    global _executor, _executor_pid
+
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = create_executor()
+                _executor_pid = pid
+    return _executor
+
+
+def reset_executor(wait=False):
+    """Shuts the pool down; the next render starts a new one."""
+    global _executor, _executor_pid, _executor_lock, _slots
+
+    if _executor is not None and _executor_pid == os.getpid():
+        _executor.shutdown(wait=wait, cancel_futures=True)
+    _executor = None
+    _executor_pid = None
+    _executor_lock = threading.Lock()
+    _slots = threading.BoundedSemaphore(RENDER_WORKERS + RENDER_QUEUE_LIMIT)
+
+
+# Po fork() proces potomny tworzy własną pulę i licznik miejsc w kolejce
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_executor)
+
+
+def render_pdf(snapshot, timeout=None):
+    """
+    Renders a report snapshot to PDF bytes.
+
+    Raises:
+        RenderUnavailable: the queue is full, the render timed out or the pool broke
+    """
+    if RENDER_MODE == 'inline':
+        return render_report(snapshot)
+
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise RenderUnavailable("Kolejka generowania raportów jest pełna.")
+
+    try:
+        future = get_executor().submit(render_report, snapshot)
+    except (BrokenProcessPool, RuntimeError) as e:
+        slots.release()
+        reset_executor()
+        raise RenderUnavailable("Pula generowania raportów jest niedostępna.") from e
+    # Miejsce w kolejce zwalniane dopiero po zakończeniu renderu (także po timeoucie)
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=RENDER_TIMEOUT if timeout is None else timeout)
+    except FutureTimeoutError as e:
+        future.cancel()
+        raise RenderUnavailable("Przekroczono czas generowania raportu.") from e
+    except BrokenProcessPool as e:
+        reset_executor()
+        raise RenderUnavailable("Pula generowania raportów jest niedostępna.") from e
+
+
+def render_timed(snapshot):
+    """Batch rendering entry point: returns (render seconds, PDF bytes)."""
+    started = time.perf_counter()
+    pdf_content = render_report(snapshot)
+    return time.perf_counter() - started, pdf_content
@@ -0,0 +1,345 @@
+"""
+files/report_pdf.py
+
+ReportLab rendering of the final order report.
+
+The renderer works on a plain snapshot (dicts and strings, see
+files/reports.py: report_snapshot) and does not touch Django, so it can
+run in worker processes of the render pool (files/render_service.py).
+
+Fonts, paragraph styles and table styles are built once at import time.
+Short histories are rendered as one Paragraph per event; long ones as
+page-sized tables of plain-text cells. ReportLab re-measures all remaining
+rows of a table at every page break, so one big table is quadratic;
+fixed-size chunks keep layout linear for tens of thousands of events.
+"""
+
+import io
+import os
+
+# Import dla ReportLab
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.utils import simpleSplit
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+from reportlab.lib import colors
+from reportlab.platypus import LongTable, Table, TableStyle
+
+# 🚨 DODANE IMPORTY DLA OBSŁUGI CZCIONEK TTF
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+
+# --- Stałe konfiguracyjne Firmy (Raport) ---
+COMPANY_NAME = "ITFlow Sp. z o.o."
+COMPANY_ADDRESS = "ul. Technologiczna 10, 00-001 Warszawa"
+COMPANY_NIP = "123-456-78-90"
+COMPANY_PHONE = "+48 123 456 789"
+
+# ----------------------------------------------------
+# 🚨 KONFIGURACJA CZCIONEK DLA POLSKICH ZNAKÓW
+# ----------------------------------------------------
+POLISH_FONT = 'DeJa'
+POLISH_FONT_BOLD = 'DeJaBold'
+
+try:
+    # Używamy ścieżki względnej do bieżącego katalogu report_pdf.py, aby znaleźć pliki w files/fonts/
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+
+    # Upewnij się, że pliki TTF mają poprawne nazwy
+    font_normal_path = os.path.join(current_dir, 'fonts', 'DejaVuSans.ttf')
+    font_bold_path = os.path.join(current_dir, 'fonts', 'DejaVuSans-Bold.ttf')
+
+    # Sprawdzenie istnienia plików i rejestracja
+    if os.path.exists(font_normal_path) and os.path.exists(font_bold_path):
+        pdfmetrics.registerFont(TTFont(POLISH_FONT, font_normal_path))
+        pdfmetrics.registerFont(TTFont(POLISH_FONT_BOLD, font_bold_path))
+
+        pdfmetrics.registerFontFamily(POLISH_FONT, normal=POLISH_FONT, bold=POLISH_FONT_BOLD)
+
+        DEFAULT_FONT = POLISH_FONT
+        DEFAULT_FONT_BOLD = POLISH_FONT_BOLD
+        print("INFO: Polskie czcionki TTF zarejestrowane pomyślnie.")
+    else:
+        # Fallback, jeśli pliki TTF nie zostały znalezione
+        # BARDZO WAŻNE: W tym miejscu musisz sprawdzić, czy pliki na pewno są we właściwej lokalizacji
+        raise FileNotFoundError("Brak plików czcionek TTF w files/fonts/ - upewnij się, że są tam 'DejaVuSans.ttf' i 'DejaVuSans-Bold.ttf'.")
+
+except Exception as e:
+    print(f"OSTRZEŻENIE: Błąd rejestracji czcionek: {e}. Używane są domyślne ReportLabowe (bez polskich znaków).")
+    DEFAULT_FONT = 'Helvetica'
+    DEFAULT_FONT_BOLD = 'Helvetica-Bold'
+
+
+# ----------------------------------------------------
+# Style (budowane raz, przy imporcie modułu)
+# ----------------------------------------------------
+# Powyżej tej liczby zdarzeń historia renderowana jest jako tabela
+HISTORY_PARAGRAPH_LIMIT = 200
+# Czcionka komórek tabeli historii i poziomy padding komórki (suma lewy + prawy)
+HISTORY_FONT_SIZE = 7
+HISTORY_CELL_PADDING = 4
+# Wierszy w jednej tabeli historii (mniej więcej jedna strona)
+HISTORY_TABLE_CHUNK = 60
+
+
+def _build_styles():
+    styles = getSampleStyleSheet()
+
+    # ZMIENIONE: Wzmocnienie stylów przez nadpisanie standardowych
+    styles['Normal'].fontName = DEFAULT_FONT
+    styles['Normal'].fontSize = 10
+    styles['Normal'].leading = 14
+    styles['Heading1'].fontName = DEFAULT_FONT_BOLD
+    styles['Heading1'].fontSize = 18
+    styles['Heading2'].fontName = DEFAULT_FONT_BOLD
+    styles['Heading2'].fontSize = 14
+
+    # Definicja niestandardowych stylów
+    styles.add(ParagraphStyle(name='ReportTitle', fontName=DEFAULT_FONT_BOLD, fontSize=20, spaceAfter=20, alignment=1))
+    styles.add(ParagraphStyle(name='Head2', fontName=DEFAULT_FONT_BOLD, fontSize=14, spaceBefore=15, spaceAfter=10))
+    styles.add(ParagraphStyle(name='Body', fontName=DEFAULT_FONT, fontSize=10, leading=14))
+    styles.add(ParagraphStyle(name='BodyBold', fontName=DEFAULT_FONT_BOLD, fontSize=10, leading=14))
+    styles.add(ParagraphStyle(name='HistoryItem', fontName=DEFAULT_FONT, fontSize=9, leading=12, leftIndent=0.5 * cm,
+                              spaceBefore=3))
+    styles.add(ParagraphStyle(name='Footer', fontName=DEFAULT_FONT, fontSize=9, textColor=colors.grey, alignment=1,
+                              spaceBefore=50))
+    # Styl podpisu
+    styles.add(ParagraphStyle(name='SignatureLine', fontName=DEFAULT_FONT, fontSize=10, alignment=2, spaceBefore=10))
+    return styles
+
+
+STYLES = _build_styles()
+
+INFO_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+    # Użycie zdefiniowanych czcionek dla tabeli
+    ('FONTNAME', (0, 0), (0, -1), DEFAULT_FONT_BOLD),
+    ('FONTNAME', (1, 0), (-1, -1), DEFAULT_FONT),
+    ('LEFTPADDING', (0, 0), (-1, -1), 2),
+])
+
+HISTORY_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), DEFAULT_FONT),
+    ('FONTNAME', (0, 0), (-1, 0), DEFAULT_FONT_BOLD),
+    ('FONTSIZE', (0, 0), (-1, -1), HISTORY_FONT_SIZE),
+    ('LEADING', (0, 0), (-1, -1), 8.5),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+    ('TOPPADDING', (0, 0), (-1, -1), 1),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+    ('LEFTPADDING', (0, 0), (-1, -1), 2),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+])
+HISTORY_TABLE_WIDTHS = [2.4 * cm, 3.2 * cm, 2.6 * cm, 8.8 * cm]
+HISTORY_TABLE_HEADER = ["Data", "Autor", "Zdarzenie", "Opis"]
+
+
+def _split_word(line, width):
+    """Breaks a line without spaces (URL, long file name) at character boundaries."""
+    chunk = ''
+    for char in line:
+        if chunk and pdfmetrics.stringWidth(chunk + char, DEFAULT_FONT, HISTORY_FONT_SIZE) > width:
+            yield chunk
+            chunk = ''
+        chunk += char
+    yield chunk
+
+
+def wrap_cell(text, column):
+    """Wraps `text` to the measured width of history table column `column`."""
+    width = HISTORY_TABLE_WIDTHS[column] - HISTORY_CELL_PADDING
+    lines = []
+    for line in simpleSplit(text, DEFAULT_FONT, HISTORY_FONT_SIZE, width):
+        if pdfmetrics.stringWidth(line, DEFAULT_FONT, HISTORY_FONT_SIZE) > width:
+            lines.extend(_split_word(line, width))
+        else:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def history_paragraphs(history):
+    """One Paragraph per event - the classic layout for short histories."""
+    for entry in history:
+        # Formatowanie opisu - używamy tagu <font name='...'> do poprawnej obsługi czcionek w Paragraph
+        description_html = f"<font name='{DEFAULT_FONT_BOLD}'>[{entry['timestamp']}]</font> ({entry['actor_name']}, {entry['event_display']}): {entry['description'] or 'Brak opisu.'}"
+
+        if entry['status_change']:
+            old_display, new_display = entry['status_change']
+            # Używamy tagów <font name='...'> wewnątrz, aby poprawnie renderować znaki specjalne
+            description_html += f" (Status: <font name='{DEFAULT_FONT}' color='gray'>{old_display}</font> &rarr; <font name='{DEFAULT_FONT_BOLD}' color='green'>{new_display}</font>)"
+
+        if entry['file_label']:
+            description_html += f" (Plik: <font name='{DEFAULT_FONT_BOLD}'><u>{entry['file_label']}</u></font>)"
+
+        yield Paragraph(description_html, STYLES['HistoryItem'])
+
+
+def history_tables(history):
+    """Long histories: tables of plain-text cells (no Paragraph parsing per row)."""
+    rows = []
+    for entry in history:
+        text = entry['description'] or 'Brak opisu.'
+        if entry['status_change']:
+            text += " (Status: {} → {})".format(*entry['status_change'])
+        if entry['file_label']:
+            text += f" (Plik: {entry['file_label']})"
+
+        rows.append([
+            entry['timestamp'],
+            wrap_cell(entry['actor_name'], 1),
+            wrap_cell(entry['event_display'], 2),
+            wrap_cell(text, 3),
+        ])
+
+    for start in range(0, len(rows), HISTORY_TABLE_CHUNK):
+        chunk = [HISTORY_TABLE_HEADER] + rows[start:start + HISTORY_TABLE_CHUNK]
+        table = LongTable(chunk, colWidths=HISTORY_TABLE_WIDTHS, repeatRows=1)
+        table.setStyle(HISTORY_TABLE_STYLE)
+        yield table
+
+
+def render_report(report):
+    """
+    Renders the final report from a snapshot (see files/reports.py: report_snapshot).
+
+    Returns:
+        bytes: PDF document
+    """
+    pdf_buffer = io.BytesIO()
+
+    doc = SimpleDocTemplate(
+        pdf_buffer,
+        pagesize=A4,
+        rightMargin=2 * cm,
+        leftMargin=2 * cm,
+        topMargin=4 * cm,
+        bottomMargin=2 * cm,
+        # Bez CreationDate i losowego /ID - ten sam snapshot daje te same bajty (stabilny ETag)
+        invariant=1,
+    )
+    width, height = A4
+
+    story = []
+
+    styles = STYLES
+
+    # ----------------------------------
+    # --- NAGŁÓWEK (Element statyczny - użyj metody onFirstPage / onLaterPages)
+    # ----------------------------------
+
+    def header_footer(canvas, doc):
+        canvas.saveState()
+
+        # Nagłówek (Dane firmy)
+        canvas.setFont(DEFAULT_FONT_BOLD, 10)
+        canvas.drawString(width - 7 * cm, height - 2 * cm, COMPANY_NAME)
+        canvas.setFont(DEFAULT_FONT, 9)
+        canvas.drawString(width - 7 * cm, height - 2.5 * cm, COMPANY_ADDRESS)
+        canvas.drawString(width - 7 * cm, height - 2.9 * cm, f"NIP: {COMPANY_NIP} | Tel: {COMPANY_PHONE}")
+
+        # Stopka
+        footer_text = f"Raport Końcowy Zlecenia #{report['order_id']} | {COMPANY_NAME} | Strona {canvas.getPageNumber()}"
+        canvas.drawCentredString(width / 2, 1.5 * cm, footer_text)
+
+        canvas.restoreState()
+
+    # ----------------------------------
+    # --- TREŚĆ RAPORTU (Flowables) ---
+    # ----------------------------------
+
+    # --- TYTUŁ RAPORTU ---
+    story.append(Paragraph(f"RAPORT KOŃCOWY ZLECENIA #{report['order_id']}", styles['ReportTitle']))
+
+    # DODANY SPACER, ABY TYTUŁ NIE ZACZYNAŁ SIĘ ZBYT BLISKO NAGŁÓWKA
+    story.append(Spacer(1, 1 * cm))
+
+    # --- SEKCJA: DANE ZLECENIA (Tabela) ---
+    story.append(Paragraph("1. Kluczowe Informacje o Zleceniu", styles['Head2']))
+
+    # Poprawna nazwa Managera do użycia w raporcie
+    has_manager = report['manager_name'] is not None
+    manager_name = report['manager_name'] if has_manager else "Nieprzypisany"
+
+    data = [
+        [Paragraph(f"<b>Nazwa Zlecenia:</b>", styles['Body']), report['title']],
+        [Paragraph(f"<b>Klient:</b>", styles['Body']), report['client_name']],
+        [Paragraph(f"<b>Manager:</b>", styles['Body']), manager_name],
+        [Paragraph(f"<b>Status Końcowy:</b>", styles['Body']), report['status_display']],
+        [Paragraph(f"<b>Data Zgłoszenia:</b>", styles['Body']), report['created_at']],
+    ]
+    if report['finished_at']:
+        data.append([Paragraph(f"<b>Data Zakończenia:</b>", styles['Body']), report['finished_at']])
+
+    table = Table(data, colWidths=[4 * cm, None])
+    table.setStyle(INFO_TABLE_STYLE)
+    story.append(table)
+    story.append(Spacer(1, 1 * cm))
+
+    # --- SEKCJA: OPIS ZLECENIA ---
+    story.append(Paragraph("2. Opis Zlecenia", styles['Head2']))
+
+    desc_text = Paragraph(report['description'].replace('\n', '<br/>'), styles['Body'])
+    story.append(desc_text)
+    story.append(Spacer(1, 1 * cm))
+
+    # --- SEKCJA: HISTORIA ZDARZEŃ (ORDER LOG) ---
+    story.append(Paragraph("3. Pełna Historia Zdarzeń", styles['Head2']))
+
+    if not report['history']:
+        story.append(Paragraph("Brak zapisanych zdarzeń w historii zlecenia.", styles['Body']))
+        story.append(Spacer(1, 1 * cm))
+    elif len(report['history']) > HISTORY_PARAGRAPH_LIMIT:
+        story.extend(history_tables(report['history']))
+        story.append(Spacer(1, 1 * cm))
+    else:
+        story.extend(history_paragraphs(report['history']))
+        story.append(Spacer(1, 1 * cm))
+
+    # --- SEKCJA: PODSUMOWANIE (Jako wniosek końcowy) ---
+    story.append(Paragraph("4. Podsumowanie Końcowe i Podziękowanie", styles['Head2']))
+
+    final_summary = (
+        "Projekt został pomyślnie zakończony zgodnie z ustalonymi celami i terminami. "
+        "Wszystkie zgłoszone wymagania funkcjonalne zostały spełnione, a system przeszedł pomyślnie końcowe testy akceptacyjne. "
+        "Niniejszy raport stanowi formalne zamknięcie zlecenia."
+    )
+
+    summary_text = Paragraph(final_summary, styles['Body'])
+    story.append(summary_text)
+    story.append(Spacer(1, 1.5 * cm))
+
+    # Podziękowanie
+    story.append(Paragraph(
+        f"<font name='{DEFAULT_FONT_BOLD}'>Dziękujemy za zaufanie, jakim obdarzyli Państwo firmę ITFlow Sp. z o.o.!</font>",
+        styles['BodyBold']))
+    story.append(Paragraph("Mamy nadzieję na dalszą owocną współpracę.", styles['Body']))
+    story.append(Spacer(1, 3 * cm))  # Większy odstęp przed sekcją podpisu
+
+    # ----------------------------------
+    # --- SEKCJA: PODPIS (Manager) ---
+    # ----------------------------------
+
+    # 🚨 ZMIENIONE: Podpis Managera zlecenia
+    signature_name = manager_name if has_manager else "Brak przypisanego Managera"
+
+    # Używamy stylów z wyrównaniem do prawej (alignment=2)
+    # Linia podpisu (wyrównanie do prawej)
+    story.append(Paragraph("<hr width='50%' align='right' noshade='noshade'/>", styles['Normal']))
+
+    # Imię i nazwisko Managera
+    story.append(Paragraph(f"({signature_name})", styles['SignatureLine']))
+
+    # Opis podpisu
+    story.append(Paragraph("Podpis Managera Zlecenia", styles['SignatureLine']))
+
+    # Budowanie dokumentu
+    doc.build(story, onFirstPage=header_footer, onLaterPages=header_footer)
+
+    pdf_content = pdf_buffer.getvalue()
+    pdf_buffer.close()
+    return pdf_content
@@ -0,0 +1,116 @@
+"""
+files/reports.py
+
+Final PDF report of an order: data snapshot and cache.
+
+The order and its history are turned into a plain snapshot, which is
+rendered by the render pool (files/render_service.py, ReportLab code in
+files/report_pdf.py). Rendering takes hundreds of milliseconds of CPU,
+while the content only changes with the order itself or its history.
+Rendered PDFs are cached under a key built from the order's updated_at
+and the id of its latest OrderLog row, together with a strong ETag
+(SHA-256 of the bytes; the PDF is rendered in ReportLab's invariant mode,
+so every worker produces the same bytes for the same snapshot). When an order moves to 'done' the report is rendered in the
+background, so the first download is already a cache hit.
+"""
+
+import hashlib
+import logging
+import os
+
+from django.core.cache import cache
+from django.db.models import Max
+
+from orders.models import Order
+from orderLog.models import OrderLog
+from .render_service import RenderUnavailable, render_pdf
+
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_TIMEOUT = int(os.getenv("REPORT_CACHE_TIMEOUT", 30 * 24 * 3600))
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def report_filename(order_id):
+    return f"Raport_Koncowy_Zamowienia_{order_id}.pdf"
+
+
+def report_history(order):
+    return OrderLog.objects.filter(order=order).select_related('file').order_by('timestamp')
+
+
+def history_entry(log, statuses):
+    status_change = None
+    if log.event_type == 'status_change' and log.old_value and log.new_value:
+        status_change = (statuses.get(log.old_value, log.old_value), statuses.get(log.new_value, log.new_value))
+
+    file_label = None
+    if log.event_type == 'file_added' and log.file:
+        file_label = f"{log.file.name}.{log.file.file_type or 'Brak typu'}"
+
+    return {
+        'timestamp': log.timestamp.strftime(DATE_FORMAT),
+        'actor_name': log.actor_name or 'System',
+        'event_display': log.get_event_type_display(),
+        'description': log.description,
+        'status_change': status_change,
+        'file_label': file_label,
+    }
+
+
+def report_snapshot(order, history_logs):
+    """Plain (picklable) data of the report - rendered without database access."""
+    statuses = dict(Order.STATUS_CHOICES)
+    return {
+        'order_id': order.pk,
+        'title': order.title,
+        'description': order.description,
+        'client_name': order.client.get_full_name() or order.client.username,
+        'manager_name': order.manager.get_full_name() if order.manager else None,
+        'status_display': statuses.get(order.status, order.status),
+        'created_at': order.created_at.strftime(DATE_FORMAT),
+        'finished_at': order.updated_at.strftime(DATE_FORMAT) if order.status == 'done' else None,
+        'history': [history_entry(log, statuses) for log in history_logs],
+    }
+
+
+# ----------------------------------------------------
+# Cache raportów
+# ----------------------------------------------------
+def report_cache_key(order):
+    """Changes whenever the order or its history changes."""
+    last_log_id = OrderLog.objects.filter(order=order).aggregate(last=Max('id'))['last'] or 0
+    return f"order_report:{order.pk}:{order.updated_at.timestamp()}:{last_log_id}"
+
+
+def get_report(order):
+    """
+    Returns the cached report of an order, rendering it on a cache miss.
+
+    Returns:
+        tuple: (pdf bytes, strong ETag)
+
+    Raises:
+        RenderUnavailable: the render pool is saturated
+    """
+    key = report_cache_key(order)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    pdf_content = render_pdf(report_snapshot(order, report_history(order)))
+    etag = f'"{hashlib.sha256(pdf_content).hexdigest()}"'
+    cache.set(key, (pdf_content, etag), timeout=REPORT_CACHE_TIMEOUT)
+    return pdf_content, etag
+
+
+def prerender_report(order_id):
+    """Renders and caches the report of an order (run via run_in_background)."""
+    try:
+        order = Order.objects.select_related('client', 'manager').get(pk=order_id)
+        get_report(order)
+    except RenderUnavailable as e:
+        logger.warning("Raport zlecenia %s nie został wygenerowany w tle: %s", order_id, e)
+    except Exception:
+        logger.exception("Nie udało się wygenerować raportu zlecenia %s w tle", order_id)
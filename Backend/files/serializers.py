@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import File
+from .models import File, ZipExportJob
 
 
 class FileSerializer(serializers.ModelSerializer):
@@ -11,10 +11,12 @@ class FileSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'file_type', 'description',
             'uploaded_by', 'visible_to_clients', 'uploaded_file_url',
-            'order', 'created_at', 'updated_at'
+            'order', 'sha256', 'size', 'content_type', 'etag', 'status', 'created_at', 'updated_at'
         ]
         # Te pola są ustawiane automatycznie przez Django/serwer
-        read_only_fields = ['uploaded_by', 'created_at', 'updated_at']
+        read_only_fields = [
+            'uploaded_by', 'sha256', 'size', 'content_type', 'etag', 'status', 'created_at', 'updated_at'
+        ]
 
     def create(self, validated_data):
         # Automatyczne przypisanie użytkownika wg kontekstu requesta
@@ -25,4 +27,28 @@ class FileSerializer(serializers.ModelSerializer):
         # 🚨 WAŻNE: Dzięki temu, że pole uploaded_file_url w modelu File jest teraz URLField,
         # ModelSerializer poprawnie je obsłuży i zapisze URL przesłany przez upload_file_api.
 
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+
+class ZipExportJobSerializer(serializers.ModelSerializer):
+    # Podpisany URL archiwum (tylko dla zakończonych eksportów)
+    download_url = serializers.SerializerMethodField()
+    # Archiwum usunięte przy inwalidacji cache - klient musi zlecić eksport ponownie
+    expired = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ZipExportJob
+        fields = [
+            'id', 'order', 'status', 'files_total', 'files_done', 'bytes_written',
+            'error', 'download_url', 'expired', 'created_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+    def get_download_url(self, job):
+        # Import lokalny - files.exports importuje modele i klienta R2
+        from .exports import download_url
+        return download_url(job)
+
+    def get_expired(self, job):
+        from .exports import is_expired
+        return is_expired(job)
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from orderLog.models import OrderLog
+from .background import run_in_background
+from .blobs import schedule_release
+from .models import File
+from .reports import prerender_report
+from .storage import key_from_url
+from .upload_queue import discard_spool
+from .zip_cache import schedule_invalidation
+
+
+@receiver(post_save, sender=File)
+@receiver(post_delete, sender=File)
+def file_changed(sender, instance, **kwargs):
+    """Drops cached ZIP archives of the file's order (after commit, in the background)."""
+    if instance.order_id:
+        # Listowanie archiwów w R2 poza ścieżką żądania (raz na zlecenie przy operacjach zbiorczych)
+        schedule_invalidation(instance.order_id)
+
+
+@receiver(post_delete, sender=File)
+def file_deleted(sender, instance, **kwargs):
+    """Deletes the R2 object once no File references it (checked after commit)."""
+    url = instance.uploaded_file_url
+    if url:
+        schedule_release(url)
+        # Upload asynchroniczny, który nie trafił do R2
+        if instance.status != File.STATUS_READY:
+            transaction.on_commit(lambda: discard_spool(key_from_url(url)))
+
+
+@receiver(post_save, sender=OrderLog)
+def order_finished(sender, instance, created, **kwargs):
+    """Pre-renders the final report once an order moves to 'done'."""
+    if created and instance.event_type == 'status_change' and instance.new_value == 'done':
+        order_id = instance.order_id
+        transaction.on_commit(lambda: run_in_background(prerender_report, order_id))
@@ -0,0 +1,96 @@
+"""
+files/storage.py
+
+Cloudflare R2 (S3-compatible) configuration and the shared boto3 client.
+
+A single client is created per process and reused by every files code
+path, so session setup, endpoint resolution and the HTTPS connection
+pool are paid once instead of on every upload/download. boto3 clients
+are thread-safe; after a fork (gunicorn workers) the child process
+builds its own client instead of sharing sockets with the parent.
+"""
+
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+
+# --- Stałe konfiguracyjne R2 ---
+CLOUDFLARE_R2_ENDPOINT = os.getenv("CLOUDFLARE_R2_ENDPOINT")
+CLOUDFLARE_R2_BUCKET = os.getenv("CLOUDFLARE_R2_BUCKET_NAME")
+CLOUDFLARE_R2_KEY = os.getenv("CLOUDFLARE_R2_ACCESS_KEY_ID")
+CLOUDFLARE_R2_SECRET = os.getenv("CLOUDFLARE_R2_SECRET_ACCESS_KEY")
+CLOUDFLARE_PUBLIC_URL = os.getenv("CLOUDFLARE_PUBLIC_URL")
+
+UPLOAD_PREFIX = "uploads/"
+# Rozmiar porcji przy strumieniowym odczycie obiektów
+CHUNK_SIZE = 1024 * 1024
+# Minimalny rozmiar części uploadu wieloczęściowego (poza ostatnią)
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024
+
+# --- Parametry klienta (pula połączeń, timeouty, adaptacyjne ponowienia) ---
+R2_CLIENT_CONFIG = Config(
+    signature_version='s3v4',
+    max_pool_connections=int(os.getenv("R2_MAX_POOL_CONNECTIONS", 32)),
+    connect_timeout=float(os.getenv("R2_CONNECT_TIMEOUT", 5)),
+    read_timeout=float(os.getenv("R2_READ_TIMEOUT", 60)),
+    retries={
+        'mode': 'adaptive',
+        'max_attempts': int(os.getenv("R2_MAX_ATTEMPTS", 5)),
+    },
+    tcp_keepalive=True,
+)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def create_r2_client(config=R2_CLIENT_CONFIG):
+    """Creates a new R2 client (use get_r2_client() unless a separate pool is really needed)."""
+    session = boto3.session.Session()
+    return session.client(
+        's3',
+        endpoint_url=CLOUDFLARE_R2_ENDPOINT,
+        aws_access_key_id=CLOUDFLARE_R2_KEY,
+        aws_secret_access_key=CLOUDFLARE_R2_SECRET,
+        config=config,
+    )
+
+
+def get_r2_client():
+    """Returns the process-wide R2 client, creating it on first use in this process."""
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = create_r2_client()
+                _client_pid = pid
+    return _client
+
+
+def reset_r2_client():
+    """Drops the shared client; the next get_r2_client() call builds a new one."""
+    global _client, _client_pid, _client_lock
+
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+
+# Po fork() proces potomny nie może współdzielić puli połączeń ani blokady rodzica
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_r2_client)
+
+
+def public_url_for_key(file_key):
+    return f"{CLOUDFLARE_PUBLIC_URL.rstrip('/')}/{file_key}"
+
+
+def key_from_url(url):
+    """R2 object key of a File.uploaded_file_url."""
+    return url.replace(f"{CLOUDFLARE_PUBLIC_URL.rstrip('/')}/", '')
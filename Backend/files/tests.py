@@ -1,10 +1,42 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+import boto3
+import requests
+from moto import mock_aws
+from reportlab.pdfbase import pdfmetrics
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.urls import reverse
-from .models import File
+from .models import File, ZipExportJob
 from .serializers import FileSerializer
+from . import downloads, exports, object_cache, render_service, report_pdf, reports, storage, upload_queue
+from .render_service import RenderUnavailable
+from .archives import _ByteBudget, prefetched_r2_entries, stream_zip
+from .management.commands.reconcile_r2_orphans import Command as ReconcileCommand
+from .metadata import sniff_content_type
+from .zip_cache import archive_cache_key, invalidate_order_archives
 from orders.models import Order
 
 User = get_user_model()
@@ -152,3 +184,1596 @@ class FileSerializerTest(TestCase):
         self.assertIn('updated_at', serializer.data)
 
 
+class R2TestMixin:
+    """Runs the R2 code paths against moto (local S3 stand-in)"""
+
+    bucket = 'test-bucket'
+    public_url = 'https://cdn.example.com'
+
+    def setUp(self):
+        super().setUp()
+        env = mock.patch.dict(os.environ, {
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing',
+            'AWS_DEFAULT_REGION': 'us-east-1',
+        })
+        env.start()
+        self.addCleanup(env.stop)
+
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+
+        settings_patch = mock.patch.multiple(
+            'files.storage',
+            CLOUDFLARE_R2_ENDPOINT=None,
+            CLOUDFLARE_R2_BUCKET=self.bucket,
+            CLOUDFLARE_R2_KEY=None,
+            CLOUDFLARE_R2_SECRET=None,
+            CLOUDFLARE_PUBLIC_URL=self.public_url,
+        )
+        settings_patch.start()
+        self.addCleanup(settings_patch.stop)
+
+        # Współdzielony klient musi powstać od nowa w obrębie mocka
+        storage.reset_r2_client()
+        self.addCleanup(storage.reset_r2_client)
+
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket=self.bucket)
+
+        # Lokalny cache obiektów R2 w osobnym katalogu dla każdego testu
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        cache_dir_patch = mock.patch('files.object_cache.OBJECT_CACHE_DIR', cache_dir)
+        cache_dir_patch.start()
+        self.addCleanup(cache_dir_patch.stop)
+
+
+class SharedR2ClientTest(R2TestMixin, TestCase):
+    """Tests for the process-wide R2 client"""
+
+    def test_client_is_reused(self):
+        """Test that every call returns the same pooled client"""
+        client = storage.get_r2_client()
+        self.assertIs(storage.get_r2_client(), client)
+        self.assertEqual(client.meta.config.max_pool_connections, storage.R2_CLIENT_CONFIG.max_pool_connections)
+        self.assertEqual(client.meta.config.retries['mode'], 'adaptive')
+
+    def test_new_client_after_fork(self):
+        """Test that a forked process does not reuse the parent's client"""
+        client = storage.get_r2_client()
+        with mock.patch('files.storage.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(storage.get_r2_client(), client)
+
+
+class DirectUploadTest(R2TestMixin, APITestCase):
+    """Tests for presigned direct-to-R2 uploads"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.order = Order.objects.create(
+            title='Test Order',
+            description='Test Description',
+            client=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _presign(self, filename='spec.pdf'):
+        response = self.client.post(reverse('files-upload-presign-api'),
+                                    {'filename': filename, 'content_type': 'application/pdf'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_presign_and_confirm(self):
+        """Test the full two-step upload flow"""
+        presigned = self._presign()
+        self.assertTrue(presigned['key'].startswith('uploads/'))
+
+        put = requests.put(presigned['upload_url'], data=b'%PDF-1.4 test', headers=presigned['headers'])
+        self.assertEqual(put.status_code, 200)
+
+        response = self.client.post(reverse('files-upload-confirm-api'), {
+            'upload_token': presigned['upload_token'],
+            'file_type': 'pdf',
+            'order': self.order.id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['size'], len(b'%PDF-1.4 test'))
+        self.assertEqual(response.data['name'], 'spec.pdf')
+        self.assertEqual(response.data['content_type'], 'application/pdf')
+        self.assertTrue(response.data['etag'])
+
+        file_obj = File.objects.get(pk=response.data['id'])
+        self.assertEqual(file_obj.uploaded_file_url, f"{self.public_url}/{presigned['key']}")
+        self.assertEqual(file_obj.uploaded_by, self.user)
+
+        # Ponowne użycie tokenu nie tworzy drugiego wiersza
+        replay = self.client.post(reverse('files-upload-confirm-api'), {
+            'upload_token': presigned['upload_token'],
+            'file_type': 'pdf',
+            'order': self.order.id,
+        }, format='json')
+        self.assertEqual(replay.status_code, status.HTTP_200_OK)
+        self.assertEqual(replay.data['id'], file_obj.id)
+        self.assertEqual(File.objects.count(), 1)
+
+    def test_confirm_before_upload(self):
+        """Test confirming an object that was never uploaded"""
+        presigned = self._presign()
+        response = self.client.post(reverse('files-upload-confirm-api'),
+                                    {'upload_token': presigned['upload_token']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(File.objects.exists())
+
+    def test_confirm_with_foreign_token(self):
+        """Test that a token issued to another user is rejected"""
+        presigned = self._presign()
+        self.s3.put_object(Bucket=self.bucket, Key=presigned['key'], Body=b'data')
+        other = User.objects.create_user(username='other', password='otherpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.post(reverse('files-upload-confirm-api'),
+                                    {'upload_token': presigned['upload_token']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_presign_requires_filename(self):
+        """Test validation of the filename field"""
+        response = self.client.post(reverse('files-upload-presign-api'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MultipartUploadTest(R2TestMixin, APITestCase):
+    """Tests for resumable multipart uploads"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _initiate(self):
+        response = self.client.post(reverse('files-multipart-initiate-api'),
+                                    {'filename': 'delivery.zip'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def _upload_part(self, token, number, body):
+        response = self.client.post(reverse('files-multipart-parts-api'),
+                                    {'upload_token': token, 'part_numbers': [number]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        put = requests.put(response.data['urls'][number], data=body)
+        self.assertEqual(put.status_code, 200)
+
+    def test_resume_and_complete(self):
+        """Test uploading parts, listing them for resume and completing"""
+        upload = self._initiate()
+        first = b'a' * (5 * 1024 * 1024)
+        self._upload_part(upload['upload_token'], 1, first)
+
+        # Wznowienie: klient sprawdza, które części już są w R2
+        response = self.client.get(reverse('files-multipart-parts-api'), {'upload_token': upload['upload_token']})
+        self.assertEqual([p['part_number'] for p in response.data['parts']], [1])
+
+        self._upload_part(upload['upload_token'], 2, b'tail')
+        response = self.client.post(reverse('files-multipart-complete-api'),
+                                    {'upload_token': upload['upload_token'], 'file_type': 'zip'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['name'], 'delivery.zip')
+
+        body = self.s3.get_object(Bucket=self.bucket, Key=upload['key'])['Body'].read()
+        self.assertEqual(body, first + b'tail')
+
+    def test_abort(self):
+        """Test aborting a multipart upload"""
+        upload = self._initiate()
+        response = self.client.post(reverse('files-multipart-abort-api'),
+                                    {'upload_token': upload['upload_token']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.s3.list_multipart_uploads(Bucket=self.bucket).get('Uploads', []), [])
+
+    def test_invalid_part_numbers(self):
+        """Test validation of requested part numbers"""
+        upload = self._initiate()
+        response = self.client.post(reverse('files-multipart-parts-api'),
+                                    {'upload_token': upload['upload_token'], 'part_numbers': [0]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cleanup_command_aborts_stale_uploads(self):
+        """Test the abort_stale_multipart_uploads command"""
+        self._initiate()
+        out = StringIO()
+        call_command('abort_stale_multipart_uploads', older_than_hours=1, dry_run=True, stdout=out)
+        self.assertIn('1 stale multipart upload(s) would be aborted', out.getvalue())
+        self.assertEqual(len(self.s3.list_multipart_uploads(Bucket=self.bucket)['Uploads']), 1)
+
+        call_command('abort_stale_multipart_uploads', older_than_hours=1, stdout=out)
+        self.assertIn('1 stale multipart upload(s) aborted', out.getvalue())
+        self.assertEqual(self.s3.list_multipart_uploads(Bucket=self.bucket).get('Uploads', []), [])
+
+
+class DownloadFilesZipTest(R2TestMixin, APITestCase):
+    """Tests for the streamed ZIP download"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.order = Order.objects.create(
+            title='Test Order',
+            description='Test Description',
+            client=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+        # Zapis archiwum do cache synchronicznie, żeby testy były deterministyczne
+        for target in ('files.zip_cache.run_in_background', 'files.signals.run_in_background'):
+            background = mock.patch(target, side_effect=lambda target, *args: target(*args))
+            background.start()
+            self.addCleanup(background.stop)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _file(self, name, file_type, body):
+        key = f'uploads/{name}.{file_type}'
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body)
+        return File.objects.create(name=name, file_type=file_type, order=self.order, uploaded_by=self.user,
+                                   uploaded_file_url=f'{self.public_url}/{key}', visible_to_clients=True)
+
+    def _get(self, files):
+        url = reverse('files-download-api', kwargs={'order_id': self.order.id})
+        response = self.client.get(url, {'file_ids': ','.join(str(f.id) for f in files)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def _download(self, files):
+        return zipfile.ZipFile(io.BytesIO(self._get(files)[1]))
+
+    def _cached_keys(self):
+        listing = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=f'cache/zips/order_{self.order.id}/')
+        return [item['Key'] for item in listing.get('Contents', [])]
+
+    def test_download_streams_all_files(self):
+        """Test archive content and per-type compression"""
+        spec = self._file('spec', 'pdf', b'%PDF-1.4 ' + b'x' * 5000)
+        notes = self._file('notes', 'other', b'line\n' * 2000)
+
+        archive = self._download([spec, notes])
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('spec.pdf'), b'%PDF-1.4 ' + b'x' * 5000)
+        self.assertEqual(archive.getinfo('spec.pdf').compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(archive.getinfo('notes.other').compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_missing_object_is_skipped(self):
+        """Test that a file missing in R2 does not break the archive"""
+        spec = self._file('spec', 'pdf', b'%PDF')
+        ghost = File.objects.create(name='ghost', file_type='zip', order=self.order,
+                                    uploaded_file_url=f'{self.public_url}/uploads/ghost.zip', visible_to_clients=True)
+        archive = self._download([spec, ghost])
+        self.assertEqual(archive.namelist(), ['spec.pdf'])
+
+    def test_hidden_files_are_left_out_for_clients(self):
+        """Test that a client's archive contains only files visible to clients"""
+        spec = self._file('spec', 'pdf', b'%PDF')
+        hidden = self._file('hidden', 'pdf', b'%PDF wewnetrzny')
+        File.objects.filter(pk=hidden.pk).update(visible_to_clients=False)
+        self.assertEqual(self._download([spec, hidden]).namelist(), ['spec.pdf'])
+
+        url = reverse('files-download-api', kwargs={'order_id': self.order.id})
+        response = self.client.get(url, {'file_ids': str(hidden.id)})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_download_requires_file_ids(self):
+        """Test validation of the file_ids parameter"""
+        url = reverse('files-download-api', kwargs={'order_id': self.order.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_prefetch_keeps_archive_order(self):
+        """Test that parallel prefetching emits entries in the requested order"""
+        files = [self._file(f'part{i}', 'txt', bytes([65 + i]) * (100 * (i + 1))) for i in range(6)]
+
+        # Odwrotne opóźnienia: pierwsze pliki przychodzą najpóźniej
+        real_get_object = self.s3.get_object
+        def slow_get_object(**kwargs):
+            index = int(kwargs['Key'].split('part')[1].split('.')[0])
+            time.sleep(0.01 * (6 - index))
+            return real_get_object(**kwargs)
+
+        with mock.patch.object(self.s3, 'get_object', side_effect=slow_get_object):
+            data = b''.join(stream_zip(prefetched_r2_entries(files, s3=self.s3, max_workers=4)))
+
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertEqual(archive.namelist(), [f'part{i}.txt' for i in range(6)])
+        self.assertEqual(archive.read('part2.txt'), b'C' * 300)
+
+    def test_prefetch_respects_buffer_budget(self):
+        """Test that buffered bytes never exceed the budget and large objects are streamed"""
+        files = [self._file(f'small{i}', 'txt', b's' * 400) for i in range(5)]
+        files.insert(2, self._file('large', 'bin', b'L' * 5000))
+
+        budgets = []
+        def track_budget(limit):
+            budgets.append(_ByteBudget(limit))
+            return budgets[-1]
+
+        with mock.patch('files.archives._ByteBudget', side_effect=track_budget):
+            entries = list(stream_zip(prefetched_r2_entries(files, s3=self.s3, max_workers=4, max_buffer_bytes=1000)))
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(entries)))
+        self.assertEqual(archive.read('large.bin'), b'L' * 5000)
+        self.assertEqual(len(archive.namelist()), 6)
+        self.assertLessEqual(budgets[0].peak, 1000)
+        self.assertEqual(budgets[0].used, 0)
+
+    def test_prefetch_skips_missing_objects_and_stops_cleanly(self):
+        """Test missing objects and an aborted download"""
+        files = [self._file(f'doc{i}', 'txt', b'd' * 10) for i in range(4)]
+        ghost = File.objects.create(name='ghost', file_type='zip', order=self.order,
+                                    uploaded_file_url=f'{self.public_url}/uploads/ghost.zip', visible_to_clients=True)
+        entries = prefetched_r2_entries([files[0], ghost] + files[1:], s3=self.s3, max_workers=2)
+        self.assertEqual([name for name, _, _ in entries], [f'doc{i}.txt' for i in range(4)])
+
+        # Przerwane pobieranie nie może zostawić zablokowanych wątków
+        entries = prefetched_r2_entries(files, s3=self.s3, max_workers=2, max_buffer_bytes=10)
+        next(entries)
+        entries.close()
+
+    def test_repeated_download_is_served_from_cache(self):
+        """Test that the same selection is archived once and then served from R2"""
+        spec = self._file('spec', 'pdf', b'%PDF-1.4')
+        notes = self._file('notes', 'other', b'notes')
+
+        first, body = self._get([spec, notes])
+        self.assertEqual(first['X-Archive-Cache'], 'miss')
+        self.assertEqual(self._cached_keys(), [archive_cache_key(self.order.id, [notes, spec])])
+
+        with mock.patch('files.views.prefetched_r2_entries') as entries:
+            second, cached_body = self._get([notes, spec])
+        entries.assert_not_called()
+        self.assertEqual(second['X-Archive-Cache'], 'hit')
+        self.assertEqual(cached_body, body)
+
+    def test_cached_archive_redirects_to_r2(self):
+        """Test that a cached archive can be downloaded straight from R2"""
+        spec = self._file('spec', 'pdf', b'%PDF-1.4')
+        url = reverse('files-download-api', kwargs={'order_id': self.order.id})
+
+        # Archiwum jeszcze nie w cache - przesyłane przez Django mimo ?redirect
+        first = self.client.get(url, {'file_ids': spec.id, 'redirect': 'true'})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        body = b''.join(first.streaming_content)
+
+        second = self.client.get(url, {'file_ids': spec.id, 'redirect': 'true'})
+        self.assertEqual(second.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(second['X-Archive-Cache'], 'hit')
+        self.assertEqual(second['Cache-Control'], 'private, no-store')
+        fetched = requests.get(second['Location'])
+        self.assertEqual(fetched.content, body)
+        self.assertIn(f'order_{self.order.id}_files.zip', fetched.headers['Content-Disposition'])
+
+    def test_cache_invalidated_when_file_changes(self):
+        """Test that saving or deleting a member file drops the order's cached archives"""
+        spec = self._file('spec', 'pdf', b'%PDF-1.4')
+        notes = self._file('notes', 'other', b'notes')
+        self._get([spec, notes])
+        old_key = self._cached_keys()[0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            spec.description = 'v2'
+            spec.save()
+        self.assertEqual(self._cached_keys(), [])
+
+        response, _ = self._get([spec, notes])
+        self.assertEqual(response['X-Archive-Cache'], 'miss')
+        self.assertNotEqual(self._cached_keys(), [old_key])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notes.delete()
+        self.assertEqual(self._cached_keys(), [])
+
+    def test_invalidation_finds_archives_written_elsewhere(self):
+        """Test that archives are found in R2 even without a marker in this process's cache"""
+        spec = self._file('spec', 'pdf', b'%PDF-1.4')
+        self._get([spec])
+        # Archiwum zapisane przez inny proces / znacznik utracony
+        self.s3.put_object(Bucket=self.bucket, Key=f'cache/zips/order_{self.order.id}/inny.zip', Body=b'PK')
+        cache.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            spec.description = 'v2'
+            spec.save()
+        self.assertEqual(self._cached_keys(), [])
+
+    def test_incomplete_archive_is_not_cached(self):
+        """Test that an archive with skipped files is not stored"""
+        spec = self._file('spec', 'pdf', b'%PDF')
+        ghost = File.objects.create(name='ghost', file_type='zip', order=self.order,
+                                    uploaded_file_url=f'{self.public_url}/uploads/ghost.zip', visible_to_clients=True)
+        self._download([spec, ghost])
+        self.assertEqual(self._cached_keys(), [])
+
+    def test_stream_zip_with_unknown_size(self):
+        """Test entries without a known size"""
+        data = b''.join(stream_zip([('a.txt', None, iter([b'abc', b'def']))]))
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertEqual(archive.read('a.txt'), b'abcdef')
+
+
+class ClientFileAccessTest(APITestCase):
+    """Tests for client visibility checks on single-file endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='manager', password='testpass123')
+        self.manager.groups.set([Group.objects.get_or_create(name='manager')[0]])
+        # Nowi użytkownicy trafiają do grupy 'client'
+        self.customer = User.objects.create_user(username='klient', password='testpass123')
+        self.order = Order.objects.create(title='Zlecenie', description='Opis', client=self.customer)
+        self.hidden = File.objects.create(name='wewnetrzny', file_type='pdf', order=self.order,
+                                          uploaded_file_url='https://cdn.example.com/uploads/wewnetrzny.pdf')
+
+    def test_client_cannot_open_hidden_file(self):
+        """Test file detail for clients and team members"""
+        url = reverse('files-detail-api', args=[self.hidden.id])
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        File.objects.filter(pk=self.hidden.pk).update(visible_to_clients=True)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(user=self.manager)
+        File.objects.filter(pk=self.hidden.pk).update(visible_to_clients=False)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_client_cannot_change_visibility(self):
+        """Test that only the team publishes files to clients"""
+        url = reverse('file-visibility-api', args=[self.hidden.id])
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.client.patch(url, {'visible_to_clients': True}, format='json').status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.hidden.refresh_from_db()
+        self.assertFalse(self.hidden.visible_to_clients)
+
+        self.client.force_authenticate(user=self.manager)
+        self.assertEqual(self.client.patch(url, {'visible_to_clients': True}, format='json').status_code,
+                         status.HTTP_200_OK)
+
+    def test_report_access_follows_order_visibility(self):
+        """Test that managers see every report and programmers only those of their orders"""
+        programmer = User.objects.create_user(username='programista', password='testpass123')
+        programmer.groups.set([Group.objects.get_or_create(name='programmer')[0]])
+        url = reverse('order-final-report-pdf-api', kwargs={'order_id': self.order.id})
+
+        with mock.patch('files.views.get_report', return_value=(b'%PDF-1.4', '"etag"')):
+            self.client.force_authenticate(user=self.manager)
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+            self.client.force_authenticate(user=programmer)
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+            Order.objects.filter(pk=self.order.pk).update(developer=programmer)
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+
+class FinalReportCacheTest(APITestCase):
+    """Tests for the cached final PDF report"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='client', password='testpass123',
+                                             first_name='Jan', last_name='Kowalski')
+        self.order = Order.objects.create(title='Sklep', description='Opis\nzlecenia', client=self.user)
+        self.order.log_event(self.user, 'comment', 'Pierwszy komentarz')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('order-final-report-pdf-api', kwargs={'order_id': self.order.id})
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        inline = mock.patch('files.render_service.RENDER_MODE', 'inline')
+        inline.start()
+        self.addCleanup(inline.stop)
+
+    def test_report_is_rendered_once_and_revalidated(self):
+        """Test cache hits and 304 responses for a matching ETag"""
+        with mock.patch('files.reports.render_pdf', wraps=reports.render_pdf) as render:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertTrue(first.content.startswith(b'%PDF'))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified.content, b'')
+
+    def test_etag_is_stable_across_renders(self):
+        """Test that re-rendering the same order (another worker, evicted cache) keeps the ETag"""
+        first = self.client.get(self.url)
+        cache.clear()
+        with mock.patch('files.reports.render_pdf', wraps=reports.render_pdf) as render:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        render.assert_called_once()
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_new_history_entry_renders_new_report(self):
+        """Test that a new OrderLog row changes the report and its ETag"""
+        first = self.client.get(self.url)
+        self.order.log_event(self.user, 'comment', 'Drugi komentarz')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_report_prerendered_when_order_is_done(self):
+        """Test background rendering after the transition to 'done'"""
+        with mock.patch('files.signals.run_in_background', side_effect=lambda target, *args: target(*args)), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.order.update_status_and_log('done', self.user)
+
+        with mock.patch('files.reports.render_pdf') as render:
+            response = self.client.get(self.url)
+        render.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+    def test_report_requires_access(self):
+        """Test that other users cannot download the report"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_busy_render_pool_returns_503(self):
+        """Test back-pressure when the render queue is full"""
+        with mock.patch('files.reports.render_pdf', side_effect=RenderUnavailable("Kolejka pełna")):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], str(render_service.RENDER_RETRY_AFTER))
+
+
+class RenderServiceTest(TestCase):
+    """Tests for the report render pool"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='client', password='testpass123')
+        order = Order.objects.create(title='Sklep', description='Opis', client=user, status='done')
+        order.log_event(user, 'status_change', 'Zakończono', old_value='in_progress', new_value='done')
+        self.snapshot = reports.report_snapshot(order, reports.report_history(order))
+        self.addCleanup(render_service.reset_executor, True)
+
+    def test_snapshot_is_plain_data(self):
+        """Test that the snapshot does not reference Django objects"""
+        entry = self.snapshot['history'][0]
+        self.assertEqual(entry['status_change'], ('W realizacji', 'Zakończone'))
+        self.assertEqual(entry['actor_name'], 'client')
+        self.assertEqual(self.snapshot['manager_name'], None)
+        pickle.dumps(self.snapshot)
+
+    def test_long_history_rendered_as_tables(self):
+        """Test that long histories switch to page-sized tables"""
+        self.snapshot['history'] = self.snapshot['history'] * (report_pdf.HISTORY_PARAGRAPH_LIMIT + 1)
+        with mock.patch('files.report_pdf.history_tables', wraps=report_pdf.history_tables) as tables, \
+                mock.patch('files.report_pdf.history_paragraphs') as paragraphs:
+            pdf_content = report_pdf.render_report(self.snapshot)
+
+        tables.assert_called_once()
+        paragraphs.assert_not_called()
+        self.assertTrue(pdf_content.startswith(b'%PDF'))
+        chunks = list(report_pdf.history_tables(self.snapshot['history']))
+        self.assertEqual(len(chunks), -(-len(self.snapshot['history']) // report_pdf.HISTORY_TABLE_CHUNK))
+
+    def test_history_table_cells_fit_columns(self):
+        """Test that table cells are wrapped to the measured column width"""
+        entry = dict(self.snapshot['history'][0], actor_name='Maksymilian Brzęczyszczykiewicz-Wielkopolski',
+                     description='Opis ' * 40 + 'https://example.com/' + 'a' * 120)
+        table = next(report_pdf.history_tables([entry]))
+        row = table._cellvalues[1]
+        for column in (1, 2, 3):
+            width = report_pdf.HISTORY_TABLE_WIDTHS[column] - report_pdf.HISTORY_CELL_PADDING
+            for line in row[column].split('\n'):
+                self.assertLessEqual(pdfmetrics.stringWidth(line, report_pdf.DEFAULT_FONT, report_pdf.HISTORY_FONT_SIZE),
+                                     width)
+        self.assertGreater(row[1].count('\n'), 0)
+
+    def test_render_in_worker_process(self):
+        """Test rendering in the process pool"""
+        pdf_content = render_service.render_pdf(self.snapshot)
+        self.assertTrue(pdf_content.startswith(b'%PDF'))
+
+    def test_full_queue_is_rejected(self):
+        """Test that renders over the queue limit fail fast"""
+        with mock.patch.object(render_service, '_slots', threading.BoundedSemaphore(1)):
+            render_service._slots.acquire()
+            with self.assertRaises(RenderUnavailable):
+                render_service.render_pdf(self.snapshot)
+
+
+class RenderReportsCommandTest(R2TestMixin, TestCase):
+    """Tests for the render_reports management command"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='client', password='testpass123')
+        self.orders = []
+        for i in range(3):
+            order = Order.objects.create(title=f'Zlecenie {i}', description='Opis', client=self.user, status='done')
+            order.log_event(self.user, 'status_change', 'Zakończono', old_value='in_progress', new_value='done')
+            self.orders.append(order)
+        Order.objects.create(title='W toku', description='Opis', client=self.user, status='in_progress')
+        # Zlecenie zamknięte w poprzednim okresie
+        Order.objects.filter(pk=self.orders[0].pk).update(updated_at=timezone.now() - timedelta(days=60))
+
+        self.since = (timezone.now() - timedelta(days=30)).date().isoformat()
+        self.out_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.out_dir)
+
+    def test_render_period_to_directory(self):
+        """Test rendering in worker processes into a directory"""
+        out = StringIO()
+        call_command('render_reports', '--since', self.since, '--out', self.out_dir, '--workers', '2', stdout=out)
+
+        expected = sorted(f'Raport_Koncowy_Zamowienia_{order.pk}.pdf' for order in self.orders[1:])
+        self.assertEqual(sorted(os.listdir(self.out_dir)), expected)
+        with open(os.path.join(self.out_dir, expected[0]), 'rb') as report_file:
+            self.assertTrue(report_file.read().startswith(b'%PDF'))
+        self.assertIn('2 report(s) rendered', out.getvalue())
+        self.assertIn('reports/s', out.getvalue())
+
+    def test_render_to_r2_with_bulk_queries(self):
+        """Test the upload to R2 and the number of queries"""
+        with mock.patch('files.render_service.RENDER_MODE', 'inline'), self.assertNumQueries(2):
+            call_command('render_reports', '--out', 'r2', stdout=StringIO())
+
+        listing = self.s3.list_objects_v2(Bucket=self.bucket, Prefix='reports/')
+        self.assertEqual(len(listing['Contents']), 3)
+
+    def test_invalid_date(self):
+        """Test validation of --since"""
+        with self.assertRaises(CommandError):
+            call_command('render_reports', '--since', '31-01-2026', '--out', self.out_dir)
+
+
+class FileListApiTest(APITestCase):
+    """Tests for the paginated file listing"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='manager', password='testpass123')
+        self.manager.groups.set([Group.objects.get_or_create(name='manager')[0]])
+        # Nowi użytkownicy trafiają domyślnie do grupy 'client'
+        self.customer = User.objects.create_user(username='customer', password='testpass123')
+        self.order = Order.objects.create(title='Sklep', description='Opis', client=self.customer)
+        self.other_order = Order.objects.create(title='Blog', description='Opis', client=self.customer)
+
+        self.files = []
+        for i in range(6):
+            uploader = User.objects.create_user(username=f'dev{i}', password='testpass123')
+            self.files.append(File.objects.create(
+                name=f'file{i}', file_type='pdf' if i % 2 else 'zip', uploaded_by=uploader,
+                order=self.order if i < 4 else self.other_order, visible_to_clients=i < 2,
+            ))
+        self.url = reverse('files-list-api')
+
+    def _list(self, user, **params):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_cursor_pagination_newest_first(self):
+        """Test that pages follow each other without gaps or duplicates"""
+        first = self._list(self.manager, page_size=4)
+        self.assertEqual([f['name'] for f in first['results']], ['file5', 'file4', 'file3', 'file2'])
+        self.assertIsNotNone(first['next'])
+
+        second = self.client.get(first['next']).data
+        self.assertEqual([f['name'] for f in second['results']], ['file1', 'file0'])
+        self.assertIsNone(second['next'])
+
+    def test_filters(self):
+        """Test order, file_type, uploaded_by and date range filters"""
+        names = lambda data: sorted(f['name'] for f in data['results'])
+        self.assertEqual(names(self._list(self.manager, order=self.other_order.id)), ['file4', 'file5'])
+        self.assertEqual(names(self._list(self.manager, order=self.order.id, file_type='pdf')), ['file1', 'file3'])
+        self.assertEqual(names(self._list(self.manager, uploaded_by=self.files[2].uploaded_by_id)), ['file2'])
+
+        File.objects.filter(pk=self.files[0].pk).update(created_at=timezone.now() - timedelta(days=10))
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        self.assertNotIn('file0', names(self._list(self.manager, created_after=since)))
+        self.assertEqual(names(self._list(self.manager, created_before=since)), ['file0'])
+
+    def test_client_sees_only_visible_files(self):
+        """Test the client visibility rule"""
+        data = self._list(self.customer)
+        self.assertEqual(sorted(f['name'] for f in data['results']), ['file0', 'file1'])
+
+    def test_query_count_does_not_depend_on_rows(self):
+        """Test that uploaders are joined instead of queried per file"""
+        self.client.force_authenticate(user=self.customer)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['uploaded_by'], 'dev1')
+
+    def test_invalid_filter(self):
+        """Test validation of filter values"""
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.get(self.url, {'file_type': 'exe'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DeduplicatedUploadTest(R2TestMixin, APITestCase):
+    """Tests for content-addressed deduplication of uploads"""
+
+    content = b'%PDF-1.4 specyfikacja ' * 100
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.orders = [Order.objects.create(title=f'Zlecenie {i}', description='Opis', client=self.user)
+                       for i in range(2)]
+
+    def _upload(self, order, content=None, name='spec.pdf'):
+        upload = io.BytesIO(content or self.content)
+        upload.name = name
+        response = self.client.post(reverse('files-upload-api'),
+                                    {'uploaded_file': upload, 'order': order.id, 'file_type': 'pdf'},
+                                    format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return File.objects.get(pk=response.data['id'])
+
+    def _object_keys(self):
+        return [item['Key'] for item in self.s3.list_objects_v2(Bucket=self.bucket).get('Contents', [])]
+
+    def test_same_content_is_stored_once(self):
+        """Test that a second upload of the same content reuses the R2 object"""
+        first = self._upload(self.orders[0])
+        second = self._upload(self.orders[1], name='kopia.pdf')
+
+        self.assertEqual(first.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(first.size, len(self.content))
+        self.assertEqual(second.sha256, first.sha256)
+        self.assertEqual(second.uploaded_file_url, first.uploaded_file_url)
+        self.assertEqual(len(self._object_keys()), 1)
+
+        other = self._upload(self.orders[1], content='inna treść'.encode())
+        self.assertNotEqual(other.uploaded_file_url, first.uploaded_file_url)
+        self.assertEqual(len(self._object_keys()), 2)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=100)
+    def test_hash_of_file_spooled_to_disk(self):
+        """Test hashing when the upload does not fit in memory"""
+        uploaded = self._upload(self.orders[0])
+        self.assertEqual(uploaded.sha256, hashlib.sha256(self.content).hexdigest())
+
+    def test_object_deleted_with_last_reference(self):
+        """Test that deleting a File removes the object only when unreferenced"""
+        first = self._upload(self.orders[0])
+        second = self._upload(self.orders[1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(len(self._object_keys()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self._object_keys(), [])
+
+
+    def test_reused_object_is_locked(self):
+        """Test that the row of a reused object is locked until the new File is committed"""
+        first = self._upload(self.orders[0])
+        with CaptureQueriesContext(connection) as queries:
+            self._upload(self.orders[1])
+        lookup = next(q['sql'] for q in queries.captured_queries if first.sha256 in q['sql'])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', lookup)
+
+
+class FileMetadataTest(R2TestMixin, APITestCase):
+    """Tests for size / content type / ETag capture and the backfill command"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.order = Order.objects.create(title='Zlecenie', description='Opis', client=self.user)
+
+    def test_sniff_content_type(self):
+        """Test detection from magic bytes, with the name only as a tie-breaker"""
+        self.assertEqual(sniff_content_type(b'%PDF-1.7 ...', 'raport.txt'), 'application/pdf')
+        self.assertEqual(sniff_content_type(b'\x89PNG\r\n\x1a\n....', 'logo'), 'image/png')
+        self.assertEqual(
+            sniff_content_type(b'PK\x03\x04....', 'umowa.docx'),
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        )
+        self.assertEqual(sniff_content_type(b'PK\x03\x04....', 'paczka'), 'application/zip')
+        self.assertEqual(sniff_content_type('zażółć'.encode(), 'notatka'), 'text/plain')
+        self.assertEqual(sniff_content_type(b'a;b\n1;2\n', 'dane.csv'), 'text/csv')
+        self.assertEqual(sniff_content_type(b'\x00\x01\x02', 'blob'), 'application/octet-stream')
+
+    def test_upload_records_metadata(self):
+        """Test that an upload through Django stores the sniffed type in the row and in R2"""
+        upload = io.BytesIO(b'%PDF-1.4 ' + os.urandom(2048))
+        upload.name = 'skan.bin'
+        response = self.client.post(reverse('files-upload-api'),
+                                    {'uploaded_file': upload, 'order': self.order.id, 'file_type': 'pdf'},
+                                    format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['content_type'], 'application/pdf')
+        self.assertEqual(response.data['size'], 2057)
+
+        file_obj = File.objects.get(pk=response.data['id'])
+        head = self.s3.head_object(Bucket=self.bucket, Key=storage.key_from_url(file_obj.uploaded_file_url))
+        self.assertEqual(head['ContentType'], 'application/pdf')
+
+    def _legacy_file(self, key, body, name='dokument', file_type='pdf'):
+        if body is not None:
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=body)
+        return File.objects.create(name=name, file_type=file_type, order=self.order, uploaded_by=self.user,
+                                   uploaded_file_url=f"{self.public_url}/{key}")
+
+    def test_backfill_command(self):
+        """Test filling metadata of rows created before it was recorded"""
+        pdf = self._legacy_file('uploads/old.pdf', b'%PDF-1.3 ' + b'x' * 5000)
+        empty = self._legacy_file('uploads/empty.txt', b'', name='pusty', file_type='txt')
+        missing = self._legacy_file('uploads/missing.pdf', None)
+        external = File.objects.create(name='link', order=self.order, uploaded_by=self.user,
+                                       uploaded_file_url='https://example.org/spec.pdf')
+        updated_at = File.objects.get(pk=pdf.pk).updated_at
+
+        out, err = StringIO(), StringIO()
+        call_command('backfill_file_metadata', '--batch-size', '2', '--workers', '4', stdout=out, stderr=err)
+
+        pdf.refresh_from_db()
+        self.assertEqual(pdf.size, 5009)
+        self.assertEqual(pdf.content_type, 'application/pdf')
+        self.assertEqual(pdf.etag, self.s3.head_object(Bucket=self.bucket, Key='uploads/old.pdf')['ETag'].strip('"'))
+        # Backfill nie unieważnia kluczy cache archiwów
+        self.assertEqual(pdf.updated_at, updated_at)
+
+        empty.refresh_from_db()
+        self.assertEqual((empty.size, empty.content_type), (0, 'text/plain'))
+        missing.refresh_from_db()
+        self.assertIsNone(missing.size)
+        external.refresh_from_db()
+        self.assertEqual(external.content_type, '')
+
+        self.assertIn('2 file(s) updated, 1 failed, 1 outside the bucket skipped', out.getvalue())
+        self.assertIn(f'File #{missing.pk}', err.getvalue())
+
+    def test_backfill_dry_run(self):
+        """Test that --dry-run does not save anything"""
+        file_obj = self._legacy_file('uploads/old.pdf', b'%PDF-1.3 test')
+        out = StringIO()
+        call_command('backfill_file_metadata', '--dry-run', stdout=out)
+
+        file_obj.refresh_from_db()
+        self.assertIsNone(file_obj.size)
+        self.assertIn('application/pdf', out.getvalue())
+        self.assertIn('1 file(s) would be updated', out.getvalue())
+
+
+class SingleFileDownloadTest(R2TestMixin, APITestCase):
+    """Tests for the single-file streaming download with Range support"""
+
+    content = os.urandom(300 * 1024)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.customer = User.objects.create_user(username='klient', password='testpass123')
+        self.customer.groups.set([Group.objects.get_or_create(name='client')[0]])
+        self.manager = User.objects.create_user(username='manager', password='testpass123')
+        self.manager.groups.set([Group.objects.get_or_create(name='manager')[0]])
+        order = Order.objects.create(title='Zlecenie', description='Opis', client=self.customer)
+
+        self.s3.put_object(Bucket=self.bucket, Key='uploads/plan.pdf', Body=self.content)
+        etag = self.s3.head_object(Bucket=self.bucket, Key='uploads/plan.pdf')['ETag'].strip('"')
+        self.file = File.objects.create(
+            name='plan zażółć', file_type='pdf', order=order, uploaded_by=self.manager, visible_to_clients=True,
+            uploaded_file_url=f"{self.public_url}/uploads/plan.pdf",
+            size=len(self.content), content_type='application/pdf', etag=etag,
+        )
+        self.url = reverse('files-file-download-api', args=[self.file.pk])
+        self.client.force_authenticate(user=self.customer)
+
+    def test_full_download(self):
+        """Test streaming the whole object"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn("filename*=utf-8''plan%20za%C5%BC%C3%B3%C5%82%C4%87.pdf", response['Content-Disposition'])
+
+    def test_range_requests(self):
+        """Test partial responses for bounded, open-ended and suffix ranges"""
+        cases = [
+            ('bytes=100-199', slice(100, 200)),
+            ('bytes=307000-', slice(307000, None)),
+            ('bytes=-50', slice(-50, None)),
+        ]
+        for range_header, expected in cases:
+            with self.subTest(range_header):
+                response = self.client.get(self.url, HTTP_RANGE=range_header)
+                self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+                body = b''.join(response.streaming_content)
+                self.assertEqual(body, self.content[expected])
+                self.assertEqual(response['Content-Length'], str(len(body)))
+                self.assertTrue(response['Content-Range'].endswith(f'/{len(self.content)}'))
+
+    def test_unsatisfiable_range(self):
+        """Test a range past the end of the object"""
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content) + 10}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range(self):
+        """Test that a stale If-Range validator returns the whole file"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=f'"{self.file.etag}"')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(b''.join(response.streaming_content)), len(self.content))
+
+    def test_hidden_file_for_client(self):
+        """Test that clients cannot download files hidden from them"""
+        File.objects.filter(pk=self.file.pk).update(visible_to_clients=False)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-0')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
+    def test_missing_object(self):
+        """Test a File row whose object is gone from R2"""
+        self.s3.delete_object(Bucket=self.bucket, Key='uploads/plan.pdf')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_redirect_to_presigned_url(self):
+        """Test the 302 to a presigned URL with a download file name"""
+        downloads._signed_url.cache_clear()
+        response = self.client.get(self.url, {'redirect': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+        fetched = requests.get(response['Location'], headers={'Range': 'bytes=0-99'})
+        self.assertEqual(fetched.status_code, 206)
+        self.assertEqual(fetched.content, self.content[:100])
+        self.assertEqual(fetched.headers['Content-Type'], 'application/pdf')
+        self.assertIn("plan%20za%C5%BC%C3%B3%C5%82%C4%87.pdf", fetched.headers['Content-Disposition'])
+
+    def test_presigned_urls_are_memoized(self):
+        """Test that repeated downloads within the TTL window reuse the signed URL"""
+        downloads._signed_url.cache_clear()
+        with mock.patch('files.downloads.DOWNLOAD_REDIRECT', True), \
+                mock.patch('files.downloads.time.time', return_value=1_000_000):
+            first = self.client.get(self.url)['Location']
+            second = self.client.get(self.url)['Location']
+        self.assertEqual(first, second)
+        self.assertEqual(downloads._signed_url.cache_info().misses, 1)
+
+        # Kolejne okno - nowy podpis
+        next_window = 1_000_000 + downloads.PRESIGNED_DOWNLOAD_TTL
+        with mock.patch('files.downloads.time.time', return_value=next_window):
+            self.assertEqual(self.client.get(self.url, {'redirect': '1'}).status_code, status.HTTP_302_FOUND)
+        self.assertEqual(downloads._signed_url.cache_info().misses, 2)
+        self.assertEqual(self.client.get(self.url, {'redirect': 'false'}).status_code, status.HTTP_200_OK)
+
+
+class ObjectCacheTest(R2TestMixin, APITestCase):
+    """Tests for the local disk read-through cache of R2 objects"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.order = Order.objects.create(title='Zlecenie', description='Opis', client=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        object_cache.reset_stats()
+        self.addCleanup(object_cache.reset_stats)
+
+    def _file(self, name, body):
+        key = f'uploads/{name}.pdf'
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body)
+        etag = self.s3.head_object(Bucket=self.bucket, Key=key)['ETag'].strip('"')
+        return File.objects.create(name=name, file_type='pdf', order=self.order, uploaded_by=self.user,
+                                   uploaded_file_url=f'{self.public_url}/{key}', size=len(body), etag=etag,
+                                   visible_to_clients=True)
+
+    def test_read_through(self):
+        """Test that the second read is served from disk and a new ETag misses"""
+        spec = self._file('spec', b'%PDF-1.4 v1')
+        for expected_hit in (False, True):
+            local_file, hit = object_cache.open_object(spec)
+            with local_file:
+                self.assertEqual(local_file.read(), b'%PDF-1.4 v1')
+            self.assertEqual(hit, expected_hit)
+
+        # Nowa wersja obiektu (inny ETag) nie może trafić w starą kopię
+        self.s3.put_object(Bucket=self.bucket, Key='uploads/spec.pdf', Body=b'%PDF-1.4 v2')
+        spec.etag = self.s3.head_object(Bucket=self.bucket, Key='uploads/spec.pdf')['ETag'].strip('"')
+        local_file, hit = object_cache.open_object(spec)
+        with local_file:
+            self.assertEqual(local_file.read(), b'%PDF-1.4 v2')
+        self.assertFalse(hit)
+
+        stats = object_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 2, 2))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test the size cap"""
+        files = [self._file(f'f{i}', bytes([i]) * 1000) for i in range(3)]
+        with mock.patch('files.object_cache.OBJECT_CACHE_MAX_BYTES', 2500):
+            for i, file_obj in enumerate(files[:2]):
+                object_cache.open_object(file_obj)[0].close()
+                path = object_cache.entry_path(storage.key_from_url(file_obj.uploaded_file_url), file_obj.etag)
+                os.utime(path, (1000 + i, 1000 + i))
+            # f0 użyty ponownie - najdawniej używany jest teraz f1
+            object_cache.open_object(files[0])[0].close()
+            object_cache.open_object(files[2])[0].close()
+
+            self.assertTrue(object_cache.open_object(files[0])[1])
+            self.assertFalse(object_cache.open_object(files[1])[1])
+        stats = object_cache.stats()
+        self.assertLessEqual(stats['bytes'], 2500)
+        self.assertEqual(stats['evictions'], 2)
+
+    def test_directory_is_walked_only_over_the_cap(self):
+        """Test that a miss under the size cap does not scan the cache directory"""
+        files = [self._file(f'f{i}', bytes([i]) * 1000) for i in range(3)]
+        with mock.patch('files.object_cache.OBJECT_CACHE_MAX_BYTES', 2500), \
+                mock.patch('files.object_cache.evict', wraps=object_cache.evict) as evict:
+            for file_obj in files[:2]:
+                object_cache.open_object(file_obj)[0].close()
+            evict.assert_not_called()
+            object_cache.open_object(files[2])[0].close()
+            evict.assert_called_once_with()
+
+    def test_counters_are_shared_through_the_cache_dir(self):
+        """Test that counters live next to the entries, not in the per-process Django cache"""
+        spec = self._file('spec', b'%PDF-1.4')
+        for _ in range(3):
+            object_cache.open_object(spec)[0].close()
+        cache.clear()
+
+        with open(os.path.join(object_cache.OBJECT_CACHE_DIR, object_cache.STATS_FILE)) as stats_file:
+            self.assertEqual(json.load(stats_file), {'hits': 2, 'misses': 1, 'evictions': 0, 'bytes': 8})
+        stats = object_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (2, 1, 1))
+
+    def test_large_objects_bypass_the_cache(self):
+        """Test that objects over the per-object limit and rows without ETag are not cached"""
+        spec = self._file('spec', b'x' * 2048)
+        self.assertTrue(object_cache.cacheable(spec))
+        with mock.patch('files.object_cache.OBJECT_CACHE_MAX_OBJECT_BYTES', 1024):
+            self.assertFalse(object_cache.cacheable(spec))
+        spec.etag = ''
+        self.assertFalse(object_cache.cacheable(spec))
+
+    def test_downloads_use_the_cache(self):
+        """Test the single-file and ZIP downloads"""
+        spec = self._file('spec', b'%PDF-1.4 ' + os.urandom(4096))
+        notes = self._file('notes', b'%PDF-1.4 notes')
+        url = reverse('files-file-download-api', args=[spec.pk])
+
+        first = self.client.get(url)
+        self.assertEqual(first['X-Object-Cache'], 'miss')
+        first_body = b''.join(first.streaming_content)
+        second = self.client.get(url)
+        self.assertEqual(second['X-Object-Cache'], 'hit')
+        self.assertEqual(b''.join(second.streaming_content), first_body)
+        self.assertEqual(second['Content-Length'], str(spec.size))
+
+        # Zakresy nadal obsługuje R2
+        partial = self.client.get(url, HTTP_RANGE='bytes=0-3')
+        self.assertEqual(b''.join(partial.streaming_content), b'%PDF')
+
+        zip_url = reverse('files-download-api', kwargs={'order_id': self.order.id})
+        with mock.patch('files.zip_cache.run_in_background'):
+            response = self.client.get(zip_url, {'file_ids': f'{spec.id},{notes.id}'})
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.read('spec.pdf'), first_body)
+        self.assertEqual(archive.read('notes.pdf'), b'%PDF-1.4 notes')
+        stats = object_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+
+    def test_stats_command(self):
+        """Test the object_cache_stats command"""
+        spec = self._file('spec', b'%PDF-1.4')
+        for _ in range(2):
+            object_cache.open_object(spec)[0].close()
+
+        out = StringIO()
+        call_command('object_cache_stats', '--clear', '--reset', stdout=out)
+        self.assertIn('1 hit(s), 1 miss(es), hit ratio 50.0%', out.getvalue())
+        self.assertIn('Entries: 0', out.getvalue())
+        self.assertEqual(object_cache.stats()['hits'], 0)
+
+
+class AsyncUploadTest(R2TestMixin, APITestCase):
+    """Tests for spooled asynchronous uploads"""
+
+    content = b'%PDF-1.4 ' + b'specyfikacja ' * 200
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.order = Order.objects.create(title='Zlecenie', description='Opis', client=self.user)
+
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, True)
+        spool_patch = mock.patch('files.upload_queue.UPLOAD_SPOOL_DIR', spool_dir)
+        spool_patch.start()
+        self.addCleanup(spool_patch.stop)
+
+    def _upload(self, content=None, **params):
+        upload = io.BytesIO(content or self.content)
+        upload.name = 'spec.pdf'
+        return self.client.post(reverse('files-upload-api'),
+                                {'uploaded_file': upload, 'order': self.order.id, 'file_type': 'pdf', **params},
+                                format='multipart')
+
+    def _spooled(self, file_obj):
+        return os.path.exists(upload_queue.spool_path(storage.key_from_url(file_obj.uploaded_file_url)))
+
+    def test_upload_is_pushed_after_response(self):
+        """Test 202 with an 'uploading' row, then the push to R2"""
+        finished = mock.Mock()
+        upload_queue.upload_finished.connect(finished)
+        self.addCleanup(upload_queue.upload_finished.disconnect, finished)
+
+        enqueue_patch = mock.patch('files.views.enqueue_upload')
+        enqueue = enqueue_patch.start()
+        self.addCleanup(enqueue_patch.stop)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self._upload(**{'async': 'true', 'visible_to_clients': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'uploading')
+        self.assertEqual(response['Location'], reverse('files-detail-api', args=[response.data['id']]))
+
+        file_obj = File.objects.get(pk=response.data['id'])
+        self.assertTrue(self._spooled(file_obj))
+        self.assertEqual(self.s3.list_objects_v2(Bucket=self.bucket)['KeyCount'], 0)
+        # Plik jeszcze niedostępny do pobrania
+        download = self.client.get(reverse('files-file-download-api', args=[file_obj.pk]))
+        self.assertEqual(download.status_code, status.HTTP_409_CONFLICT)
+
+        for callback in callbacks:
+            callback()
+        enqueue.assert_called_once_with(file_obj.pk)
+        self.assertTrue(upload_queue.push_upload(file_obj.pk))
+
+        file_obj.refresh_from_db()
+        self.assertEqual(file_obj.status, 'ready')
+        self.assertFalse(self._spooled(file_obj))
+        stored = self.s3.get_object(Bucket=self.bucket, Key=storage.key_from_url(file_obj.uploaded_file_url))
+        self.assertEqual(stored['Body'].read(), self.content)
+        self.assertEqual(stored['ContentType'], 'application/pdf')
+        self.assertEqual(file_obj.etag, stored['ETag'].strip('"'))
+        finished.assert_called_once()
+        self.assertTrue(finished.call_args.kwargs['succeeded'])
+
+    def test_pending_upload_is_not_a_dedup_source(self):
+        """Test that identical content uploaded meanwhile gets its own object"""
+        with mock.patch('files.views.enqueue_upload'):
+            pending = self._upload(**{'async': 'true'})
+        response = self._upload()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(response.data['uploaded_file_url'], pending.data['uploaded_file_url'])
+
+    def test_failed_push_and_retry(self):
+        """Test the 'failed' state and push_spooled_uploads --retry-failed"""
+        with mock.patch('files.upload_queue.ASYNC_UPLOADS', True), mock.patch('files.views.enqueue_upload'):
+            response = self._upload()
+        file_id = response.data['id']
+
+        with mock.patch('files.upload_queue.get_r2_client') as client:
+            client.return_value.upload_file.side_effect = OSError('timeout')
+            self.assertFalse(upload_queue.push_upload(file_id))
+        file_obj = File.objects.get(pk=file_id)
+        self.assertEqual(file_obj.status, 'failed')
+        self.assertTrue(self._spooled(file_obj))
+
+        # Wątki komendy nie widzą transakcji testu - wykonanie w bieżącym wątku
+        out = StringIO()
+        with mock.patch('files.management.commands.push_spooled_uploads.submit',
+                        side_effect=lambda executor, target, *args: mock.Mock(result=lambda: target(*args))):
+            call_command('push_spooled_uploads', '--older-than-minutes', '0', '--retry-failed', stdout=out)
+        self.assertIn('1 upload(s) pushed, 0 failed, 0 lost', out.getvalue())
+        file_obj.refresh_from_db()
+        self.assertEqual(file_obj.status, 'ready')
+
+    def test_lost_spool_file(self):
+        """Test that a stale 'uploading' row without a spooled file is marked failed"""
+        with mock.patch('files.views.enqueue_upload'):
+            response = self._upload(**{'async': '1'})
+        file_obj = File.objects.get(pk=response.data['id'])
+        upload_queue.discard_spool(storage.key_from_url(file_obj.uploaded_file_url))
+
+        out, err = StringIO(), StringIO()
+        call_command('push_spooled_uploads', '--older-than-minutes', '0', stdout=out, stderr=err)
+        file_obj.refresh_from_db()
+        self.assertEqual(file_obj.status, 'failed')
+        self.assertIn('0 upload(s) pushed, 0 failed, 1 lost', out.getvalue())
+
+    def test_deleting_pending_upload_discards_spool(self):
+        """Test cleanup of the spooled file"""
+        with mock.patch('files.views.enqueue_upload'):
+            response = self._upload(**{'async': 'true'})
+        file_obj = File.objects.get(pk=response.data['id'])
+        with self.captureOnCommitCallbacks(execute=True):
+            file_obj.delete()
+        self.assertFalse(self._spooled(file_obj))
+
+
+class BulkFileOperationsTest(R2TestMixin, APITestCase):
+    """Tests for bulk visibility update and bulk delete"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='manager', password='testpass123')
+        self.manager.groups.set([Group.objects.get_or_create(name='manager')[0]])
+        self.customer = User.objects.create_user(username='klient', password='testpass123')
+        self.customer.groups.set([Group.objects.get_or_create(name='client')[0]])
+        self.client.force_authenticate(user=self.manager)
+        self.order = Order.objects.create(title='Zlecenie', description='Opis', client=self.customer)
+
+        self.files = []
+        for i in range(5):
+            key = f'uploads/f{i}.pdf'
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=f'plik {i}'.encode())
+            self.files.append(File.objects.create(name=f'f{i}', file_type='pdf', order=self.order,
+                                                  uploaded_by=self.manager,
+                                                  uploaded_file_url=f'{self.public_url}/{key}'))
+
+    def _keys(self):
+        return sorted(item['Key'] for item in self.s3.list_objects_v2(Bucket=self.bucket).get('Contents', []))
+
+    def test_bulk_visibility_is_one_update(self):
+        """Test publishing many files with a single UPDATE"""
+        ids = [f.id for f in self.files[:3]]
+        with mock.patch('files.views.invalidate_order_archives') as invalidate, \
+                self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(3):
+            # grupy użytkownika, zlecenia plików, UPDATE
+            response = self.client.patch(reverse('files-bulk-visibility-api'),
+                                         {'ids': ids, 'visible_to_clients': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 3)
+        invalidate.assert_called_once_with(self.order.id)
+
+        self.assertEqual(set(File.objects.filter(visible_to_clients=True).values_list('id', flat=True)), set(ids))
+        old, new = self.files[0], File.objects.get(pk=self.files[0].pk)
+        self.assertGreater(new.updated_at, old.updated_at)
+
+    def test_bulk_visibility_validation(self):
+        """Test invalid payloads and client access"""
+        url = reverse('files-bulk-visibility-api')
+        self.assertEqual(self.client.patch(url, {'ids': [], 'visible_to_clients': True}, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.patch(url, {'ids': ['x'], 'visible_to_clients': True},
+                                           format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.patch(url, {'ids': [1], 'visible_to_clients': 'maybe'},
+                                           format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.patch(url, {'ids': [self.files[0].id], 'visible_to_clients': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_delete_batches_r2_deletes(self):
+        """Test that objects are removed with batched DeleteObjects, keeping shared ones"""
+        # Kopia (deduplikacja) f0 w innym wierszu - obiekt musi zostać
+        File.objects.create(name='kopia', order=self.order, uploaded_file_url=self.files[0].uploaded_file_url)
+        ids = [f.id for f in self.files[:4]] + [999999]
+
+        with mock.patch('files.blobs.DELETE_BATCH_SIZE', 2), \
+                mock.patch('files.blobs.release_blob') as single_release, \
+                mock.patch.object(storage.get_r2_client(), 'delete_objects',
+                                  wraps=storage.get_r2_client().delete_objects) as delete_objects, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('files-bulk-delete-api'), {'ids': ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'deleted': 4, 'missing': [999999]})
+        single_release.assert_not_called()
+        # 3 klucze do usunięcia w partiach po 2
+        self.assertEqual(delete_objects.call_count, 2)
+        self.assertEqual(self._keys(), ['uploads/f0.pdf', 'uploads/f4.pdf'])
+        self.assertEqual(File.objects.count(), 2)
+
+    def test_bulk_delete_invalidates_zip_cache_once_per_order(self):
+        """Test that post_delete of every row does not start its own R2 listing"""
+        other = Order.objects.create(title='Inne', description='Opis', client=self.customer)
+        extra = File.objects.create(name='inny', order=other, uploaded_file_url=f'{self.public_url}/uploads/x.pdf')
+        ids = [f.id for f in self.files] + [extra.id]
+
+        with mock.patch('files.views.invalidate_order_archives') as invalidate, \
+                mock.patch('files.zip_cache.run_in_background') as background, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('files-bulk-delete-api'), {'ids': ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        background.assert_not_called()
+        self.assertEqual(sorted(call.args[0] for call in invalidate.call_args_list), [self.order.id, other.id])
+
+    def test_single_delete_still_releases_object(self):
+        """Test that deleting one File outside a bulk delete keeps the per-file path"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.files[0].delete()
+        self.assertNotIn('uploads/f0.pdf', self._keys())
+
+    def test_bulk_delete_forbidden_for_clients(self):
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.post(reverse('files-bulk-delete-api'), {'ids': [self.files[0].id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(File.objects.filter(pk=self.files[0].pk).exists())
+
+
+class ReconcileR2OrphansTest(R2TestMixin, TestCase):
+    """Tests for the reconcile_r2_orphans management command"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        order = Order.objects.create(title='Zlecenie', description='Opis', client=self.user)
+        for i in range(3):
+            key = f'uploads/plik{i}.pdf'
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=b'x' * 100)
+            File.objects.create(name=f'plik{i}', order=order, uploaded_file_url=f'{self.public_url}/{key}')
+        for i in range(3):
+            self.s3.put_object(Bucket=self.bucket, Key=f'uploads/sierota{i}.pdf', Body=b'y' * 1024 * 512)
+        self.s3.put_object(Bucket=self.bucket, Key='cache/zips/order_1/a.zip', Body=b'zip')
+
+    def _keys(self):
+        return sorted(item['Key'] for item in self.s3.list_objects_v2(Bucket=self.bucket)['Contents'])
+
+    def _run(self, *args, days_later=2):
+        out = StringIO()
+        later = timezone.now() + timedelta(days=days_later)
+        with mock.patch('files.management.commands.reconcile_r2_orphans.timezone.now', return_value=later), \
+                mock.patch.object(storage.get_r2_client(), 'delete_objects',
+                                  wraps=storage.get_r2_client().delete_objects) as delete_objects:
+            call_command('reconcile_r2_orphans', *args, stdout=out)
+        return out.getvalue(), delete_objects.call_count
+
+    def test_orphans_within_grace_period_are_kept(self):
+        output, calls = self._run(days_later=0)
+        self.assertIn('3 unreferenced within the grace period', output)
+        self.assertIn('0 of 0 orphan(s) deleted', output)
+        self.assertEqual(calls, 0)
+        self.assertEqual(len(self._keys()), 7)
+
+    def test_orphans_are_deleted_in_batches(self):
+        """Test batched deletion and the reclaimed bytes report"""
+        output, calls = self._run('--batch-size', '2')
+        self.assertEqual(calls, 2)
+        self.assertIn('Scanned 6 object(s), 3 referenced key(s)', output)
+        self.assertIn('3 of 3 orphan(s) deleted, 1.50 MiB reclaimed', output)
+        self.assertEqual(self._keys(), [
+            'cache/zips/order_1/a.zip', 'uploads/plik0.pdf', 'uploads/plik1.pdf', 'uploads/plik2.pdf',
+        ])
+
+    def test_dry_run(self):
+        output, calls = self._run('--dry-run', '--verbosity', '2')
+        self.assertEqual(calls, 0)
+        self.assertIn('uploads/sierota0.pdf', output)
+        self.assertIn('3 orphan(s) would be deleted, 1.50 MiB reclaimable', output)
+        self.assertEqual(len(self._keys()), 7)
+
+    def test_row_created_during_scan_is_not_deleted(self):
+        """Test the re-check against the database before each batch"""
+        original = ReconcileCommand._referenced_keys
+
+        def stale_snapshot(command, prefix):
+            keys = original(command, prefix)
+            File.objects.create(name='nowy', uploaded_file_url=f'{self.public_url}/uploads/sierota0.pdf')
+            return keys
+
+        with mock.patch.object(ReconcileCommand, '_referenced_keys', stale_snapshot):
+            output, _ = self._run()
+        self.assertIn('2 of 3 orphan(s) deleted', output)
+        self.assertIn('uploads/sierota0.pdf', self._keys())
+
+
+class ZipExportJobTest(R2TestMixin, APITestCase):
+    """Tests for background ZIP exports built into R2"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='manager', password='testpass123')
+        self.manager.groups.set([Group.objects.get_or_create(name='manager')[0]])
+        self.customer = User.objects.create_user(username='klient', password='testpass123')
+        self.customer.groups.set([Group.objects.get_or_create(name='client')[0]])
+        self.client.force_authenticate(user=self.manager)
+        self.order = Order.objects.create(title='Zlecenie', description='Opis', client=self.customer)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        # Minimalny rozmiar części, żeby archiwum trafiło do R2 w kilku częściach
+        part_size = mock.patch('files.exports.EXPORT_PART_SIZE', storage.MULTIPART_MIN_PART_SIZE)
+        part_size.start()
+        self.addCleanup(part_size.stop)
+        self.enqueue = mock.patch('files.exports.enqueue_export')
+        self.enqueue.start()
+        self.addCleanup(self.enqueue.stop)
+
+        self.files = []
+        for i in range(3):
+            key = f'uploads/duzy{i}.pdf'
+            # Losowa zawartość - bez kompresji archiwum ma ok. 9 MiB
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=os.urandom(3 * 1024 * 1024))
+            self.files.append(File.objects.create(name=f'duzy{i}', file_type='pdf', order=self.order,
+                                                  uploaded_by=self.manager,
+                                                  uploaded_file_url=f'{self.public_url}/{key}'))
+
+    def _create(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('files-download-jobs-api', kwargs={'order_id': self.order.id}),
+                                    data, format='json')
+
+    def test_export_builds_archive_in_r2(self):
+        """Test multipart build, progress and the presigned URL of a finished job"""
+        response = self._create()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], ZipExportJob.STATUS_PENDING)
+        self.assertIsNone(response.data['download_url'])
+        job = ZipExportJob.objects.get(pk=response.data['id'])
+        self.assertEqual(response['Location'], reverse('files-download-job-api', args=[job.pk]))
+        exports.enqueue_export.assert_called_once_with(job.pk)
+
+        with mock.patch.object(self.s3, 'upload_part', wraps=self.s3.upload_part) as upload_part:
+            self.assertTrue(exports.build_export(job.pk, s3=self.s3))
+        self.assertEqual(upload_part.call_count, 2)
+
+        detail = self.client.get(response['Location'])
+        self.assertEqual(detail.data['status'], ZipExportJob.STATUS_DONE)
+        self.assertEqual(detail.data['files_done'], 3)
+        self.assertEqual(detail.data['files_total'], 3)
+        self.assertGreater(detail.data['bytes_written'], 9 * 1024 * 1024)
+        self.assertIn(job.archive_key, detail.data['download_url'])
+
+        body = self.s3.get_object(Bucket=self.bucket, Key=job.archive_key)['Body'].read()
+        self.assertEqual(len(body), detail.data['bytes_written'])
+        archive = zipfile.ZipFile(io.BytesIO(body))
+        self.assertEqual(sorted(archive.namelist()), ['duzy0.pdf', 'duzy1.pdf', 'duzy2.pdf'])
+        self.assertIsNone(archive.testzip())
+
+        # Zwykłe pobieranie ZIP tego samego zestawu trafia w gotowe archiwum
+        download = self.client.get(reverse('files-download-api', kwargs={'order_id': self.order.id}),
+                                   {'file_ids': ','.join(str(f.id) for f in self.files), 'redirect': '1'})
+        self.assertEqual(download.status_code, status.HTTP_302_FOUND)
+
+    def test_invalidated_export_expires(self):
+        """Test that a finished job does not hand out a URL to an archive dropped by invalidation"""
+        response = self._create()
+        job = ZipExportJob.objects.get(pk=response.data['id'])
+        exports.build_export(job.pk, s3=self.s3)
+        self.assertFalse(self.client.get(response['Location']).data['expired'])
+
+        invalidate_order_archives(self.order.id, s3=self.s3)
+        detail = self.client.get(response['Location'])
+        self.assertEqual(detail.data['status'], ZipExportJob.STATUS_DONE)
+        self.assertTrue(detail.data['expired'])
+        self.assertIsNone(detail.data['download_url'])
+
+        # Ponowne zlecenie buduje archiwum od nowa
+        again = self._create()
+        self.assertEqual(again.status_code, status.HTTP_202_ACCEPTED)
+        self.assertNotEqual(again.data['id'], job.pk)
+        self.assertFalse(again.data['expired'])
+
+    def test_identical_jobs_are_coalesced(self):
+        """Test that a second request for the same files returns the active job"""
+        first = self._create(file_ids=[f.id for f in self.files[:2]])
+        second = self._create(file_ids=f'{self.files[1].id},{self.files[0].id}')
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(exports.enqueue_export.call_count, 1)
+
+
+        # Zadanie bez postępu (np. po restarcie workera) nie blokuje nowego
+        ZipExportJob.objects.filter(pk=first.data['id']).update(updated_at=timezone.now() - timedelta(hours=1))
+        retried = self._create(file_ids=[f.id for f in self.files[:2]])
+        self.assertEqual(retried.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(ZipExportJob.objects.get(pk=first.data['id']).status, ZipExportJob.STATUS_FAILED)
+        first = retried
+
+        # Inny zestaw plików - osobne zadanie
+        other = self._create(file_ids=[self.files[2].id])
+        self.assertEqual(other.status_code, status.HTTP_202_ACCEPTED)
+
+        # Gotowe archiwum wciąż w cache - nowe zadanie nie powstaje
+        exports.build_export(first.data['id'], s3=self.s3)
+        again = self._create(file_ids=[f.id for f in self.files[:2]])
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(again.data['status'], ZipExportJob.STATUS_DONE)
+        self.assertEqual(ZipExportJob.objects.count(), 3)
+
+    def test_incomplete_export_fails(self):
+        """Test that an archive with files missing in R2 is not stored under the cache key"""
+        self.s3.delete_object(Bucket=self.bucket, Key='uploads/duzy1.pdf')
+        job = ZipExportJob.objects.get(pk=self._create().data['id'])
+        self.assertFalse(exports.build_export(job.pk, s3=self.s3))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ZipExportJob.STATUS_FAILED)
+        self.assertEqual(job.files_done, 2)
+        self.assertIn('1 z 3', job.error)
+        self.assertNotIn('Uploads', self.s3.list_multipart_uploads(Bucket=self.bucket))
+        self.assertEqual(self.s3.list_objects_v2(Bucket=self.bucket, Prefix='cache/zips/')['KeyCount'], 0)
+
+        download = self.client.get(reverse('files-download-api', kwargs={'order_id': self.order.id}),
+                                   {'file_ids': ','.join(str(f.id) for f in self.files)})
+        self.assertEqual(download['X-Archive-Cache'], 'miss')
+
+    def test_coalesced_job_is_visible_to_other_clients(self):
+        """Test that a client handed another client's job can poll it"""
+        File.objects.filter(pk__in=[f.pk for f in self.files]).update(visible_to_clients=True)
+        other = User.objects.create_user(username='klient2', password='testpass123')
+        other.groups.set([Group.objects.get_or_create(name='client')[0]])
+
+        self.client.force_authenticate(user=self.customer)
+        first = self._create()
+        self.client.force_authenticate(user=other)
+        second = self._create()
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(self.client.get(second['Location']).status_code, status.HTTP_200_OK)
+
+        # Plik archiwum ukryty przed klientami - dostęp ma tylko zlecający
+        File.objects.filter(pk=self.files[0].pk).update(visible_to_clients=False)
+        self.assertEqual(self.client.get(second['Location']).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.client.get(first['Location']).status_code, status.HTTP_200_OK)
+
+    def test_failed_export_aborts_upload(self):
+        """Test that an R2 error marks the job failed and leaves no multipart upload"""
+        job = ZipExportJob.objects.get(pk=self._create().data['id'])
+        with mock.patch.object(self.s3, 'complete_multipart_upload', side_effect=RuntimeError('R2 niedostępne')):
+            self.assertFalse(exports.build_export(job.pk, s3=self.s3))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ZipExportJob.STATUS_FAILED)
+        self.assertIn('R2 niedostępne', job.error)
+        self.assertNotIn('Uploads', self.s3.list_multipart_uploads(Bucket=self.bucket))
+        # Zadanie zakończone nie jest budowane ponownie
+        self.assertFalse(exports.build_export(job.pk, s3=self.s3))
+
+    def test_job_access(self):
+        """Test validation and that clients only see their own jobs"""
+        url = reverse('files-download-jobs-api', kwargs={'order_id': self.order.id})
+        self.assertEqual(self.client.post(url, {'file_ids': 'x'}, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(url, {'file_ids': [999999]}, format='json').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        job_url = self._create()['Location']
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.client.get(job_url).status_code, status.HTTP_403_FORBIDDEN)
+        # Pliki niewidoczne dla klienta
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, status.HTTP_404_NOT_FOUND)
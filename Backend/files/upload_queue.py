@@ -0,0 +1,113 @@
+"""
+files/upload_queue.py
+
+Asynchronous uploads: the request only spools the file to local disk.
+
+upload_file_api (?async=true or R2_ASYNC_UPLOADS) writes the received
+file to R2_UPLOAD_SPOOL_DIR, creates the File row with status
+'uploading' and answers 202. After commit the row is queued on a
+per-process thread pool (R2_ASYNC_UPLOAD_WORKERS concurrent PUTs) that
+pushes the spooled file to R2 and moves the row to 'ready' or 'failed'.
+Clients poll the file detail endpoint; other code can subscribe to the
+`upload_finished` signal. Rows left behind by a restarted process are
+picked up by the push_spooled_uploads command.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .background import WorkerPool
+from .models import File
+from .storage import get_r2_client, key_from_url
+from . import storage
+
+
+logger = logging.getLogger(__name__)
+
+ASYNC_UPLOADS = os.getenv("R2_ASYNC_UPLOADS", "false").lower() in ('1', 'true', 'yes')
+ASYNC_UPLOAD_WORKERS = int(os.getenv("R2_ASYNC_UPLOAD_WORKERS", 4))
+UPLOAD_SPOOL_DIR = os.getenv("R2_UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "itflow-upload-spool"))
+
+# Wysyłany po zakończeniu uploadu: sender=File, file=<File>, succeeded=<bool>
+upload_finished = Signal()
+
+_pool = WorkerPool(ASYNC_UPLOAD_WORKERS, 'r2-upload')
+
+
+def wants_async(request):
+    """?async=true/false (or an "async" form field) overrides the R2_ASYNC_UPLOADS default."""
+    value = request.query_params.get('async', request.data.get('async'))
+    if value is None:
+        return ASYNC_UPLOADS
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def spool_path(file_key):
+    return os.path.join(UPLOAD_SPOOL_DIR, hashlib.sha256(file_key.encode()).hexdigest())
+
+
+def spool_upload(uploaded_file, file_key):
+    """Copies the received file to the spool directory (temporary file + rename)."""
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_SPOOL_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as spool_file:
+            for chunk in uploaded_file.chunks():
+                spool_file.write(chunk)
+        os.replace(temp_path, spool_path(file_key))
+    except BaseException:
+        discard_spool(temp_path=temp_path)
+        raise
+
+
+def discard_spool(file_key=None, temp_path=None):
+    try:
+        os.remove(temp_path or spool_path(file_key))
+    except FileNotFoundError:
+        pass
+
+
+def enqueue_upload(file_id):
+    return _pool.submit(push_upload, file_id)
+
+
+def push_upload(file_id, s3=None):
+    """
+    Uploads the spooled file of an 'uploading' row to R2.
+
+    Returns:
+        bool: True if the row is now 'ready'; False if it failed or was not pending
+    """
+    file_obj = File.objects.filter(pk=file_id, status=File.STATUS_UPLOADING).first()
+    if file_obj is None:
+        return False
+
+    s3 = s3 or get_r2_client()
+    file_key = key_from_url(file_obj.uploaded_file_url)
+    extra_args = {'ContentType': file_obj.content_type} if file_obj.content_type else None
+    try:
+        s3.upload_file(spool_path(file_key), storage.CLOUDFLARE_R2_BUCKET, file_key, ExtraArgs=extra_args)
+        etag = s3.head_object(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=file_key).get('ETag', '').strip('"')
+    except Exception as e:
+        # Plik w katalogu spool zostaje - push_spooled_uploads --retry-failed
+        logger.warning("Nie udało się przesłać pliku #%s do R2: %s", file_id, e)
+        updated = File.objects.filter(pk=file_id, status=File.STATUS_UPLOADING).update(
+            status=File.STATUS_FAILED, updated_at=timezone.now()
+        )
+        succeeded = False
+    else:
+        discard_spool(file_key)
+        updated = File.objects.filter(pk=file_id, status=File.STATUS_UPLOADING).update(
+            status=File.STATUS_READY, etag=etag, updated_at=timezone.now()
+        )
+        succeeded = True
+
+    if updated:
+        file_obj.refresh_from_db()
+        upload_finished.send(sender=File, file=file_obj, succeeded=succeeded)
+    return succeeded and bool(updated)
@@ -4,19 +4,39 @@ from django.urls import path
 from .views import (
     files_list_api,
     file_detail_api,
+    download_file_api,
     upload_file_api,
+    presign_upload_api,
+    upload_confirm_api,
+    multipart_initiate_api,
+    multipart_parts_api,
+    multipart_complete_api,
+    multipart_abort_api,
     files_by_order_api,
     update_visible_to_clients_api,
+    bulk_visibility_api,
+    bulk_delete_api,
     download_files_api,
+    download_jobs_api,
+    download_job_detail_api,
     generate_final_report_pdf_api,  # <--- DODANY IMPORT
 )
 
 urlpatterns = [
     path('all-files/', files_list_api, name='files-list-api'),
     path('upload/', upload_file_api, name='files-upload-api'),
+    path('upload/presign/', presign_upload_api, name='files-upload-presign-api'),
+    path('upload/confirm/', upload_confirm_api, name='files-upload-confirm-api'),
+    path('upload/multipart/', multipart_initiate_api, name='files-multipart-initiate-api'),
+    path('upload/multipart/parts/', multipart_parts_api, name='files-multipart-parts-api'),
+    path('upload/multipart/complete/', multipart_complete_api, name='files-multipart-complete-api'),
+    path('upload/multipart/abort/', multipart_abort_api, name='files-multipart-abort-api'),
     path('<int:pk>/', file_detail_api, name='files-detail-api'),
+    path('<int:pk>/download/', download_file_api, name='files-file-download-api'),
     path('order/<int:order_id>/', files_by_order_api, name='files-by-order-api'),
     path('<int:pk>/visibility/', update_visible_to_clients_api, name='file-visibility-api'),
+    path('bulk/visibility/', bulk_visibility_api, name='files-bulk-visibility-api'),
+    path('bulk/delete/', bulk_delete_api, name='files-bulk-delete-api'),
 
     # -----------------------------------------------------------
     # Istniejący URL do pobierania wielu plików jako ZIP
@@ -25,6 +45,13 @@ urlpatterns = [
         download_files_api,
         name='files-download-api'
     ),
+    # Eksport ZIP w tle (duże zlecenia)
+    path(
+        'order/<int:order_id>/download-jobs/',
+        download_jobs_api,
+        name='files-download-jobs-api'
+    ),
+    path('download-jobs/<int:job_id>/', download_job_detail_api, name='files-download-job-api'),
     # -----------------------------------------------------------
     # NOWY URL do pobierania raportu PDF
     path(
@@ -5,30 +5,37 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from .models import File
-from .serializers import FileSerializer
-import boto3, os, io
-import zipfile
+from .models import File, ZipExportJob
+from .serializers import FileSerializer, ZipExportJobSerializer
+from .archives import prefetched_r2_entries, stream_zip
+from .downloads import ObjectNotFound, redirect_to_file, redirect_to_object, stream_file, wants_redirect
+from .listing import FileCursorPagination, FileFilter, is_client, visible_files
+from .blobs import batched_release, find_blob_url, hashing_upload_handlers, release_blobs
+from .exports import create_export_job
+from .metadata import fetch_object_metadata
+from .upload_queue import discard_spool, enqueue_upload, spool_upload, wants_async
+from .zip_cache import (
+    archive_cache_key, batched_invalidation, invalidate_order_archives, is_cached_archive, open_cached_archive,
+    tee_to_cache,
+)
+from .reports import get_report, report_filename
+from .render_service import RENDER_RETRY_AFTER, RenderUnavailable
+from . import storage
+from .storage import MULTIPART_MIN_PART_SIZE, UPLOAD_PREFIX, get_r2_client, public_url_for_key
+import os
+from botocore.exceptions import ClientError
+from django.core import signing
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
 from datetime import datetime
 from django.conf import settings  # DODANY IMPORT DLA ŚCIEŻEK
-
-# Import dla ReportLab
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
-from reportlab.lib import colors
-from reportlab.platypus import Table, TableStyle
-
-# 🚨 DODANE IMPORTY DLA OBSŁUGI CZCIONEK TTF
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from orderLog.feed import invalidate_feed, visible_orders
 
 # ===============================================================
 # 🔥 NOWE IMPORTY MODELI Z BAZE DANYCH
@@ -64,78 +71,29 @@ except ImportError:
         "WARNING: Order or OrderLog models could not be imported. PDF generation will rely on dummy classes.")
 # ===============================================================
 
-# --- Stałe konfiguracyjne R2 (bez zmian) ---
-CLOUDFLARE_R2_ENDPOINT = os.getenv("CLOUDFLARE_R2_ENDPOINT")
-CLOUDFLARE_R2_BUCKET = os.getenv("CLOUDFLARE_R2_BUCKET_NAME")
-CLOUDFLARE_R2_KEY = os.getenv("CLOUDFLARE_R2_ACCESS_KEY_ID")
-CLOUDFLARE_R2_SECRET = os.getenv("CLOUDFLARE_R2_SECRET_ACCESS_KEY")
-CLOUDFLARE_PUBLIC_URL = os.getenv("CLOUDFLARE_PUBLIC_URL")
-
-# --- Stałe konfiguracyjne Firmy (Raport) ---
-COMPANY_NAME = "ITFlow Sp. z o.o."
-COMPANY_ADDRESS = "ul. Technologiczna 10, 00-001 Warszawa"
-COMPANY_NIP = "123-456-78-90"
-COMPANY_PHONE = "+48 123 456 789"
-
-# ----------------------------------------------------
-# 🚨 KONFIGURACJA CZCIONEK DLA POLSKICH ZNAKÓW
-# ----------------------------------------------------
-POLISH_FONT = 'DeJa'
-POLISH_FONT_BOLD = 'DeJaBold'
-
-try:
-    # Używamy ścieżki względnej do bieżącego katalogu views.py, aby znaleźć pliki w files/fonts/
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Upewnij się, że pliki TTF mają poprawne nazwy
-    font_normal_path = os.path.join(current_dir, 'fonts', 'DejaVuSans.ttf')
-    font_bold_path = os.path.join(current_dir, 'fonts', 'DejaVuSans-Bold.ttf')
-
-    # Sprawdzenie istnienia plików i rejestracja
-    if os.path.exists(font_normal_path) and os.path.exists(font_bold_path):
-        pdfmetrics.registerFont(TTFont(POLISH_FONT, font_normal_path))
-        pdfmetrics.registerFont(TTFont(POLISH_FONT_BOLD, font_bold_path))
-
-        pdfmetrics.registerFontFamily(POLISH_FONT, normal=POLISH_FONT, bold=POLISH_FONT_BOLD)
-
-        DEFAULT_FONT = POLISH_FONT
-        DEFAULT_FONT_BOLD = POLISH_FONT_BOLD
-        print("INFO: Polskie czcionki TTF zarejestrowane pomyślnie.")
-    else:
-        # Fallback, jeśli pliki TTF nie zostały znalezione
-        # BARDZO WAŻNE: W tym miejscu musisz sprawdzić, czy pliki na pewno są we właściwej lokalizacji
-        raise FileNotFoundError("Brak plików czcionek TTF w files/fonts/ - upewnij się, że są tam 'DejaVuSans.ttf' i 'DejaVuSans-Bold.ttf'.")
-
-except Exception as e:
-    print(f"OSTRZEŻENIE: Błąd rejestracji czcionek: {e}. Używane są domyślne ReportLabowe (bez polskich znaków).")
-    DEFAULT_FONT = 'Helvetica'
-    DEFAULT_FONT_BOLD = 'Helvetica-Bold'
-
-
-# ----------------------------------------------------
+# --- Konfiguracja R2 i współdzielony klient: files/storage.py ---
+# Czas ważności podpisanych URL-i do bezpośredniego uploadu (sekundy)
+PRESIGNED_UPLOAD_TTL = int(os.getenv("R2_PRESIGNED_UPLOAD_TTL", 15 * 60))
+UPLOAD_TOKEN_SALT = "files.direct-upload"
+# Upload wieloczęściowy: limity S3/R2 i maks. czas wznawiania (sekundy)
+MULTIPART_MAX_PARTS = 10000
+MULTIPART_UPLOAD_MAX_AGE = int(os.getenv("R2_MULTIPART_UPLOAD_MAX_AGE", 7 * 24 * 3600))
 
-
-# Inicjalizacja klienta S3 dla Cloudflare R2 (bez zmian)
-def get_r2_client():
-    session = boto3.session.Session()
-    return session.client(
-        's3',
-        endpoint_url=CLOUDFLARE_R2_ENDPOINT,
-        aws_access_key_id=CLOUDFLARE_R2_KEY,
-        aws_secret_access_key=CLOUDFLARE_R2_SECRET
-    )
+def build_upload_key(filename):
+    # 🚨 POPRAWKA: Dodanie timestampu do nazwy pliku, aby uniknąć kolizji i bezpieczne nazewnictwo.
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    return f"{UPLOAD_PREFIX}{timestamp}_{os.path.basename(filename)}"
 
 
-def upload_to_r2(file_obj):
+def upload_to_r2(file_obj, content_type=None):
     s3 = get_r2_client()
-    # 🚨 POPRAWKA: Dodanie timestampu do nazwy pliku, aby uniknąć kolizji i bezpieczne nazewnictwo.
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
-    file_key = f"uploads/{timestamp}_{os.path.basename(file_obj.name)}"
+    file_key = build_upload_key(file_obj.name)
+    extra_args = {'ContentType': content_type} if content_type else None
 
     try:
-        s3.upload_fileobj(file_obj, CLOUDFLARE_R2_BUCKET, file_key)
+        s3.upload_fileobj(file_obj, storage.CLOUDFLARE_R2_BUCKET, file_key, ExtraArgs=extra_args)
         # POPRAWKA: Upewnij się, że zwracany URL jest poprawny
-        return f"{CLOUDFLARE_PUBLIC_URL.rstrip('/')}/{file_key}"
+        return public_url_for_key(file_key)
     except Exception as e:
         print(f"Błąd podczas ładowania pliku do R2: {e}")
         # RZUCAMY BŁĄD, ABY MÓC GO ZŁAPAĆ W upload_file_api
@@ -146,21 +104,25 @@ def upload_to_r2(file_obj):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def files_list_api(request):
-    user = request.user
-    queryset = File.objects.all()
-    if user.groups.filter(name='Client').exists():
-        queryset = queryset.filter(visible_to_clients=True)
-    serializer = FileSerializer(queryset, many=True, context={'request': request})
-    return Response(serializer.data)
+    """
+    Lists files a page at a time (cursor pagination, newest first).
+    Filters: order, file_type, uploaded_by, created_after, created_before.
+    """
+    filterset = FileFilter(request.query_params, queryset=visible_files(request.user).select_related('uploaded_by'))
+    if not filterset.is_valid():
+        return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = FileCursorPagination()
+    page = paginator.paginate_queryset(filterset.qs, request)
+    serializer = FileSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def files_by_order_api(request, order_id):
     user = request.user
-    queryset = File.objects.filter(order_id=order_id)
-    if user.groups.filter(name='Client').exists():
-        queryset = queryset.filter(visible_to_clients=True)
+    queryset = visible_files(user, File.objects.filter(order_id=order_id)).select_related('uploaded_by')
     serializer = FileSerializer(queryset, many=True, context={'request': request})
     return Response(serializer.data)
 
@@ -169,19 +131,41 @@ def files_by_order_api(request, order_id):
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser])
 def upload_file_api(request):
+    # SHA-256 liczony w trakcie odbierania pliku (jeden przebieg)
+    request.upload_handlers = hashing_upload_handlers(request)
     uploaded_file = request.FILES.get('uploaded_file')
     if not uploaded_file:
         return Response({"uploaded_file": "This field is required."}, status=400)
 
+    sha256 = getattr(uploaded_file, 'sha256', '')
+    # Typ rozpoznany z pierwszych bajtów, nie deklarowany przez klienta
+    content_type = getattr(uploaded_file, 'sniffed_content_type', '')
+    # Ta sama treść jest już w R2 - nowy plik wskazuje na istniejący obiekt.
+    # Wiersz z tym URL jest zablokowany do commitu, więc równoległe usunięcie
+    # nie zwolni obiektu, zanim nowy plik zostanie zapisany
+    with transaction.atomic():
+        cloud_url = find_blob_url(sha256)
+        if cloud_url is not None:
+            return _create_file_record(request, cloud_url, default_name=uploaded_file.name,
+                                       sha256=sha256, size=uploaded_file.size, content_type=content_type)
+
+    if wants_async(request):
+        return _create_spooled_file_record(request, uploaded_file, sha256=sha256, content_type=content_type)
     try:
         # 🚨 POPRAWKA: Łapanie błędu z upload_to_r2
-        cloud_url = upload_to_r2(uploaded_file)
+        cloud_url = upload_to_r2(uploaded_file, content_type=content_type)
     except Exception as e:
         return Response({"detail": f"Błąd podczas ładowania pliku do R2: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    # 🚨 POPRAWKA: Używamy uploaded_file.name jako domyślnej nazwy
+    return _create_file_record(request, cloud_url, default_name=uploaded_file.name,
+                               sha256=sha256, size=uploaded_file.size, content_type=content_type)
+
+
+def _create_file_record(request, cloud_url, default_name, **extra):
+    """Tworzy wiersz File dla obiektu już zapisanego w R2 (wspólne dla wszystkich ścieżek uploadu)."""
     data = {
-        # 🚨 POPRAWKA: Używamy uploaded_file.name jako domyślnej nazwy
-        'name': request.data.get('name', uploaded_file.name),
+        'name': request.data.get('name', default_name),
         'file_type': request.data.get('file_type'),
         'description': request.data.get('description'),
         'order': request.data.get('order'),
@@ -192,12 +176,267 @@ def upload_file_api(request):
 
     serializer = FileSerializer(data=data, context={'request': request})
     if serializer.is_valid():
-        serializer.save()
+        serializer.save(**extra)
         return Response(serializer.data, status=201)
 
     return Response(serializer.errors, status=400)
 
 
+def _create_spooled_file_record(request, uploaded_file, **extra):
+    """
+    Upload asynchroniczny: plik trafia na lokalny dysk, wiersz File dostaje status 'uploading',
+    a przesłanie do R2 wykonuje pula w tle (files/upload_queue.py). Odpowiedź 202.
+    """
+    file_key = build_upload_key(uploaded_file.name)
+    try:
+        spool_upload(uploaded_file, file_key)
+    except OSError as e:
+        return Response({"detail": f"Błąd podczas zapisu pliku na dysku: {e}"},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    response = _create_file_record(request, public_url_for_key(file_key), default_name=uploaded_file.name,
+                                   size=uploaded_file.size, status=File.STATUS_UPLOADING, **extra)
+    if response.status_code != 201:
+        discard_spool(file_key)
+        return response
+
+    file_id = response.data['id']
+    transaction.on_commit(lambda: enqueue_upload(file_id))
+    response.status_code = status.HTTP_202_ACCEPTED
+    response['Location'] = reverse('files-detail-api', args=[file_id])
+    return response
+
+
+# ---------------------------------------------------------------------------------------------------
+# BEZPOŚREDNI UPLOAD DO R2 (PRESIGNED URL) - bajty pliku nie przechodzą przez Django
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def presign_upload_api(request):
+    """
+    Krok 1: zwraca podpisany URL (PUT) dla nowego klucza uploads/... oraz token,
+    którym klient potwierdza upload w upload_confirm_api.
+    """
+    filename = request.data.get('filename')
+    if not filename:
+        return Response({"filename": "This field is required."}, status=400)
+
+    file_key = build_upload_key(filename)
+    params = {'Bucket': storage.CLOUDFLARE_R2_BUCKET, 'Key': file_key}
+    headers = {}
+    content_type = request.data.get('content_type')
+    if content_type:
+        params['ContentType'] = content_type
+        headers['Content-Type'] = content_type
+
+    try:
+        upload_url = get_r2_client().generate_presigned_url(
+            'put_object', Params=params, ExpiresIn=PRESIGNED_UPLOAD_TTL
+        )
+    except Exception as e:
+        return Response({"detail": f"Błąd podczas generowania URL do R2: {e}"},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    upload_token = signing.dumps({'key': file_key, 'user': request.user.id}, salt=UPLOAD_TOKEN_SALT)
+    return Response({
+        'key': file_key,
+        'upload_url': upload_url,
+        'method': 'PUT',
+        'headers': headers,
+        'expires_in': PRESIGNED_UPLOAD_TTL,
+        'upload_token': upload_token,
+    }, status=200)
+
+
+def _load_upload_token(request, token, max_age=None):
+    """Zwraca dane z tokenu uploadu lub None, jeśli token jest nieważny / należy do innego użytkownika."""
+    try:
+        payload = signing.loads(token, salt=UPLOAD_TOKEN_SALT, max_age=max_age or PRESIGNED_UPLOAD_TTL * 4)
+    except signing.BadSignature:
+        return None
+    if payload.get('user') != request.user.id or not payload.get('key', '').startswith(UPLOAD_PREFIX):
+        return None
+    return payload
+
+
+def _default_name_for_key(file_key):
+    return file_key[len(UPLOAD_PREFIX):].split('_', 1)[-1]
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_confirm_api(request):
+    """
+    Krok 2: sprawdza obiekt przesłany przez klienta (rozmiar, typ, ETag) i tworzy wiersz File.
+    """
+    payload = _load_upload_token(request, request.data.get('upload_token', ''))
+    if not payload:
+        return Response({"upload_token": "Nieprawidłowy lub wygasły token uploadu."}, status=400)
+    file_key = payload['key']
+    default_name = _default_name_for_key(file_key)
+
+    with transaction.atomic():
+        # Potwierdzenia jednego użytkownika po kolei - równoległe powtórzenia nie miną się w sprawdzeniu
+        type(request.user).objects.select_for_update().filter(pk=request.user.pk).first()
+        # Token jest ważny przez kilka minut - ponowne potwierdzenie zwraca istniejący wiersz
+        # zamiast tworzyć kolejny File dla tego samego obiektu
+        existing = File.objects.filter(uploaded_file_url=public_url_for_key(file_key)).first()
+        if existing is not None:
+            return Response(FileSerializer(existing, context={'request': request}).data, status=200)
+
+        try:
+            metadata = fetch_object_metadata(get_r2_client(), file_key, default_name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return Response({"detail": "Plik nie został jeszcze przesłany do R2."}, status=400)
+            return Response({"detail": f"Błąd podczas sprawdzania pliku w R2: {e}"},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return _create_file_record(request, public_url_for_key(file_key), default_name=default_name, **metadata)
+
+
+# ---------------------------------------------------------------------------------------------------
+# UPLOAD WIELOCZĘŚCIOWY (S3 MULTIPART) - duże pliki, wznawianie po przerwaniu
+def _load_multipart_token(request):
+    token = request.data.get('upload_token') or request.query_params.get('upload_token', '')
+    payload = _load_upload_token(request, token, max_age=MULTIPART_UPLOAD_MAX_AGE)
+    if not payload or not payload.get('upload_id'):
+        return None
+    return payload
+
+
+def _list_uploaded_parts(s3, file_key, upload_id):
+    parts = []
+    paginator = s3.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=file_key, UploadId=upload_id):
+        for part in page.get('Parts', []):
+            parts.append({'part_number': part['PartNumber'], 'etag': part['ETag'], 'size': part['Size']})
+    return parts
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def multipart_initiate_api(request):
+    """Rozpoczyna upload wieloczęściowy i zwraca token identyfikujący go w kolejnych krokach."""
+    filename = request.data.get('filename')
+    if not filename:
+        return Response({"filename": "This field is required."}, status=400)
+
+    file_key = build_upload_key(filename)
+    params = {'Bucket': storage.CLOUDFLARE_R2_BUCKET, 'Key': file_key}
+    if request.data.get('content_type'):
+        params['ContentType'] = request.data['content_type']
+
+    try:
+        upload = get_r2_client().create_multipart_upload(**params)
+    except Exception as e:
+        return Response({"detail": f"Błąd podczas inicjowania uploadu w R2: {e}"},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    upload_token = signing.dumps(
+        {'key': file_key, 'upload_id': upload['UploadId'], 'user': request.user.id}, salt=UPLOAD_TOKEN_SALT
+    )
+    return Response({
+        'key': file_key,
+        'upload_id': upload['UploadId'],
+        'upload_token': upload_token,
+        'part_size_min': MULTIPART_MIN_PART_SIZE,
+    }, status=201)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def multipart_parts_api(request):
+    """
+    GET  - lista już przesłanych części (do wznowienia uploadu).
+    POST - podpisane URL-e (PUT) dla podanych numerów części: {"part_numbers": [1, 2, ...]}.
+    """
+    payload = _load_multipart_token(request)
+    if not payload:
+        return Response({"upload_token": "Nieprawidłowy lub wygasły token uploadu."}, status=400)
+
+    s3 = get_r2_client()
+    if request.method == 'GET':
+        try:
+            parts = _list_uploaded_parts(s3, payload['key'], payload['upload_id'])
+        except ClientError as e:
+            return Response({"detail": f"Nie znaleziono uploadu w R2: {e}"}, status=404)
+        return Response({'parts': parts}, status=200)
+
+    try:
+        part_numbers = [int(n) for n in request.data.get('part_numbers', [])]
+    except (TypeError, ValueError):
+        return Response({"part_numbers": "Wymagana lista numerów części."}, status=400)
+    if not part_numbers or any(n < 1 or n > MULTIPART_MAX_PARTS for n in part_numbers):
+        return Response({"part_numbers": f"Numery części muszą być w zakresie 1-{MULTIPART_MAX_PARTS}."}, status=400)
+
+    urls = {
+        number: s3.generate_presigned_url('upload_part', Params={
+            'Bucket': storage.CLOUDFLARE_R2_BUCKET,
+            'Key': payload['key'],
+            'UploadId': payload['upload_id'],
+            'PartNumber': number,
+        }, ExpiresIn=PRESIGNED_UPLOAD_TTL)
+        for number in part_numbers
+    }
+    return Response({'urls': urls, 'expires_in': PRESIGNED_UPLOAD_TTL}, status=200)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def multipart_complete_api(request):
+    """
+    Kończy upload wieloczęściowy i tworzy wiersz File.
+    Lista części jest pobierana z R2 (list_parts), chyba że klient poda własną w "parts".
+    """
+    payload = _load_multipart_token(request)
+    if not payload:
+        return Response({"upload_token": "Nieprawidłowy lub wygasły token uploadu."}, status=400)
+
+    s3 = get_r2_client()
+    try:
+        parts = request.data.get('parts') or _list_uploaded_parts(s3, payload['key'], payload['upload_id'])
+        if not parts:
+            return Response({"parts": "Nie przesłano żadnej części."}, status=400)
+        s3.complete_multipart_upload(
+            Bucket=storage.CLOUDFLARE_R2_BUCKET,
+            Key=payload['key'],
+            UploadId=payload['upload_id'],
+            MultipartUpload={'Parts': sorted(
+                ({'PartNumber': int(p['part_number']), 'ETag': p['etag']} for p in parts),
+                key=lambda p: p['PartNumber'],
+            )},
+        )
+    except (KeyError, TypeError, ValueError):
+        return Response({"parts": "Każda część wymaga pól part_number i etag."}, status=400)
+    except ClientError as e:
+        return Response({"detail": f"Błąd podczas kończenia uploadu w R2: {e}"}, status=400)
+
+    default_name = _default_name_for_key(payload['key'])
+    try:
+        metadata = fetch_object_metadata(s3, payload['key'], default_name)
+    except ClientError:
+        # Obiekt jest już złożony - metadane uzupełni backfill_file_metadata
+        metadata = {}
+    return _create_file_record(request, public_url_for_key(payload['key']), default_name=default_name, **metadata)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def multipart_abort_api(request):
+    """Przerywa upload wieloczęściowy i zwalnia przesłane części w R2."""
+    payload = _load_multipart_token(request)
+    if not payload:
+        return Response({"upload_token": "Nieprawidłowy lub wygasły token uploadu."}, status=400)
+
+    try:
+        get_r2_client().abort_multipart_upload(
+            Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=payload['key'], UploadId=payload['upload_id']
+        )
+    except ClientError as e:
+        return Response({"detail": f"Błąd podczas przerywania uploadu w R2: {e}"}, status=400)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def file_detail_api(request, pk):
@@ -206,14 +445,46 @@ def file_detail_api(request, pk):
     except File.DoesNotExist:
         return Response({"detail": "Nie znaleziono pliku."}, status=404)
 
-    user = request.user
-    if user.groups.filter(name='Client').exists() and not file_obj.visible_to_clients:
+    # Klient widzi tylko pliki oznaczone jako widoczne dla klientów
+    if not file_obj.visible_to_clients and is_client(request.user):
         return Response({"detail": "Brak dostępu."}, status=403)
 
     serializer = FileSerializer(file_obj, context={'request': request})
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def download_file_api(request, pk):
+    """
+    Pobranie pojedynczego pliku strumieniowo z R2 (z obsługą nagłówka Range -> 206)
+    lub przekierowanie (302) na podpisany URL R2 (?redirect=true / R2_DOWNLOAD_REDIRECT).
+    """
+    try:
+        file_obj = File.objects.get(pk=pk)
+    except File.DoesNotExist:
+        return Response({"detail": "Nie znaleziono pliku."}, status=404)
+
+    # Klient widzi tylko pliki oznaczone jako widoczne dla klientów
+    if not file_obj.visible_to_clients and is_client(request.user):
+        return Response({"detail": "Brak dostępu."}, status=403)
+
+    if file_obj.status != File.STATUS_READY:
+        return Response({"detail": "Plik nie jest jeszcze dostępny w R2.", "status": file_obj.status},
+                        status=status.HTTP_409_CONFLICT)
+
+    if wants_redirect(request):
+        return redirect_to_file(file_obj)
+
+    try:
+        return stream_file(request, file_obj)
+    except ObjectNotFound:
+        return Response({"detail": "Plik nie istnieje w R2."}, status=404)
+    except ClientError as e:
+        return Response({"detail": f"Błąd pobierania pliku z R2: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def update_visible_to_clients_api(request, pk):
@@ -222,6 +493,10 @@ def update_visible_to_clients_api(request, pk):
     except File.DoesNotExist:
         return Response({"detail": "Plik nie istnieje."}, status=404)
 
+    # Widoczność plików zmienia zespół, nie klient
+    if is_client(request.user):
+        return Response({"detail": "Brak dostępu."}, status=403)
+
     visible = request.data.get("visible_to_clients")
     if visible is None:
         return Response({"visible_to_clients": "This field is required."}, status=400)
@@ -236,6 +511,73 @@ def update_visible_to_clients_api(request, pk):
     return Response({"detail": "Zmieniono widoczność.", "visible_to_clients": file_obj.visible_to_clients}, status=200)
 
 
+# ---------------------------------------------------------------------------------------------------
+# OPERACJE ZBIORCZE - wiele plików w jednym żądaniu
+def _parse_bulk_ids(request):
+    ids = request.data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return None
+    try:
+        return {int(file_id) for file_id in ids}
+    except (TypeError, ValueError):
+        return None
+
+
+@api_view(['PATCH'])
+@permission_classes([IsAuthenticated])
+def bulk_visibility_api(request):
+    """
+    Ustawia visible_to_clients dla wielu plików jednym UPDATE: {"ids": [...], "visible_to_clients": true}.
+    """
+    if is_client(request.user):
+        return Response({"detail": "Brak dostępu."}, status=403)
+
+    ids = _parse_bulk_ids(request)
+    if ids is None:
+        return Response({"ids": "Wymagana lista identyfikatorów plików."}, status=400)
+    visible = request.data.get("visible_to_clients")
+    if not isinstance(visible, bool):
+        return Response({"visible_to_clients": "Wymagana wartość true/false."}, status=400)
+
+    files = File.objects.filter(pk__in=ids)
+    order_ids = list(files.exclude(order_id__isnull=True).order_by().values_list('order_id', flat=True).distinct())
+    # UPDATE bez save() - sygnały post_save nie działają, cache archiwów i feedu czyścimy sami
+    updated = files.update(visible_to_clients=visible, updated_at=timezone.now())
+    for order_id in order_ids:
+        transaction.on_commit(lambda order_id=order_id: invalidate_order_archives(order_id))
+    transaction.on_commit(invalidate_feed)
+
+    return Response({"detail": "Zmieniono widoczność.", "updated": updated, "visible_to_clients": visible},
+                    status=200)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_delete_api(request):
+    """
+    Usuwa wiele plików: {"ids": [...]}. Obiekty R2 bez innych odwołań są usuwane
+    po zatwierdzeniu transakcji wywołaniami DeleteObjects (do 1000 kluczy).
+    """
+    if is_client(request.user):
+        return Response({"detail": "Brak dostępu."}, status=403)
+
+    ids = _parse_bulk_ids(request)
+    if ids is None:
+        return Response({"ids": "Wymagana lista identyfikatorów plików."}, status=400)
+
+    with transaction.atomic():
+        files = File.objects.filter(pk__in=ids)
+        found = set(files.values_list('pk', flat=True))
+        with batched_release() as urls, batched_invalidation() as order_ids:
+            files.delete()
+        transaction.on_commit(lambda: release_blobs(urls))
+        # Sygnał post_delete przychodzi dla każdego wiersza - cache archiwów czyścimy raz na zlecenie
+        for order_id in order_ids:
+            transaction.on_commit(lambda order_id=order_id: invalidate_order_archives(order_id))
+
+    return Response({"deleted": len(found), "missing": sorted(ids - found)}, status=200)
+
+
 @api_view(['GET'])
 @authentication_classes([JWTAuthentication])
 @permission_classes([IsAuthenticated])
@@ -251,39 +593,100 @@ def download_files_api(request, order_id):
     except ValueError:
         return Response({'detail': 'Nieprawidłowy format file_ids.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    queryset = File.objects.filter(id__in=file_ids, order_id=order_id)
-    is_client = user.groups.filter(name='Client').exists()
+    # Klient widzi tylko pliki oznaczone jako widoczne dla klientów
+    queryset = visible_files(user, File.objects.filter(id__in=file_ids, order_id=order_id, status=File.STATUS_READY))
 
-    if is_client:
-        queryset = queryset.filter(visible_to_clients=True)
-
-    if not queryset.exists():
+    files = list(queryset)
+    if not files:
         return Response({'detail': 'Nie znaleziono plików do pobrania lub brak uprawnień.'},
                         status=status.HTTP_404_NOT_FOUND)
 
-    s3 = get_r2_client()
-    zip_buffer = io.BytesIO()
+    # Ten sam zestaw plików (i ich wersji) -> to samo archiwum w cache R2
+    cache_key = archive_cache_key(order_id, files)
+    archive_name = f"order_{order_id}_files.zip"
+    # Archiwum z cache można pobrać bezpośrednio z R2
+    if wants_redirect(request) and is_cached_archive(cache_key):
+        response = redirect_to_object(cache_key, archive_name, 'application/zip')
+        response['X-Archive-Cache'] = 'hit'
+        return response
+
+    cached = open_cached_archive(cache_key)
+    if cached is not None:
+        size, chunks = cached
+        response = StreamingHttpResponse(chunks, content_type='application/zip')
+        if size is not None:
+            response['Content-Length'] = size
+        response['X-Archive-Cache'] = 'hit'
+    else:
+        # Archiwum jest strumieniowane - pamięć nie zależy od rozmiaru plików,
+        # kolejne obiekty z R2 pobierane są równolegle w trakcie zapisu bieżącego
+        archived = []
+
+        def entries():
+            for entry in prefetched_r2_entries(files):
+                archived.append(entry[0])
+                yield entry
+
+        # Niepełne archiwum (pominięte pliki) nie trafia do cache
+        archive = tee_to_cache(stream_zip(entries()), cache_key,
+                               is_complete=lambda: len(archived) == len(files))
+        response = StreamingHttpResponse(archive, content_type='application/zip')
+        response['X-Archive-Cache'] = 'miss'
+    response['Content-Disposition'] = f'attachment; filename="{archive_name}"'
+
+    return response
 
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for file_obj in queryset:
-            try:
-                file_key_path = file_obj.uploaded_file_url.replace(f"{CLOUDFLARE_PUBLIC_URL.rstrip('/')}/", '')
-                r2_object = s3.get_object(Bucket=CLOUDFLARE_R2_BUCKET, Key=file_key_path)
-                file_content = r2_object['Body'].read()
 
-                filename = f"{file_obj.name}.{file_obj.file_type}" if file_obj.file_type else file_obj.name
-                zip_file.writestr(filename, file_content)
+# ---------------------------------------------------------------------------------------------------
+# EKSPORT ZIP W TLE - duże zlecenia (archiwum budowane w R2, klient sprawdza postęp)
+@api_view(['POST'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def download_jobs_api(request, order_id):
+    """
+    Tworzy zadanie eksportu ZIP plików zlecenia: {"file_ids": [...]} (domyślnie wszystkie pliki).
+    Identyczne zadanie w toku jest zwracane zamiast tworzenia nowego (200 zamiast 202).
+    """
+    queryset = visible_files(request.user, File.objects.filter(order_id=order_id, status=File.STATUS_READY))
 
-            except Exception as e:
-                print(f"Błąd pobierania pliku {file_obj.name} z R2: {e}")
+    file_ids = request.data.get('file_ids')
+    if file_ids:
+        if isinstance(file_ids, str):
+            file_ids = file_ids.split(',')
+        try:
+            queryset = queryset.filter(pk__in=[int(file_id) for file_id in file_ids])
+        except (TypeError, ValueError):
+            return Response({'detail': 'Nieprawidłowy format file_ids.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
-    response['Content-Disposition'] = f'attachment; filename="order_{order_id}_files.zip"'
-    response['Content-Length'] = zip_buffer.tell()
+    files = list(queryset.only('pk', 'updated_at'))
+    if not files:
+        return Response({'detail': 'Nie znaleziono plików do pobrania lub brak uprawnień.'},
+                        status=status.HTTP_404_NOT_FOUND)
 
+    job, created = create_export_job(request.user, order_id, files)
+    response = Response(ZipExportJobSerializer(job).data,
+                        status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+    response['Location'] = reverse('files-download-job-api', args=[job.pk])
     return response
 
 
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def download_job_detail_api(request, job_id):
+    """
+    Status i postęp zadania eksportu ZIP; po zakończeniu zawiera podpisany download_url
+    (albo expired=True, gdy archiwum usunięto z cache - wtedy trzeba zlecić eksport ponownie).
+    """
+    job = get_object_or_404(ZipExportJob, pk=job_id)
+    # Jak przy tworzeniu zadania: klient musi widzieć wszystkie pliki archiwum
+    # (wspólne zadanie może zwrócić kilku klientom)
+    if (job.requested_by_id != request.user.id and is_client(request.user)
+            and File.objects.filter(pk__in=job.file_ids, visible_to_clients=False).exists()):
+        return Response({"detail": "Brak dostępu."}, status=403)
+    return Response(ZipExportJobSerializer(job).data)
+
+
 # ---------------------------------------------------------------------------------------------------
 # FUNKCJA GENERUJĄCA RAPORT PDF (ZAKTUALIZOWANA Z OBSŁUGĄ CZCIONEK TTF I POPRAWIONĄ LOGIKĄ PODPISU)
 @api_view(['GET'])
@@ -299,210 +702,31 @@ def generate_final_report_pdf_api(request, order_id):
     # 1. Walidacja i pobranie obiektu Order
     order = get_object_or_404(Order, pk=order_id)
 
-    # 2. Walidacja dostępu
-    is_manager_or_dev = user.groups.filter(Q(name='Manager') | Q(name='Developer')).exists()
-    is_client_of_order = order.client == user
-
-    if not (is_manager_or_dev or is_client_of_order):
+    # 2. Walidacja dostępu - te same reguły co OrderViewSet (manager: wszystkie,
+    # programista: przypisane do niego, klient: własne zlecenia)
+    if not visible_orders(user).filter(pk=order.pk).exists():
         return Response({'detail': 'Brak uprawnień do pobrania raportu dla tego zlecenia.'},
                         status=status.HTTP_403_FORBIDDEN)
 
-    # 3. Pobranie Historii (OrderLog)
-    if hasattr(order, 'history'):
-        history_logs = order.history.select_related('actor', 'file').order_by('timestamp').all()
-    else:
-        try:
-            history_logs = OrderLog.objects.filter(order=order).select_related('actor', 'file').order_by(
-                'timestamp').all()
-        except AttributeError:
-            history_logs = []
-
-    # 4. Logika generowania PDF
-    pdf_buffer = io.BytesIO()
-
-    doc = SimpleDocTemplate(
-        pdf_buffer,
-        pagesize=A4,
-        rightMargin=2 * cm,
-        leftMargin=2 * cm,
-        topMargin=4 * cm,
-        bottomMargin=2 * cm
-    )
-    width, height = A4
-
-    story = []
-
-    styles = getSampleStyleSheet()
-
-    # ZMIENIONE: Wzmocnienie stylów przez nadpisanie standardowych
-    styles['Normal'].fontName = DEFAULT_FONT
-    styles['Normal'].fontSize = 10
-    styles['Normal'].leading = 14
-    styles['Heading1'].fontName = DEFAULT_FONT_BOLD
-    styles['Heading1'].fontSize = 18
-    styles['Heading2'].fontName = DEFAULT_FONT_BOLD
-    styles['Heading2'].fontSize = 14
-
-    # Definicja niestandardowych stylów
-    styles.add(ParagraphStyle(name='ReportTitle', fontName=DEFAULT_FONT_BOLD, fontSize=20, spaceAfter=20, alignment=1))
-    styles.add(ParagraphStyle(name='Head2', fontName=DEFAULT_FONT_BOLD, fontSize=14, spaceBefore=15, spaceAfter=10))
-    styles.add(ParagraphStyle(name='Body', fontName=DEFAULT_FONT, fontSize=10, leading=14))
-    styles.add(ParagraphStyle(name='BodyBold', fontName=DEFAULT_FONT_BOLD, fontSize=10, leading=14))
-    styles.add(ParagraphStyle(name='HistoryItem', fontName=DEFAULT_FONT, fontSize=9, leading=12, leftIndent=0.5 * cm,
-                              spaceBefore=3))
-    styles.add(ParagraphStyle(name='Footer', fontName=DEFAULT_FONT, fontSize=9, textColor=colors.grey, alignment=1,
-                              spaceBefore=50))
-    # Styl podpisu
-    styles.add(ParagraphStyle(name='SignatureLine', fontName=DEFAULT_FONT, fontSize=10, alignment=2, spaceBefore=10))
-
-    # ----------------------------------
-    # --- NAGŁÓWEK (Element statyczny - użyj metody onFirstPage / onLaterPages)
-    # ----------------------------------
-
-    def header_footer(canvas, doc):
-        canvas.saveState()
-
-        # Nagłówek (Dane firmy)
-        canvas.setFont(DEFAULT_FONT_BOLD, 10)
-        canvas.drawString(width - 7 * cm, height - 2 * cm, COMPANY_NAME)
-        canvas.setFont(DEFAULT_FONT, 9)
-        canvas.drawString(width - 7 * cm, height - 2.5 * cm, COMPANY_ADDRESS)
-        canvas.drawString(width - 7 * cm, height - 2.9 * cm, f"NIP: {COMPANY_NIP} | Tel: {COMPANY_PHONE}")
-
-        # Stopka
-        footer_text = f"Raport Końcowy Zlecenia #{order.pk} | {COMPANY_NAME} | Strona {canvas.getPageNumber()}"
-        canvas.drawCentredString(width / 2, 1.5 * cm, footer_text)
-
-        canvas.restoreState()
-
-    # ----------------------------------
-    # --- TREŚĆ RAPORTU (Flowables) ---
-    # ----------------------------------
-
-    # --- TYTUŁ RAPORTU ---
-    story.append(Paragraph(f"RAPORT KOŃCOWY ZLECENIA #{order.pk}", styles['ReportTitle']))
-
-    # DODANY SPACER, ABY TYTUŁ NIE ZACZYNAŁ SIĘ ZBYT BLISKO NAGŁÓWKA
-    story.append(Spacer(1, 1 * cm))
-
-    # --- SEKCJA: DANE ZLECENIA (Tabela) ---
-    story.append(Paragraph("1. Kluczowe Informacje o Zleceniu", styles['Head2']))
-
-    status_display = dict(Order.STATUS_CHOICES).get(order.status, order.status)
-    finished_at = order.updated_at if order.status == 'done' else None
-
-    # Poprawna nazwa Managera do użycia w raporcie
-    manager_name = order.manager.get_full_name() if order.manager else "Nieprzypisany"
-
-    data = [
-        [Paragraph(f"<b>Nazwa Zlecenia:</b>", styles['Body']), order.title],
-        [Paragraph(f"<b>Klient:</b>", styles['Body']), order.client.get_full_name() or order.client.username],
-        [Paragraph(f"<b>Manager:</b>", styles['Body']), manager_name],
-        [Paragraph(f"<b>Status Końcowy:</b>", styles['Body']), status_display],
-        [Paragraph(f"<b>Data Zgłoszenia:</b>", styles['Body']), order.created_at.strftime('%Y-%m-%d %H:%M')],
-    ]
-    if finished_at:
-        data.append([Paragraph(f"<b>Data Zakończenia:</b>", styles['Body']), finished_at.strftime('%Y-%m-%d %H:%M')])
-
-    table = Table(data, colWidths=[4 * cm, None])
-    table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('GRID', (0, 0), (-1, -1), 0.25, colors.lightgrey),
-        # Użycie zdefiniowanych czcionek dla tabeli
-        ('FONTNAME', (0, 0), (0, -1), DEFAULT_FONT_BOLD),
-        ('FONTNAME', (1, 0), (-1, -1), DEFAULT_FONT),
-        ('LEFTPADDING', (0, 0), (-1, -1), 2),
-    ]))
-    story.append(table)
-    story.append(Spacer(1, 1 * cm))
-
-    # --- SEKCJA: OPIS ZLECENIA ---
-    story.append(Paragraph("2. Opis Zlecenia", styles['Head2']))
-
-    desc_text = Paragraph(order.description.replace('\n', '<br/>'), styles['Body'])
-    story.append(desc_text)
-    story.append(Spacer(1, 1 * cm))
-
-    # --- SEKCJA: HISTORIA ZDARZEŃ (ORDER LOG) ---
-    story.append(Paragraph("3. Pełna Historia Zdarzeń", styles['Head2']))
-
-    if not history_logs:
-        story.append(Paragraph("Brak zapisanych zdarzeń w historii zlecenia.", styles['Body']))
-        story.append(Spacer(1, 1 * cm))
-    else:
-        for log in history_logs:
-            actor_name = log.actor.get_full_name() or log.actor.username if log.actor else 'System'
-            timestamp_str = log.timestamp.strftime('%Y-%m-%d %H:%M')
-
-            if hasattr(log, 'get_event_type_display'):
-                event_display = log.get_event_type_display()
-            else:
-                event_display = log.event_type
-
-            # Formatowanie opisu - używamy tagu <font name='...'> do poprawnej obsługi czcionek w Paragraph
-            description_html = f"<font name='{DEFAULT_FONT_BOLD}'>[{timestamp_str}]</font> ({actor_name}, {event_display}): {log.description or 'Brak opisu.'}"
-
-            if log.event_type == 'status_change' and log.old_value and log.new_value:
-                old_display = dict(Order.STATUS_CHOICES).get(log.old_value, log.old_value)
-                new_display = dict(Order.STATUS_CHOICES).get(log.new_value, log.new_value)
-                # Używamy tagów <font name='...'> wewnątrz, aby poprawnie renderować znaki specjalne
-                description_html += f" (Status: <font name='{DEFAULT_FONT}' color='gray'>{old_display}</font> &rarr; <font name='{DEFAULT_FONT_BOLD}' color='green'>{new_display}</font>)"
-
-            if log.event_type == 'file_added' and log.file:
-                description_html += f" (Plik: <font name='{DEFAULT_FONT_BOLD}'><u>{log.file.name}.{log.file.file_type or 'Brak typu'}</u></font>)"
-
-            history_para = Paragraph(description_html, styles['HistoryItem'])
-            story.append(history_para)
-
-        story.append(Spacer(1, 1 * cm))
-
-    # --- SEKCJA: PODSUMOWANIE (Jako wniosek końcowy) ---
-    story.append(Paragraph("4. Podsumowanie Końcowe i Podziękowanie", styles['Head2']))
-
-    final_summary = (
-        "Projekt został pomyślnie zakończony zgodnie z ustalonymi celami i terminami. "
-        "Wszystkie zgłoszone wymagania funkcjonalne zostały spełnione, a system przeszedł pomyślnie końcowe testy akceptacyjne. "
-        "Niniejszy raport stanowi formalne zamknięcie zlecenia."
-    )
-
-    summary_text = Paragraph(final_summary, styles['Body'])
-    story.append(summary_text)
-    story.append(Spacer(1, 1.5 * cm))
-
-    # Podziękowanie
-    story.append(Paragraph(
-        f"<font name='{DEFAULT_FONT_BOLD}'>Dziękujemy za zaufanie, jakim obdarzyli Państwo firmę ITFlow Sp. z o.o.!</font>",
-        styles['BodyBold']))
-    story.append(Paragraph("Mamy nadzieję na dalszą owocną współpracę.", styles['Body']))
-    story.append(Spacer(1, 3 * cm))  # Większy odstęp przed sekcją podpisu
-
-    # ----------------------------------
-    # --- SEKCJA: PODPIS (Manager) ---
-    # ----------------------------------
-
-    # 🚨 ZMIENIONE: Podpis Managera zlecenia
-    signature_name = manager_name if order.manager else "Brak przypisanego Managera"
-
-    # Używamy stylów z wyrównaniem do prawej (alignment=2)
-    # Linia podpisu (wyrównanie do prawej)
-    story.append(Paragraph("<hr width='50%' align='right' noshade='noshade'/>", styles['Normal']))
-
-    # Imię i nazwisko Managera
-    story.append(Paragraph(f"({signature_name})", styles['SignatureLine']))
-
-    # Opis podpisu
-    story.append(Paragraph("Podpis Managera Zlecenia", styles['SignatureLine']))
-
-    # 5. Budowanie dokumentu
-    doc.build(story, onFirstPage=header_footer, onLaterPages=header_footer)
-
-    pdf_content = pdf_buffer.getvalue()
-    pdf_buffer.close()
-
-    # 6. Przygotowanie odpowiedzi HTTP
+    # 3. Raport z cache (renderowany ponownie tylko po zmianie zlecenia lub historii)
+    try:
+        pdf_content, etag = get_report(order)
+    except RenderUnavailable as e:
+        response = Response({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = RENDER_RETRY_AFTER
+        return response
+
+    # Klient ma aktualną wersję -> 304 bez przesyłania pliku
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['Cache-Control'] = 'private, no-cache'
+        return not_modified
+
+    # 4. Przygotowanie odpowiedzi HTTP
     response = HttpResponse(pdf_content, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Raport_Koncowy_Zamowienia_{order_id}.pdf"'
+    response['Content-Disposition'] = f'attachment; filename="{report_filename(order_id)}"'
     response['Content-Length'] = len(pdf_content)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
 
     return response
\ No newline at end of file
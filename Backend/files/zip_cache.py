@@ -0,0 +1,170 @@
+"""
+files/zip_cache.py
+
+Content-addressed cache of generated order ZIP archives, stored in R2.
+
+The cache key is a SHA-256 of the order id and the (id, updated_at) pairs
+of the selected files, so any change to a member file produces a new key.
+On a miss the archive is streamed to the client as usual and copied into
+a temporary file on the side; once the stream has completed, the copy is
+uploaded to R2 in the background. Cached archives of an order are deleted
+when one of its files is saved or deleted (see files/signals.py): the
+order's prefix is listed in R2, so every stored archive is found no
+matter which process wrote it. A per-archive marker in the Django cache
+only lets the download view skip a request to R2 on a known hit.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+from django.core.cache import cache
+from django.db import transaction
+
+from .archives import CHUNK_SIZE
+from .background import run_in_background
+from .blobs import delete_keys
+from .storage import get_r2_client
+from . import storage
+
+
+logger = logging.getLogger(__name__)
+
+ZIP_CACHE_PREFIX = "cache/zips/"
+# Większych archiwów nie kopiujemy do cache (miejsce na dysku tymczasowym)
+ZIP_CACHE_MAX_BYTES = int(os.getenv("R2_ZIP_CACHE_MAX_MB", 1024)) * 1024 * 1024
+# Do tego rozmiaru kopia trzymana w pamięci, potem na dysku
+ZIP_CACHE_SPOOL_BYTES = 8 * 1024 * 1024
+# Znacznik zapisanego archiwum (tylko podpowiedź - inwalidacja listuje R2)
+ZIP_CACHE_MARKER_TIMEOUT = 30 * 24 * 3600
+
+_deferred = threading.local()
+
+
+def order_prefix(order_id):
+    return f"{ZIP_CACHE_PREFIX}order_{order_id}/"
+
+
+def archive_cache_key(order_id, files):
+    """R2 key of the cached archive for this exact file selection."""
+    digest = hashlib.sha256(str(order_id).encode())
+    for file_obj in sorted(files, key=lambda f: f.pk):
+        digest.update(f"|{file_obj.pk}:{file_obj.updated_at.isoformat()}".encode())
+    return f"{order_prefix(order_id)}{digest.hexdigest()}.zip"
+
+
+def _marker_key(key):
+    return f"zip_cache:archive:{key}"
+
+
+def is_cached_archive(key):
+    """True if the archive is known to be stored in R2 (no request to R2)."""
+    return cache.get(_marker_key(key)) is not None
+
+
+def open_cached_archive(key, s3=None):
+    """
+    Returns (size, chunks) of a cached archive, or None on a cache miss.
+    """
+    s3 = s3 or get_r2_client()
+    try:
+        r2_object = s3.get_object(Bucket=storage.CLOUDFLARE_R2_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            logger.warning("Błąd odczytu archiwum %s z cache R2: %s", key, e)
+        return None
+    return r2_object.get('ContentLength'), r2_object['Body'].iter_chunks(CHUNK_SIZE)
+
+
+def remember_archive(key):
+    """Marks the archive stored under `key` as cached."""
+    cache.set(_marker_key(key), True, timeout=ZIP_CACHE_MARKER_TIMEOUT)
+
+
+def _store(spool, key, s3):
+    try:
+        spool.seek(0)
+        s3.upload_fileobj(spool, storage.CLOUDFLARE_R2_BUCKET, key, ExtraArgs={'ContentType': 'application/zip'})
+        remember_archive(key)
+    except Exception as e:
+        logger.warning("Nie udało się zapisać archiwum %s w cache R2: %s", key, e)
+    finally:
+        spool.close()
+
+
+def tee_to_cache(chunks, key, is_complete=None, s3=None):
+    """
+    Yields `chunks` unchanged and stores their concatenation under `key`.
+
+    The archive is stored only if the stream was consumed to the end, did
+    not exceed ZIP_CACHE_MAX_BYTES and `is_complete()` (if given) returns
+    True; aborted downloads and archives with skipped files are not cached.
+    """
+    s3 = s3 or get_r2_client()
+    spool = tempfile.SpooledTemporaryFile(max_size=ZIP_CACHE_SPOOL_BYTES)
+    written = 0
+    completed = False
+    try:
+        for chunk in chunks:
+            if spool is not None:
+                written += len(chunk)
+                if written > ZIP_CACHE_MAX_BYTES:
+                    spool.close()
+                    spool = None
+                else:
+                    spool.write(chunk)
+            yield chunk
+        completed = is_complete is None or is_complete()
+    finally:
+        if spool is not None:
+            if completed:
+                run_in_background(_store, spool, key, s3)
+            else:
+                spool.close()
+
+
+def invalidate_order_archives(order_id, s3=None):
+    """Deletes every cached archive of the order (listed from R2)."""
+    s3 = s3 or get_r2_client()
+    try:
+        paginator = s3.get_paginator('list_objects_v2')
+        keys = [
+            item['Key']
+            for page in paginator.paginate(Bucket=storage.CLOUDFLARE_R2_BUCKET, Prefix=order_prefix(order_id))
+            for item in page.get('Contents', [])
+        ]
+    except Exception as e:
+        logger.warning("Nie udało się wylistować archiwów zlecenia %s w cache R2: %s", order_id, e)
+        return
+    if not keys:
+        return
+
+    cache.delete_many([_marker_key(key) for key in keys])
+    delete_keys(keys, s3)
+
+
+@contextmanager
+def batched_invalidation():
+    """
+    Collects the orders of Files saved or deleted inside the block instead
+    of invalidating per row; invalidate each order once after commit.
+    """
+    order_ids = set()
+    _deferred.order_ids = order_ids
+    try:
+        yield order_ids
+    finally:
+        _deferred.order_ids = None
+
+
+def schedule_invalidation(order_id):
+    """Invalidates the order's archives after commit, in the background (or defers it to batched_invalidation)."""
+    order_ids = getattr(_deferred, 'order_ids', None)
+    if order_ids is not None:
+        order_ids.add(order_id)
+    else:
+        transaction.on_commit(lambda: run_in_background(invalidate_order_archives, order_id))
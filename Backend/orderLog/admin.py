@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import OrderLog
+from .models import OrderLog, OrderLogDailyRollup
 
 
 @admin.register(OrderLog)
@@ -7,7 +7,7 @@ class OrderLogAdmin(admin.ModelAdmin):
     list_display = (
         "timestamp",
         "order",
-        "actor",
+        "actor_name",
         "event_type",
         "old_value",
         "new_value",
@@ -17,11 +17,12 @@ class OrderLogAdmin(admin.ModelAdmin):
     search_fields = ("description", "old_value", "new_value", "order__title")
     ordering = ("-timestamp",)
 
-    readonly_fields = ("timestamp",)
+    readonly_fields = ("timestamp", "actor_name")
+    list_select_related = ("order", "file")
 
     fieldsets = (
         ("Informacje podstawowe", {
-            "fields": ("order", "actor", "event_type")
+            "fields": ("order", "actor", "actor_name", "event_type")
         }),
         ("Szczegóły", {
             "fields": ("description", "old_value", "new_value", "file")
@@ -29,4 +30,11 @@ class OrderLogAdmin(admin.ModelAdmin):
         ("System", {
             "fields": ("timestamp",),
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(OrderLogDailyRollup)
+class OrderLogDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ("day", "order", "event_type", "actor", "count")
+    list_filter = ("event_type", "day")
+    search_fields = ("order__title",)
+    ordering = ("-day",)
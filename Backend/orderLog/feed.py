@@ -0,0 +1,105 @@
+"""
+orderLog/feed.py
+
+Activity feed across every order visible to a user.
+Events are returned newest first with keyset (cursor) pagination on
+(timestamp, id), which the orderlog_feed_idx index serves as an
+ordered range scan. The first page is cached per role and invalidated
+by bumping a version key whenever a new OrderLog row is inserted.
+"""
+
+import base64
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from orders.models import Order
+from .models import OrderLog
+
+
+FEED_PAGE_SIZE = 50
+FEED_MAX_PAGE_SIZE = 200
+FEED_CACHE_TIMEOUT = 60 * 10
+FEED_VERSION_KEY = 'order_log_feed:version'
+
+
+def user_role(user):
+    """Role used for order visibility (same rules as OrderViewSet)."""
+    groups = set(user.groups.values_list('name', flat=True))
+    if 'manager' in groups:
+        return 'manager'
+    if 'programmer' in groups:
+        return 'programmer'
+    return 'client'
+
+
+def visible_orders(user, role=None):
+    role = role or user_role(user)
+    if role == 'manager':
+        return Order.objects.all()
+    if role == 'programmer':
+        return Order.objects.filter(developer=user)
+    return Order.objects.filter(client=user)
+
+
+def feed_queryset(user, role=None):
+    role = role or user_role(user)
+    queryset = OrderLog.objects.all()
+    if role != 'manager':
+        queryset = queryset.filter(order__in=visible_orders(user, role).values('pk'))
+    return (
+        queryset
+        .select_related('order', 'file__uploaded_by')
+        .order_by('-timestamp', '-id')
+    )
+
+
+def encode_cursor(log):
+    raw = f"{log.timestamp.isoformat()}|{log.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(value):
+    """
+    Returns the (timestamp, id) position stored in a cursor.
+
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(value.encode()).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def after_cursor(queryset, cursor):
+    """Rows strictly older than the cursor position in (timestamp, id) order."""
+    timestamp, pk = decode_cursor(cursor)
+    return queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+
+
+# ---------------------------------------------------------------------
+# First page cache
+# ---------------------------------------------------------------------
+def feed_version():
+    version = cache.get(FEED_VERSION_KEY)
+    if version is None:
+        cache.add(FEED_VERSION_KEY, 1, timeout=None)
+        version = cache.get(FEED_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_feed():
+    try:
+        cache.incr(FEED_VERSION_KEY)
+    except ValueError:
+        cache.add(FEED_VERSION_KEY, 1, timeout=None)
+
+
+def first_page_cache_key(user, role):
+    # Manager widzi wszystkie zlecenia - jedna strona dla całej roli
+    owner = 'all' if role == 'manager' else user.pk
+    return f"order_log_feed:v{feed_version()}:{role}:{owner}"
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orderLog import partitions
+from orderLog.retention import PROTECTED_EVENT_TYPES
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintains the monthly OrderLog partitions on PostgreSQL: pre-creates "
+        "future partitions and detaches old ones. Run it daily (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3,
+                            help="Create partitions up to N months ahead (default: 3)")
+        parser.add_argument('--detach-older-than', type=int, metavar='MONTHS',
+                            help="Detach partitions that ended more than N months ago")
+        parser.add_argument('--drop', action='store_true',
+                            help="Drop detached partitions instead of keeping them as standalone tables")
+        parser.add_argument('--include-status-changes', action='store_true',
+                            help="Do not keep 'status_change' events of detached partitions")
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            self.stdout.write(
+                "OrderLog is a plain table on this database - nothing to do "
+                "(use prune_order_logs for retention)."
+            )
+            return
+
+        created = partitions.ensure_partitions(months_ahead=options['ahead'])
+        for name in created:
+            self.stdout.write(f"Created partition {name}")
+
+        if options['detach_older_than'] is not None:
+            before = partitions.add_months(
+                partitions.month_start(timezone.now()), -options['detach_older_than']
+            )
+            keep = () if options['include_status_changes'] else PROTECTED_EVENT_TYPES
+            detached = partitions.detach_partitions(before, keep_event_types=keep, drop=options['drop'])
+            for name in detached:
+                self.stdout.write(f"{'Dropped' if options['drop'] else 'Detached'} partition {name}")
+
+        self.stdout.write(self.style.SUCCESS("✅ OrderLog partitions are up to date"))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from orderLog.retention import PROTECTED_EVENT_TYPES, expired_logs, rollup_and_delete
+
+
+class Command(BaseCommand):
+    help = (
+        "Rolls OrderLog events older than N days into OrderLogDailyRollup "
+        "and deletes the raw rows in small batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180,
+                            help="Keep raw events from the last N days (default: 180)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rows rolled up and deleted per transaction (default: 1000)")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches (default: 0)")
+        parser.add_argument('--include-status-changes', action='store_true',
+                            help="Also prune 'status_change' events (used by the final PDF report)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only count the rows that would be pruned")
+
+    def handle(self, *args, **options):
+        keep = () if options['include_status_changes'] else PROTECTED_EVENT_TYPES
+        queryset = expired_logs(options['days'], keep_event_types=keep)
+
+        if options['dry_run']:
+            self.stdout.write(f"{queryset.count()} log entr(y/ies) older than {options['days']} day(s) would be pruned")
+            return
+
+        deleted = rollup_and_delete(
+            queryset,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ {deleted} log entr(y/ies) rolled up and deleted")
+        )
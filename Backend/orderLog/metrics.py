@@ -0,0 +1,128 @@
+"""
+orderLog/metrics.py
+
+Event throughput per hour or day, broken down by event_type and actor.
+Counting is done in the database (TruncHour / TruncDay + COUNT(*)) over
+the covering index orderlog_metrics_idx (timestamp, event_type, actor_id,
+including actor_name). Actors are reported with the actor_name snapshot,
+so deleted users keep their names.
+
+Results of closed buckets never change (OrderLog is append-only and
+timestamps are set on insert), so they are cached without expiry;
+only the currently open bucket is recomputed on every request.
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import OrderLog
+
+
+BUCKETS = {
+    'hour': (TruncHour, timedelta(hours=1)),
+    'day': (TruncDay, timedelta(days=1)),
+}
+DEFAULT_RANGE = {
+    'hour': timedelta(hours=24),
+    'day': timedelta(days=30),
+}
+MAX_BUCKETS = 1000
+
+
+def floor_bucket(value, bucket):
+    value = timezone.localtime(value, timezone.get_current_timezone())
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if bucket == 'day':
+        value = value.replace(hour=0)
+    return value
+
+
+def bucket_count(start, end, bucket):
+    """Number of buckets overlapping [start, end), computed without listing them."""
+    step = BUCKETS[bucket][1]
+    span = end - floor_bucket(start, bucket)
+    if span <= timedelta(0):
+        return 0
+    # Zaokrąglenie w górę (przesunięcia czasu letniego mogą zmienić wynik o jeden)
+    return -(-span // step)
+
+
+def bucket_starts(start, end, bucket):
+    """Starts of all buckets overlapping [start, end)."""
+    step = BUCKETS[bucket][1]
+    current = floor_bucket(start, bucket)
+    starts = []
+    while current < end:
+        starts.append(current)
+        current += step
+    return starts
+
+
+def _cache_key(bucket, start):
+    return f"order_log_metrics:v2:{bucket}:{start.isoformat()}"
+
+
+def _aggregate_queryset(start, end, bucket):
+    trunc = BUCKETS[bucket][0]
+    return (
+        OrderLog.objects
+        .filter(timestamp__gte=start, timestamp__lt=end)
+        .annotate(bucket=trunc('timestamp'))
+        .values('bucket', 'event_type', 'actor_id', 'actor_name')
+        # COUNT(*) - bez odczytu id, którego nie ma w indeksie
+        .annotate(count=Count('*'))
+        .order_by('bucket', 'event_type', 'actor_id', 'actor_name')
+    )
+
+
+def _aggregate(start, end, bucket):
+    """
+    Counts events in [start, end) grouped by bucket, event_type and actor.
+
+    Returns:
+        dict: {bucket_start: [row, ...]}
+    """
+    grouped = {}
+    for row in _aggregate_queryset(start, end, bucket):
+        grouped.setdefault(row['bucket'], []).append({
+            'event_type': row['event_type'],
+            'actor_id': row['actor_id'],
+            'actor_name': row['actor_name'],
+            'count': row['count'],
+        })
+    return grouped
+
+
+def event_metrics(start, end, bucket):
+    """
+    Event counts for every bucket overlapping [start, end).
+
+    Returns:
+        list[tuple]: (bucket_start, rows) pairs in chronological order
+    """
+    step = BUCKETS[bucket][1]
+    now = timezone.now()
+    starts = bucket_starts(start, end, bucket)
+
+    closed = [s for s in starts if s + step <= now]
+    results = cache.get_many([_cache_key(bucket, s) for s in closed])
+    by_start = {s: results[_cache_key(bucket, s)] for s in closed if _cache_key(bucket, s) in results}
+
+    missing = [s for s in closed if s not in by_start]
+    if missing:
+        computed = _aggregate(missing[0], missing[-1] + step, bucket)
+        fresh = {s: computed.get(s, []) for s in missing}
+        cache.set_many({_cache_key(bucket, s): rows for s, rows in fresh.items()}, timeout=None)
+        by_start.update(fresh)
+
+    # Otwarty (bieżący) przedział liczony zawsze od nowa
+    open_starts = [s for s in starts if s + step > now]
+    if open_starts:
+        computed = _aggregate(open_starts[0], open_starts[-1] + step, bucket)
+        by_start.update({s: computed.get(s, []) for s in open_starts})
+
+    return [(s, by_start[s]) for s in starts]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_remove_file_uploaded_file_file_order_and_more'),
+        ('orderLog', '0001_initial'),
+        ('orders', '0004_alter_order_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLogDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('status_change', 'Zmiana Statusu'), ('comment', 'Komentarz/Notatka'), ('file_added', 'Dodanie Pliku'), ('assignment', 'Przypisanie Osoby'), ('other', 'Inne')], max_length=50)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Dzienne Podsumowanie Dziennika',
+                'verbose_name_plural': 'Dzienne Podsumowania Dziennika',
+                'ordering': ['day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='orderlog',
+            index=models.Index(fields=['timestamp'], name='orderlog_timestamp_idx'),
+        ),
+        migrations.AddField(
+            model_name='orderlogdailyrollup',
+            name='actor',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_action_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='orderlogdailyrollup',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history_rollups', to='orders.order'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderlogdailyrollup',
+            constraint=models.UniqueConstraint(fields=('order', 'event_type', 'actor', 'day'), name='orderlog_rollup_unique_bucket'),
+        ),
+    ]
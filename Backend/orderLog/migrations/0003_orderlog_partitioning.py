@@ -0,0 +1,25 @@
+# Converts orderLog_orderlog to monthly range partitions on PostgreSQL.
+# On other databases (SQLite test runs) the plain table is kept.
+
+from django.db import migrations
+
+
+def forwards(apps, schema_editor):
+    from orderLog.partitions import convert_to_partitioned
+    convert_to_partitioned(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    from orderLog.partitions import convert_to_plain
+    convert_to_plain(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderLog', '0002_orderlogdailyrollup_orderlog_timestamp_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
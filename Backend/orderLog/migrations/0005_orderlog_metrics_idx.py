@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_remove_file_uploaded_file_file_order_and_more'),
+        ('orderLog', '0004_orderlog_feed_idx'),
+        ('orders', '0004_alter_order_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='orderlog',
+            name='orderlog_timestamp_idx',
+        ),
+        migrations.AddIndex(
+            model_name='orderlog',
+            index=models.Index(fields=['timestamp', 'event_type', 'actor'], name='orderlog_metrics_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:17
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+
+BATCH_SIZE = 2000
+
+
+def backfill_actor_name(apps, schema_editor):
+    """
+    Fills actor_name for existing rows in primary key batches,
+    one short transaction per batch.
+    """
+    OrderLog = apps.get_model('orderLog', 'OrderLog')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    max_length = OrderLog._meta.get_field('actor_name').max_length
+    db_alias = schema_editor.connection.alias
+
+    pending = OrderLog.objects.using(db_alias).filter(actor__isnull=False, actor_name='')
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db_alias):
+            batch = list(pending.filter(id__gt=last_id).order_by('id').only('id', 'actor_id')[:BATCH_SIZE])
+            if not batch:
+                break
+
+            users = User.objects.using(db_alias).filter(pk__in={log.actor_id for log in batch})
+            names = {
+                # Ta sama logika co actor_display_name() (get_full_name() or username)
+                user.pk: (f"{user.first_name} {user.last_name}".strip() or user.username)[:max_length]
+                for user in users.only('id', 'username', 'first_name', 'last_name')
+            }
+            for log in batch:
+                log.actor_name = names.get(log.actor_id, '')
+            OrderLog.objects.using(db_alias).bulk_update(batch, ['actor_name'])
+            last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    # Backfill w osobnych transakcjach (bez długich blokad całej tabeli)
+    atomic = False
+
+    dependencies = [
+        ('orderLog', '0005_orderlog_metrics_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderlog',
+            name='actor_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_actor_name, migrations.RunPython.noop),
+    ]
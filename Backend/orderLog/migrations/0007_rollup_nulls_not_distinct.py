@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_null_actor_buckets(apps, schema_editor):
+    """
+    Merges duplicate rollup rows of deleted actors (actor = NULL) into
+    one row per bucket, so the new constraint can be created.
+    """
+    OrderLogDailyRollup = apps.get_model('orderLog', 'OrderLogDailyRollup')
+    rollups = OrderLogDailyRollup.objects.using(schema_editor.connection.alias)
+
+    duplicates = (
+        rollups.filter(actor__isnull=True)
+        .values('order_id', 'event_type', 'day')
+        .annotate(rows=Count('id'), keep_id=Min('id'), total=Sum('count'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for bucket in duplicates:
+        same_bucket = rollups.filter(actor__isnull=True, order_id=bucket['order_id'],
+                                     event_type=bucket['event_type'], day=bucket['day'])
+        same_bucket.exclude(id=bucket['keep_id']).delete()
+        same_bucket.filter(id=bucket['keep_id']).update(count=bucket['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderLog', '0006_orderlog_actor_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_null_actor_buckets, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='orderlogdailyrollup',
+            name='orderlog_rollup_unique_bucket',
+        ),
+        migrations.AddConstraint(
+            model_name='orderlogdailyrollup',
+            constraint=models.UniqueConstraint(fields=('order', 'event_type', 'actor', 'day'), name='orderlog_rollup_unique_bucket', nulls_distinct=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderLog', '0007_rollup_nulls_not_distinct'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='orderlog',
+            name='orderlog_metrics_idx',
+        ),
+        migrations.AddIndex(
+            model_name='orderlog',
+            index=models.Index(fields=['timestamp', 'event_type', 'actor'], include=('actor_name',), name='orderlog_metrics_idx'),
+        ),
+    ]
@@ -3,6 +3,12 @@ from django.conf import settings
 from files.models import File
 
 
+def actor_display_name(user):
+    """Name shown in the order history for `user` (full name, falls back to username)."""
+    name = user.get_full_name() or user.username
+    return name[:OrderLog._meta.get_field('actor_name').max_length]
+
+
 class OrderLog(models.Model):
     EVENT_TYPES = [
         ('status_change', 'Zmiana Statusu'),
@@ -44,10 +50,67 @@ class OrderLog(models.Model):
     new_value = models.CharField(max_length=100, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    # Snapshot nazwy aktora z chwili zapisu - historia nie wymaga JOIN-a
+    # z użytkownikami i pozostaje poprawna po usunięciu użytkownika
+    actor_name = models.CharField(max_length=255, blank=True, default='')
+
     class Meta:
         verbose_name = "Dziennik Zlecenia"
         verbose_name_plural = "Dzienniki Zleceń"
         ordering = ['timestamp']
+        indexes = [
+            # Domyślne sortowanie, retencja (timestamp < cutoff) i metryki;
+            # event_type, actor i actor_name w indeksie pozwalają na index-only scan przy agregacji
+            models.Index(fields=['timestamp', 'event_type', 'actor'], include=['actor_name'],
+                         name='orderlog_metrics_idx'),
+            # Feed aktywności: skan zakresu po (timestamp, id) od najnowszych
+            models.Index(fields=['-timestamp', '-id'], name='orderlog_feed_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.actor_id and not self.actor_name:
+            self.actor_name = actor_display_name(self.actor)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"[{self.timestamp.strftime('%Y-%m-%d %H:%M')}] {self.order.title}: {self.get_event_type_display()}"
+
+
+class OrderLogDailyRollup(models.Model):
+    """
+    Dzienne podsumowanie zdarzeń usuniętych z OrderLog przez retencję
+    (liczba zdarzeń na zlecenie / typ zdarzenia / aktora / dzień).
+    """
+
+    order = models.ForeignKey(
+        'orders.Order',
+        on_delete=models.CASCADE,
+        related_name='history_rollups'
+    )
+
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='order_action_rollups'
+    )
+
+    event_type = models.CharField(max_length=50, choices=OrderLog.EVENT_TYPES)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Dzienne Podsumowanie Dziennika"
+        verbose_name_plural = "Dzienne Podsumowania Dziennika"
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['order', 'event_type', 'actor', 'day'],
+                name='orderlog_rollup_unique_bucket',
+                # Wiersze usuniętych aktorów (actor = NULL) też tworzą jeden kubełek
+                nulls_distinct=False,
+            ),
+        ]
 
     def __str__(self):
-        return f"[{self.timestamp.strftime('%Y-%m-%d %H:%M')}] {self.order.title}: {self.get_event_type_display()}"
\ No newline at end of file
+        return f"[{self.day}] {self.order_id}: {self.event_type} x{self.count}"
\ No newline at end of file
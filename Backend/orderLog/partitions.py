@@ -0,0 +1,256 @@
+"""
+orderLog/partitions.py
+
+PostgreSQL declarative range partitioning of the OrderLog table.
+The table is split into monthly partitions on `timestamp`
+(orderLog_orderlog_pYYYYMM) plus a DEFAULT partition, so retention
+becomes DETACH PARTITION instead of large DELETEs.
+
+On other databases (SQLite test runs) every helper is a no-op and the
+plain table is kept; use the prune_order_logs command there.
+"""
+
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection as default_connection, transaction
+from django.utils import timezone
+
+from .models import OrderLog
+
+
+TABLE = OrderLog._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_NAME_RE = re.compile(rf"^{re.escape(TABLE)}_p(\d{{4}})(\d{{2}})$")
+
+
+def _qn(name):
+    return '"%s"' % name
+
+
+def month_start(value):
+    """First instant (UTC) of the month containing `value`."""
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def supports_partitioning(connection=default_connection):
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(connection=default_connection):
+    if not supports_partitioning(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(connection=default_connection):
+    """
+    Returns {month_start: partition_name} for the monthly partitions
+    currently attached to the OrderLog table (DEFAULT is skipped).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [_qn(TABLE)],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)
+            partitions[month] = name
+    return partitions
+
+
+def _create_partition(cursor, month):
+    """
+    Creates the partition for `month`. Rows for that month that already
+    landed in the DEFAULT partition are moved into it before attaching,
+    otherwise ATTACH PARTITION would fail.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+
+    cursor.execute(
+        f"CREATE TABLE {_qn(name)} (LIKE {_qn(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    )
+    cursor.execute(
+        f"WITH moved AS ("
+        f"  DELETE FROM {_qn(DEFAULT_PARTITION)} WHERE timestamp >= %s AND timestamp < %s RETURNING *"
+        f") INSERT INTO {_qn(name)} SELECT * FROM moved",
+        [start, end],
+    )
+    cursor.execute(
+        f"ALTER TABLE {_qn(TABLE)} ATTACH PARTITION {_qn(name)} "
+        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    )
+    return name
+
+
+def ensure_partitions(months_ahead=3, since=None, connection=default_connection):
+    """
+    Makes sure monthly partitions exist from `since` (default: the current
+    month) up to `months_ahead` months in the future.
+
+    Returns:
+        list[str]: names of the newly created partitions
+    """
+    if not is_partitioned(connection):
+        return []
+
+    existing = list_partitions(connection)
+    month = month_start(since or timezone.now())
+    last = add_months(month_start(timezone.now()), months_ahead)
+
+    created = []
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        while month <= last:
+            if month not in existing:
+                created.append(_create_partition(cursor, month))
+            month = add_months(month, 1)
+    return created
+
+
+def detach_partitions(before, keep_event_types=(), drop=False, connection=default_connection):
+    """
+    Detaches every monthly partition that ends on or before `before`.
+
+    Events are first added to OrderLogDailyRollup; rows with an event type
+    from `keep_event_types` are copied back into the parent table (they
+    are routed to the DEFAULT partition) so they survive the detach.
+
+    Returns:
+        list[str]: names of the detached partitions
+    """
+    from .retention import rollup_logs
+
+    if not is_partitioned(connection):
+        return []
+
+    detached = []
+    for month, name in sorted(list_partitions(connection).items()):
+        end = add_months(month, 1)
+        if end > before:
+            continue
+
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            expired = OrderLog.objects.using(connection.alias).filter(timestamp__gte=month, timestamp__lt=end)
+            if keep_event_types:
+                expired = expired.exclude(event_type__in=keep_event_types)
+            rollup_logs(expired)
+
+            cursor.execute(f"ALTER TABLE {_qn(TABLE)} DETACH PARTITION {_qn(name)}")
+            if keep_event_types:
+                cursor.execute(
+                    f"INSERT INTO {_qn(TABLE)} SELECT * FROM {_qn(name)} WHERE event_type = ANY(%s)",
+                    [list(keep_event_types)],
+                )
+            if drop:
+                cursor.execute(f"DROP TABLE {_qn(name)}")
+        detached.append(name)
+    return detached
+
+
+# ---------------------------------------------------------------------
+# Table conversion (used by migration 0003)
+# ---------------------------------------------------------------------
+def _table_definition(cursor, table):
+    """Index and constraint definitions of `table` (primary key excluded)."""
+    cursor.execute(
+        "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "WHERE i.indrelid = %s::regclass AND NOT i.indisprimary "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid)",
+        [_qn(table)],
+    )
+    indexes = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('f', 'u', 'c')",
+        [_qn(table)],
+    )
+    constraints = cursor.fetchall()
+    return indexes, constraints
+
+
+def _rebuild_table(cursor, partitioned, months_ahead=3):
+    """
+    Recreates the OrderLog table as a partitioned (or plain) table and
+    copies all rows. Index, constraint and sequence names are preserved.
+    """
+    legacy = f"{TABLE}_legacy"
+    sequence = f"{TABLE}_id_seq"
+
+    indexes, constraints = _table_definition(cursor, TABLE)
+    cursor.execute(f"ALTER TABLE {_qn(TABLE)} RENAME TO {_qn(legacy)}")
+    cursor.execute(f"ALTER TABLE {_qn(legacy)} ALTER COLUMN id DROP IDENTITY IF EXISTS")
+    cursor.execute(f"ALTER TABLE {_qn(legacy)} ALTER COLUMN id DROP DEFAULT")
+    for name, _ in constraints:
+        cursor.execute(f"ALTER TABLE {_qn(legacy)} DROP CONSTRAINT {_qn(name)}")
+    for definition in indexes:
+        name = definition.split(' ON ')[0].split()[-1]
+        cursor.execute(f"DROP INDEX {name}")
+
+    clause = ' PARTITION BY RANGE ("timestamp")' if partitioned else ''
+    cursor.execute(
+        f"CREATE TABLE {_qn(TABLE)} (LIKE {_qn(legacy)} INCLUDING DEFAULTS){clause}"
+    )
+
+    if partitioned:
+        cursor.execute(f"SELECT min(timestamp) FROM {_qn(legacy)}")
+        oldest = cursor.fetchone()[0] or timezone.now()
+        cursor.execute(f"CREATE TABLE {_qn(DEFAULT_PARTITION)} PARTITION OF {_qn(TABLE)} DEFAULT")
+        month, last = month_start(oldest), add_months(month_start(timezone.now()), months_ahead)
+        while month <= last:
+            _create_partition(cursor, month)
+            month = add_months(month, 1)
+
+    cursor.execute(f"INSERT INTO {_qn(TABLE)} SELECT * FROM {_qn(legacy)}")
+    cursor.execute(f"DROP TABLE {_qn(legacy)} CASCADE")
+    cursor.execute(f"DROP SEQUENCE IF EXISTS {_qn(sequence)}")
+
+    # Klucz partycjonowania musi być częścią klucza głównego
+    primary_key = 'id, "timestamp"' if partitioned else 'id'
+    cursor.execute(f"ALTER TABLE {_qn(TABLE)} ADD CONSTRAINT {_qn(TABLE + '_pkey')} PRIMARY KEY ({primary_key})")
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in constraints:
+        cursor.execute(f"ALTER TABLE {_qn(TABLE)} ADD CONSTRAINT {_qn(name)} {definition}")
+
+    cursor.execute(f"CREATE SEQUENCE {_qn(sequence)} OWNED BY {_qn(TABLE)}.id")
+    cursor.execute(f"SELECT setval(%s::regclass, COALESCE((SELECT max(id) FROM {_qn(TABLE)}), 0) + 1, false)", [_qn(sequence)])
+    cursor.execute(f"ALTER TABLE {_qn(TABLE)} ALTER COLUMN id SET DEFAULT nextval('{_qn(sequence)}'::regclass)")
+
+
+def convert_to_partitioned(schema_editor):
+    if not supports_partitioning(schema_editor.connection) or is_partitioned(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        _rebuild_table(cursor, partitioned=True)
+
+
+def convert_to_plain(schema_editor):
+    if not is_partitioned(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        _rebuild_table(cursor, partitioned=False)
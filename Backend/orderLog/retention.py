@@ -0,0 +1,128 @@
+"""
+orderLog/retention.py
+
+Retention helpers for the append-only OrderLog table.
+Old events are folded into OrderLogDailyRollup (count per
+order / event_type / actor / day) and the raw rows are deleted
+in short, bounded transactions so no long locks are held.
+"""
+
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import OrderLog, OrderLogDailyRollup
+
+
+# Zdarzenia potrzebne do raportu końcowego PDF - domyślnie nie są usuwane
+PROTECTED_EVENT_TYPES = ('status_change',)
+
+
+def expired_logs(days, keep_event_types=PROTECTED_EVENT_TYPES):
+    """
+    Returns a queryset of OrderLog rows older than `days` days,
+    excluding the protected event types.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    queryset = OrderLog.objects.filter(timestamp__lt=cutoff)
+    if keep_event_types:
+        queryset = queryset.exclude(event_type__in=keep_event_types)
+    return queryset
+
+
+def rollup_logs(queryset):
+    """
+    Adds the events from `queryset` to the daily rollup table.
+    Must be called inside a transaction together with the delete
+    of the same rows, otherwise events could be counted twice.
+
+    Returns:
+        int: number of events added to the rollups
+    """
+    buckets = (
+        queryset
+        .annotate(day=TruncDate('timestamp'))
+        .values('order_id', 'event_type', 'actor_id', 'day')
+        .annotate(events=Count('id'))
+        .order_by()
+    )
+
+    total = 0
+    for bucket in buckets:
+        updated = OrderLogDailyRollup.objects.filter(
+            order_id=bucket['order_id'],
+            event_type=bucket['event_type'],
+            actor_id=bucket['actor_id'],
+            day=bucket['day'],
+        ).update(count=F('count') + bucket['events'])
+
+        if not updated:
+            OrderLogDailyRollup.objects.create(
+                order_id=bucket['order_id'],
+                event_type=bucket['event_type'],
+                actor_id=bucket['actor_id'],
+                day=bucket['day'],
+                count=bucket['events'],
+            )
+        total += bucket['events']
+    return total
+
+
+def merge_actor_rollups(actor_id):
+    """
+    Folds the rollups of an actor about to be deleted into the actor-less
+    (NULL) buckets. Called before the user row is deleted: SET_NULL on a
+    row whose bucket already has a NULL-actor row would violate the
+    unique constraint (NULLs are not distinct there).
+
+    Returns:
+        int: number of rollup rows merged into existing NULL buckets
+    """
+    merged = 0
+    rollups = OrderLogDailyRollup.objects.select_for_update().filter(actor_id=actor_id)
+    for rollup in rollups.only('id', 'order_id', 'event_type', 'day', 'count'):
+        updated = OrderLogDailyRollup.objects.filter(
+            order_id=rollup.order_id,
+            event_type=rollup.event_type,
+            actor__isnull=True,
+            day=rollup.day,
+        ).update(count=F('count') + rollup.count)
+        if updated:
+            rollup.delete()
+            merged += 1
+    # Pozostałe wiersze dostaną actor = NULL przez SET_NULL
+    return merged
+
+
+def rollup_and_delete(queryset, batch_size=1000, pause=0.0):
+    """
+    Rolls up and deletes the rows of `queryset` in batches of
+    `batch_size` primary keys, one short transaction per batch.
+
+    Args:
+        queryset (QuerySet): OrderLog rows to remove
+        batch_size (int): maximum number of rows per transaction
+        pause (float): seconds to sleep between batches
+
+    Returns:
+        int: number of deleted rows
+    """
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            batch = OrderLog.objects.filter(id__in=ids)
+            rollup_logs(batch)
+            count, _ = batch.delete()
+            deleted += count
+
+        if pause:
+            time.sleep(pause)
+    return deleted
@@ -22,6 +22,19 @@ class OrderLogSerializer(serializers.ModelSerializer):
         ]
 
     def get_actor_name(self, obj):
-        if obj.actor:
-            return obj.actor.username
-        return "System"
+        # Snapshot zapisany przy tworzeniu wpisu - bez odwołania do obj.actor
+        return obj.actor_name or "System"
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Klient nie widzi plików wewnętrznych (visible_to_clients=False) - także w historii
+        if self.context.get('client_view') and instance.file and not instance.file.visible_to_clients:
+            data['file'] = None
+        return data
+
+
+class OrderLogFeedSerializer(OrderLogSerializer):
+    order_title = serializers.CharField(source='order.title', read_only=True)
+
+    class Meta(OrderLogSerializer.Meta):
+        fields = OrderLogSerializer.Meta.fields + ['order', 'order_title']
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from files.models import File
+from .feed import invalidate_feed
+from .models import OrderLog
+from .retention import merge_actor_rollups
+
+
+@receiver(post_save, sender=OrderLog)
+def order_log_created(sender, instance, created, **kwargs):
+    """Invalidates the cached first pages of the activity feed."""
+    if created:
+        invalidate_feed()
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def actor_deleted(sender, instance, **kwargs):
+    """Merges the user's daily rollups into the actor-less buckets before SET_NULL."""
+    merge_actor_rollups(instance.pk)
+
+
+@receiver(post_save, sender=File)
+def file_visibility_changed(sender, instance, created, **kwargs):
+    """Cached feed pages embed files - a changed file (e.g. visibility) drops them."""
+    if not created:
+        invalidate_feed()
@@ -1,9 +1,20 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
+
+from django.db import IntegrityError, connection, transaction
+
 from django.test import TestCase
+from django.core.management import call_command
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.urls import reverse
-from .models import OrderLog
+from .models import OrderLog, OrderLogDailyRollup
+from . import metrics, partitions
 from .serializers import OrderLogSerializer
 from orders.models import Order
 from files.models import File
@@ -105,6 +116,28 @@ class OrderLogModelTest(TestCase):
         self.assertEqual(logs[1], log2)
 
 
+    def test_order_log_actor_name_snapshot(self):
+        """Test that the actor display name is stored on write"""
+        self.user.first_name = 'Jan'
+        self.user.last_name = 'Kowalski'
+        self.user.save()
+        log = OrderLog.objects.create(
+            order=self.order,
+            actor=self.user,
+            description='Named actor'
+        )
+        self.assertEqual(log.actor_name, 'Jan Kowalski')
+
+    def test_order_log_actor_name_survives_user_deletion(self):
+        """Test that history keeps the name after the user is deleted"""
+        other = User.objects.create_user(username='leaving', password='testpass123')
+        log = OrderLog.objects.create(order=self.order, actor=other, description='Bye')
+        other.delete()
+        log.refresh_from_db()
+        self.assertIsNone(log.actor)
+        self.assertEqual(OrderLogSerializer(log).data['actor_name'], 'leaving')
+
+
 class OrderLogSerializerTest(TestCase):
     """Tests for OrderLogSerializer"""
 
@@ -144,6 +177,14 @@ class OrderLogSerializerTest(TestCase):
         serializer = OrderLogSerializer(log)
         self.assertEqual(serializer.data['actor_name'], 'System')
 
+    def test_order_log_serializer_does_not_fetch_actor(self):
+        """Test that serializing history does not query users"""
+        OrderLog.objects.create(order=self.order, actor=self.user, description='A')
+        logs = list(OrderLog.objects.all())
+        with self.assertNumQueries(0):
+            data = OrderLogSerializer(logs, many=True).data
+        self.assertEqual(data[0]['actor_name'], 'testuser')
+
     def test_order_log_serializer_with_file(self):
         """Test entry serialization with file"""
         file = File.objects.create(
@@ -216,3 +257,358 @@ class OrderLogViewSetTest(APITestCase):
         self.assertEqual(response.data[1]['description'], 'Second log')
 
 
+class PruneOrderLogsCommandTest(TestCase):
+    """Tests for the prune_order_logs retention command"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.order = Order.objects.create(
+            title='Test Order',
+            description='Test Description',
+            client=self.user
+        )
+
+    def _log(self, event_type, days_ago):
+        log = OrderLog.objects.create(
+            order=self.order,
+            actor=self.user,
+            event_type=event_type,
+            description='Log'
+        )
+        OrderLog.objects.filter(pk=log.pk).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        return log
+
+    def test_old_events_are_rolled_up_and_deleted(self):
+        """Test that old events end up in the daily rollup"""
+        self._log('comment', 200)
+        self._log('comment', 200)
+        self._log('file_added', 200)
+        recent = self._log('comment', 1)
+
+        call_command('prune_order_logs', days=90, batch_size=2, stdout=StringIO())
+
+        self.assertEqual(list(OrderLog.objects.values_list('id', flat=True)), [recent.id])
+        rollups = {r.event_type: r.count for r in OrderLogDailyRollup.objects.all()}
+        self.assertEqual(rollups, {'comment': 2, 'file_added': 1})
+
+    def test_status_changes_are_kept_by_default(self):
+        """Test that status_change events stay for the final report"""
+        kept = self._log('status_change', 200)
+
+        call_command('prune_order_logs', days=90, stdout=StringIO())
+        self.assertTrue(OrderLog.objects.filter(pk=kept.pk).exists())
+
+        call_command('prune_order_logs', days=90, include_status_changes=True, stdout=StringIO())
+        self.assertFalse(OrderLog.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(OrderLogDailyRollup.objects.get().count, 1)
+
+    def test_deleted_actor_events_share_one_bucket(self):
+        """Test that rollups of deleted actors (actor = NULL) are not split into several rows"""
+        other = User.objects.create_user(username='byly', password='testpass123')
+        first = OrderLog.objects.create(order=self.order, actor=other, event_type='comment', description='Log')
+        timestamp = timezone.now() - timedelta(days=200)
+        OrderLog.objects.filter(pk=first.pk).update(timestamp=timestamp)
+        call_command('prune_order_logs', days=90, stdout=StringIO())
+        other.delete()
+
+        second = OrderLog.objects.create(order=self.order, actor=None, event_type='comment', description='Log')
+        OrderLog.objects.filter(pk=second.pk).update(timestamp=timestamp)
+        call_command('prune_order_logs', days=90, stdout=StringIO())
+
+        rollup = OrderLogDailyRollup.objects.get()
+        self.assertIsNone(rollup.actor_id)
+        self.assertEqual(rollup.count, 2)
+
+        if connection.features.supports_nulls_distinct_unique_constraints:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                OrderLogDailyRollup.objects.create(order=self.order, event_type='comment', day=rollup.day)
+
+    def test_deleting_actors_sharing_a_bucket(self):
+        """Test that deleted actors' rollups merge into one NULL bucket instead of colliding"""
+        actors = [User.objects.create_user(username=f'aktor{i}', password='testpass123') for i in range(2)]
+        timestamp = timezone.now() - timedelta(days=200)
+        for actor in actors + [None, actors[0]]:
+            log = OrderLog.objects.create(order=self.order, actor=actor, event_type='comment', description='Log')
+            OrderLog.objects.filter(pk=log.pk).update(timestamp=timestamp)
+        call_command('prune_order_logs', days=90, stdout=StringIO())
+        self.assertEqual(OrderLogDailyRollup.objects.count(), 3)
+
+        for actor in actors:
+            actor.delete()
+
+        rollup = OrderLogDailyRollup.objects.get()
+        self.assertIsNone(rollup.actor_id)
+        self.assertEqual(rollup.count, 4)
+
+    def test_dry_run_does_not_delete(self):
+        """Test dry run mode"""
+        self._log('comment', 200)
+        out = StringIO()
+        call_command('prune_order_logs', days=90, dry_run=True, stdout=out)
+        self.assertIn('1 log', out.getvalue())
+        self.assertEqual(OrderLog.objects.count(), 1)
+        self.assertFalse(OrderLogDailyRollup.objects.exists())
+
+
+class OrderLogPartitionsTest(TestCase):
+    """Tests for monthly OrderLog partitions (PostgreSQL only)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.order = Order.objects.create(
+            title='Test Order',
+            description='Test Description',
+            client=self.user
+        )
+
+    @skipIf(connection.vendor == 'postgresql', "plain table is only kept on other databases")
+    def test_plain_table_is_kept(self):
+        """Test that the command is a no-op without partitioning support"""
+        out = StringIO()
+        call_command('order_log_partitions', stdout=out)
+        self.assertFalse(partitions.is_partitioned())
+        self.assertIn('plain table', out.getvalue())
+
+    @skipUnless(connection.vendor == 'postgresql', "requires PostgreSQL")
+    def test_future_partitions_are_created(self):
+        """Test that partitions exist for the coming months"""
+        call_command('order_log_partitions', ahead=6, stdout=StringIO())
+        existing = partitions.list_partitions()
+        month = partitions.month_start(timezone.now())
+        for offset in range(7):
+            self.assertIn(partitions.add_months(month, offset), existing)
+
+    @skipUnless(connection.vendor == 'postgresql', "requires PostgreSQL")
+    def test_detach_keeps_status_changes(self):
+        """Test detaching an old partition with rollup of its events"""
+        old = partitions.add_months(partitions.month_start(timezone.now()), -14) + timedelta(days=3)
+        comment = OrderLog.objects.create(order=self.order, actor=self.user, event_type='comment', description='Old')
+        change = OrderLog.objects.create(order=self.order, actor=self.user, event_type='status_change', description='Old')
+        OrderLog.objects.filter(pk__in=[comment.pk, change.pk]).update(timestamp=old)
+
+        # Wiersze z DEFAULT trafiają do nowo utworzonej partycji
+        created = partitions.ensure_partitions(since=old)
+        self.assertIn(partitions.partition_name(partitions.month_start(old)), created)
+
+        call_command('order_log_partitions', detach_older_than=12, drop=True, stdout=StringIO())
+
+        self.assertFalse(OrderLog.objects.filter(pk=comment.pk).exists())
+        self.assertTrue(OrderLog.objects.filter(pk=change.pk).exists())
+        self.assertEqual(OrderLogDailyRollup.objects.get().event_type, 'comment')
+        self.assertNotIn(partitions.month_start(old), partitions.list_partitions())
+
+
+class OrderLogFeedTest(APITestCase):
+    """Tests for the activity feed endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='otherpass123'
+        )
+        self.manager_user = User.objects.create_user(
+            username='manager',
+            email='manager@example.com',
+            password='managerpass123'
+        )
+        self.manager_user.groups.set([Group.objects.get_or_create(name='manager')[0]])
+
+        self.order = Order.objects.create(title='Client Order', description='Desc', client=self.client_user)
+        self.other_order = Order.objects.create(title='Other Order', description='Desc', client=self.other_user)
+        for i in range(3):
+            OrderLog.objects.create(order=self.order, actor=self.client_user, description=f'Client log {i}')
+        OrderLog.objects.create(order=self.other_order, actor=self.other_user, description='Other log')
+        self.url = reverse('order-log-feed')
+
+    def test_feed_hides_internal_files_from_clients(self):
+        """Test that clients do not get files marked as not visible to clients"""
+        internal = File.objects.create(name='wewnetrzny', file_type='pdf', order=self.order,
+                                       uploaded_file_url='https://cdn.example.com/uploads/wewnetrzny.pdf')
+        public = File.objects.create(name='publiczny', file_type='pdf', order=self.order, visible_to_clients=True,
+                                     uploaded_file_url='https://cdn.example.com/uploads/publiczny.pdf')
+        for file_obj in (internal, public):
+            OrderLog.objects.create(order=self.order, actor=self.manager_user, event_type='file_added',
+                                    description='Plik', file=file_obj)
+
+        self.client.force_authenticate(user=self.client_user)
+        results = self.client.get(self.url).data['results']
+        files = [r['file'] for r in results if r['event_type'] == 'file_added']
+        self.assertEqual(files[1], None)
+        self.assertEqual(files[0]['name'], 'publiczny')
+        history = self.client.get(reverse('order-log-order-history', kwargs={'order_id': self.order.id})).data
+        self.assertNotIn('wewnetrzny.pdf', str(history))
+
+        # Zmiana widoczności unieważnia zapisaną w cache pierwszą stronę
+        internal.visible_to_clients = True
+        internal.save()
+        results = self.client.get(self.url).data['results']
+        self.assertEqual(sum(1 for r in results if r['file']), 2)
+
+        self.client.force_authenticate(user=self.manager_user)
+        results = self.client.get(self.url).data['results']
+        self.assertEqual(sum(1 for r in results if r['file']), 2)
+
+    def test_feed_as_manager(self):
+        """Test that a manager sees events of all orders, newest first"""
+        self.client.force_authenticate(user=self.manager_user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        descriptions = [log['description'] for log in response.data['results']]
+        self.assertEqual(descriptions, ['Other log', 'Client log 2', 'Client log 1', 'Client log 0'])
+        self.assertEqual(response.data['results'][0]['order_title'], 'Other Order')
+
+    def test_feed_as_client(self):
+        """Test that a client sees only their own orders"""
+        self.client.force_authenticate(user=self.client_user)
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertTrue(all(log['order'] == self.order.id for log in response.data['results']))
+
+    def test_feed_cursor_pagination(self):
+        """Test walking the feed page by page"""
+        self.client.force_authenticate(user=self.manager_user)
+        seen = []
+        url = f'{self.url}?limit=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [log['id'] for log in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, list(OrderLog.objects.order_by('-timestamp', '-id').values_list('id', flat=True)))
+
+    def test_feed_invalid_cursor(self):
+        """Test malformed cursor"""
+        self.client.force_authenticate(user=self.manager_user)
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_feed_first_page_invalidated_on_insert(self):
+        """Test that a new event appears despite the cached first page"""
+        self.client.force_authenticate(user=self.manager_user)
+        self.client.get(self.url)
+        OrderLog.objects.create(order=self.order, actor=self.client_user, description='Newest')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['description'], 'Newest')
+
+
+class OrderLogMetricsTest(APITestCase):
+    """Tests for the time-bucketed metrics endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.manager_user = User.objects.create_user(
+            username='manager',
+            email='manager@example.com',
+            password='managerpass123'
+        )
+        self.manager_user.groups.set([Group.objects.get_or_create(name='manager')[0]])
+        self.client_user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123'
+        )
+        self.order = Order.objects.create(title='Order', description='Desc', client=self.client_user)
+        self.url = reverse('order-log-metrics')
+
+    def _log(self, event_type, when, actor=None):
+        log = OrderLog.objects.create(order=self.order, actor=actor, event_type=event_type, description='Log')
+        OrderLog.objects.filter(pk=log.pk).update(timestamp=when)
+
+    def test_metrics_by_hour(self):
+        """Test hourly counts per event type and actor"""
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+        self._log('comment', hour + timedelta(minutes=5), self.client_user)
+        self._log('comment', hour + timedelta(minutes=50), self.client_user)
+        self._log('status_change', hour + timedelta(hours=1, minutes=1))
+
+        self.client.force_authenticate(user=self.manager_user)
+        response = self.client.get(self.url, {'bucket': 'hour', 'from': hour.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'bucket': hour.isoformat(), 'event_type': 'comment', 'actor_id': self.client_user.id,
+             'actor_name': 'client', 'count': 2},
+            {'bucket': (hour + timedelta(hours=1)).isoformat(), 'event_type': 'status_change', 'actor_id': None,
+             'actor_name': 'System', 'count': 1},
+        ])
+
+    def test_metrics_use_actor_name_snapshot(self):
+        """Test that deleted actors keep their names and full names are used"""
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+        leaving = User.objects.create_user(username='odchodzacy', password='testpass123',
+                                           first_name='Anna', last_name='Nowak')
+        self._log('comment', hour + timedelta(minutes=5), leaving)
+        leaving.delete()
+
+        self.client.force_authenticate(user=self.manager_user)
+        results = self.client.get(self.url, {'bucket': 'hour', 'from': hour.isoformat()}).data['results']
+        self.assertEqual([(r['actor_id'], r['actor_name'], r['count']) for r in results], [(None, 'Anna Nowak', 1)])
+
+    @skipUnless(connection.vendor == 'postgresql', "Index-only scan is checked on PostgreSQL")
+    def test_metrics_query_is_index_only(self):
+        """Test that the aggregation does not need the table rows (COUNT(*), actor_name in the index)"""
+        start = timezone.now() - timedelta(days=1)
+        queryset = metrics._aggregate_queryset(start, timezone.now(), 'hour')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+        plan = queryset.explain()
+        self.assertIn('Index Only Scan', plan)
+
+    def test_closed_buckets_are_cached(self):
+        """Test that closed buckets come from the cache and the open one is recomputed"""
+        day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=2)
+        self._log('comment', day + timedelta(hours=1))
+        self.client.force_authenticate(user=self.manager_user)
+        params = {'bucket': 'day', 'from': day.isoformat()}
+        self.client.get(self.url, params)
+
+        # Zdarzenie dopisane do zamkniętego przedziału nie jest widoczne (cache),
+        # nowe zdarzenie w bieżącym dniu - jest
+        self._log('comment', day + timedelta(hours=2))
+        OrderLog.objects.create(order=self.order, event_type='comment', description='Now')
+        results = self.client.get(self.url, params).data['results']
+        self.assertEqual([r['count'] for r in results], [1, 1])
+
+    def test_metrics_forbidden_for_client(self):
+        """Test that only managers can read metrics"""
+        self.client.force_authenticate(user=self.client_user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_metrics_invalid_bucket(self):
+        """Test validation of the bucket parameter"""
+        self.client.force_authenticate(user=self.manager_user)
+        response = self.client.get(self.url, {'bucket': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_metrics_range_too_large(self):
+        """Test that a huge range is rejected without listing its buckets"""
+        self.client.force_authenticate(user=self.manager_user)
+        params = {'bucket': 'hour', 'from': '1000-01-01T00:00:00+00:00', 'to': '9000-01-01T00:00:00+00:00'}
+        with mock.patch('orderLog.metrics.bucket_starts') as bucket_starts:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Zbyt duży zakres', response.data['detail'])
+        bucket_starts.assert_not_called()
+
+        start = timezone.now().replace(minute=30) - timedelta(days=3)
+        for end in (start + timedelta(hours=5), start + timedelta(hours=5, minutes=30), start):
+            self.assertEqual(metrics.bucket_count(start, end, 'hour'),
+                             len(metrics.bucket_starts(start, end, 'hour')))
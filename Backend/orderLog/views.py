@@ -1,10 +1,31 @@
-from rest_framework import viewsets
+from datetime import datetime, time
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
+from . import feed, metrics
 from .models import OrderLog
-from .serializers import OrderLogSerializer
+from .serializers import OrderLogFeedSerializer, OrderLogSerializer
+
+
+def _parse_moment(value):
+    """Parses an ISO date or datetime query parameter (naive values are in the current timezone)."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
 
 class OrderLogViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = OrderLog.objects.all().order_by("timestamp")
@@ -18,6 +39,108 @@ class OrderLogViewSet(viewsets.ReadOnlyModelViewSet):
             Oczekiwany URL: /order-log/order-history/<order_id>/
             """
             # Sprawdzamy czy order_id jest liczbą (dzięki \d+)
-            logs = OrderLog.objects.filter(order_id=order_id).order_by("timestamp")
-            serializer = OrderLogSerializer(logs, many=True)
+            logs = (
+                OrderLog.objects.filter(order_id=order_id)
+                .select_related("file__uploaded_by")
+                .order_by("timestamp")
+            )
+            serializer = OrderLogSerializer(logs, many=True,
+                                            context={"client_view": feed.user_role(request.user) == "client"})
             return Response(serializer.data)
+
+        @action(detail=False, methods=["get"], url_path="feed")
+        def feed(self, request):
+            """
+            Oczekiwany URL: /order-log/feed/?cursor=<cursor>&limit=<n>
+            Zdarzenia ze wszystkich zleceń widocznych dla użytkownika, od najnowszych.
+            """
+            cursor = request.query_params.get("cursor")
+            try:
+                limit = int(request.query_params.get("limit", feed.FEED_PAGE_SIZE))
+            except ValueError:
+                return Response({"limit": "Nieprawidłowa wartość."}, status=status.HTTP_400_BAD_REQUEST)
+            limit = max(1, min(limit, feed.FEED_MAX_PAGE_SIZE))
+
+            role = feed.user_role(request.user)
+
+            # Pierwsza strona jest cache'owana per rola (unieważniana przy nowym wpisie)
+            cache_key = None
+            if cursor is None and limit == feed.FEED_PAGE_SIZE:
+                cache_key = feed.first_page_cache_key(request.user, role)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return Response(cached)
+
+            queryset = feed.feed_queryset(request.user, role)
+            if cursor:
+                try:
+                    queryset = feed.after_cursor(queryset, cursor)
+                except ValueError:
+                    return Response({"cursor": "Nieprawidłowy kursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+            logs = list(queryset[:limit + 1])
+            has_next = len(logs) > limit
+            logs = logs[:limit]
+
+            next_url = None
+            if has_next:
+                next_url = replace_query_param(
+                    request.build_absolute_uri(), "cursor", feed.encode_cursor(logs[-1])
+                )
+
+            data = {
+                "next": next_url,
+                "results": OrderLogFeedSerializer(logs, many=True, context={"client_view": role == "client"}).data,
+            }
+            if cache_key:
+                cache.set(cache_key, data, feed.FEED_CACHE_TIMEOUT)
+            return Response(data)
+
+        @action(detail=False, methods=["get"], url_path="metrics")
+        def metrics(self, request):
+            """
+            Oczekiwany URL: /order-log/metrics/?bucket=hour|day&from=<iso>&to=<iso>
+            Liczba zdarzeń w przedziałach czasu wg event_type i aktora (tylko manager).
+            """
+            if feed.user_role(request.user) != "manager":
+                return Response({"detail": "Tylko managerowie mają dostęp do metryk."},
+                                status=status.HTTP_403_FORBIDDEN)
+
+            bucket = request.query_params.get("bucket", "hour")
+            if bucket not in metrics.BUCKETS:
+                return Response({"bucket": "Dozwolone wartości: hour, day."}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                end = _parse_moment(request.query_params["to"]) if "to" in request.query_params else timezone.now()
+                start = (_parse_moment(request.query_params["from"]) if "from" in request.query_params
+                         else end - metrics.DEFAULT_RANGE[bucket])
+            except ValueError:
+                return Response({"detail": "Nieprawidłowy format daty (ISO 8601)."}, status=status.HTTP_400_BAD_REQUEST)
+
+            if start >= end:
+                return Response({"detail": "Parametr from musi być wcześniejszy niż to."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if metrics.bucket_count(start, end, bucket) > metrics.MAX_BUCKETS:
+                return Response({"detail": f"Zbyt duży zakres (maks. {metrics.MAX_BUCKETS} przedziałów)."},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            buckets = metrics.event_metrics(start, end, bucket)
+
+            results = [
+                {
+                    "bucket": bucket_start.isoformat(),
+                    "event_type": row["event_type"],
+                    "actor_id": row["actor_id"],
+                    # Snapshot nazwy z wpisu - także dla usuniętych użytkowników
+                    "actor_name": row["actor_name"] or "System",
+                    "count": row["count"],
+                }
+                for bucket_start, rows in buckets
+                for row in rows
+            ]
+            return Response({
+                "bucket": bucket,
+                "from": metrics.floor_bucket(start, bucket).isoformat(),
+                "to": end.isoformat(),
+                "results": results,
+            })